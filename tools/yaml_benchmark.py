@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Compare the pure Python and libyaml backends of yaml_serialization
+
+Every YAML file of a tripleo-heat-templates tree (the installed one by
+default) is loaded and dumped again with both backends, which is about
+what a deployment does with its templates and environments:
+
+    python tools/yaml_benchmark.py [--repeat N] [templates directory]
+
+The jinja2 templates (*.j2.yaml) aren't YAML until rendered, so they are
+skipped.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+import yaml
+
+from tripleoclient import constants
+from tripleoclient import template_render
+from tripleoclient import yaml_serialization
+
+
+def _read_templates(directory):
+    contents = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if (filename.endswith('.yaml') and
+                    not filename.endswith(template_render.J2_SUFFIX)):
+                with open(os.path.join(dirpath, filename)) as f:
+                    contents.append(f.read())
+    return contents
+
+
+def _run(contents, loader, dumper, repeat):
+    load_time = dump_time = 0.0
+    for i in range(repeat):
+        start = time.time()
+        data = [yaml_serialization.safe_load(c, loader=loader)
+                for c in contents]
+        load_time += time.time() - start
+        start = time.time()
+        for d in data:
+            yaml_serialization.safe_dump(d, dumper=dumper,
+                                         default_flow_style=False)
+        dump_time += time.time() - start
+    return load_time / repeat, dump_time / repeat
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('templates', nargs='?',
+                        default=constants.TRIPLEO_HEAT_TEMPLATES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    contents = _read_templates(args.templates)
+    if not contents:
+        print("No YAML files found in %s" % args.templates, file=sys.stderr)
+        return 1
+    print("%d files, %d bytes, average of %d runs" % (
+        len(contents), sum(len(c) for c in contents), args.repeat))
+
+    backends = [('python', yaml.SafeLoader, yaml.SafeDumper)]
+    if yaml_serialization.LIBYAML:
+        backends.append(('libyaml', yaml.CSafeLoader, yaml.CSafeDumper))
+    else:
+        print("PyYAML was built without libyaml", file=sys.stderr)
+
+    results = {}
+    for name, loader, dumper in backends:
+        results[name] = _run(contents, loader, dumper, args.repeat)
+        print("%-8s load %7.3fs  dump %7.3fs" % ((name,) + results[name]))
+
+    if len(results) == 2:
+        print("libyaml is %.1fx faster to load, %.1fx faster to dump" % (
+            results['python'][0] / results['libyaml'][0],
+            results['python'][1] / results['libyaml'][1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
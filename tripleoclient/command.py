@@ -12,17 +12,48 @@
 #   License for the specific language governing permissions and limitations
 #   under the License.
 
-from osc_lib.command import command
+from __future__ import print_function
+
+import sys
+import time
 
+from osc_lib.command import command
+from osc_lib.i18n import _
 
+from tripleoclient import constants
+from tripleoclient import tracing
 from tripleoclient import utils
 
 
 class Command(command.Command):
 
+    def get_parser(self, prog_name):
+        parser = super(Command, self).get_parser(prog_name)
+        parser.add_argument(
+            '--trace-file', metavar='<file>',
+            help=_('Write the timings of the workflows and actions run by '
+                   'the command to this file, as JSON lines.')
+        )
+        return parser
+
     def run(self, parsed_args):
         utils.store_cli_param(self.cmd_name, parsed_args)
-        super(Command, self).run(parsed_args)
+        tracer = tracing.reset()
+        started = time.time()
+        try:
+            super(Command, self).run(parsed_args)
+        finally:
+            trace_file = getattr(parsed_args, 'trace_file', None)
+            if trace_file:
+                try:
+                    tracer.write(trace_file)
+                except (IOError, OSError) as e:
+                    self.log.warning("Unable to write the trace file %s: %s"
+                                     % (trace_file, e))
+            # Not on stdout, which is parsed with e.g. -f json
+            if (tracer.spans and time.time() - started >=
+                    constants.TRACE_SUMMARY_DURATION):
+                print(tracer.summary_table(), file=sys.stderr)
 
 
 class Lister(Command, command.Lister):
@@ -0,0 +1,225 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Environment files resolved once and stored for the following deploys"""
+
+import hashlib
+import json
+import logging
+import os
+
+import six
+
+from tripleoclient import environment_index
+from tripleoclient import exceptions
+from tripleoclient import utils
+
+LOG = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+_FILE_PREFIX = 'file://'
+
+
+def _digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _content_hash(environment, files):
+    data = json.dumps({'environment': environment, 'files': files},
+                      sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _relative_to(path, root):
+    if path.startswith(root + '/'):
+        return os.path.relpath(path, root)
+    return None
+
+
+def _relocate(value, old, new):
+    if isinstance(value, dict):
+        return dict((_relocate(k, old, new), _relocate(v, old, new))
+                    for k, v in value.items())
+    if isinstance(value, list):
+        return [_relocate(v, old, new) for v in value]
+    if isinstance(value, six.string_types):
+        return value.replace(old, new)
+    return value
+
+
+class CompiledEnvironment(object):
+    """The merged environment and files map of a list of environments
+
+    inputs holds the SHA-256 of every file the result was built from: the
+    environment files and the files they reference. The paths inside the
+    templates directory are relative to it, so that the result can be
+    used with any copy of the templates, e.g. the temporary tree of a
+    deployment. The links in environment and files point into the
+    templates directory the environments were compiled with,
+    templates_url.
+
+    environment_files are the environment files given explicitly, which
+    come after the ones of environment_directories. directories holds the
+    hash of the directories which were scanned, see
+    environment_index.DirectoryIndex.directory_hash.
+    """
+
+    def __init__(self, environment_files, environment, files, inputs,
+                 templates_url, content_hash=None,
+                 environment_directories=None, directories=None):
+        self.environment_files = list(environment_files)
+        self.environment_directories = list(environment_directories or [])
+        self.directories = directories or {}
+        self.environment = environment
+        self.files = files
+        self.inputs = inputs
+        self.templates_url = templates_url
+        self.hash = content_hash or _content_hash(environment, files)
+
+    def changed_inputs(self, tht_root):
+        """Return the inputs which changed since the compilation"""
+
+        changed = []
+        for name, digest in sorted(self.inputs.items()):
+            path = os.path.join(tht_root, name)
+            try:
+                if _digest(path) == digest:
+                    continue
+            except (IOError, OSError):
+                pass
+            changed.append(name)
+
+        # A file added to or removed from an environment directory
+        index = environment_index.get_index()
+        for directory, digest in sorted(self.directories.items()):
+            try:
+                if index.directory_hash(directory) == digest:
+                    continue
+            except OSError:
+                pass
+            changed.append(directory)
+        index.save()
+        return changed
+
+    def all_environment_files(self):
+        """Return the environment files to process, in order
+
+        The environment directories are scanned again.
+        """
+
+        return (utils.load_environment_directories(
+            list(self.environment_directories)) + self.environment_files)
+
+    def relocate(self, tht_root):
+        """Return the files and environment, linking into tht_root
+
+        :returns: a tuple of the files map and the environment
+        """
+
+        new_url = '%s%s/' % (_FILE_PREFIX, os.path.normpath(tht_root))
+        return (_relocate(self.files, self.templates_url, new_url),
+                _relocate(self.environment, self.templates_url, new_url))
+
+    def to_dict(self):
+        return {
+            'version': FORMAT_VERSION,
+            'environment_files': self.environment_files,
+            'environment_directories': self.environment_directories,
+            'directories': self.directories,
+            'environment': self.environment,
+            'files': self.files,
+            'inputs': self.inputs,
+            'templates_url': self.templates_url,
+            'hash': self.hash,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        """Read a compiled environment
+
+        :raises: InvalidConfiguration if it can't be read or its contents
+                 don't match its hash
+        """
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            raise exceptions.InvalidConfiguration(
+                "Unable to read compiled environment %s: %s" % (path, e))
+        if data.get('version') != FORMAT_VERSION:
+            raise exceptions.InvalidConfiguration(
+                "Compiled environment %s has an unsupported version %s, "
+                "compile it again" % (path, data.get('version')))
+        compiled = cls(data['environment_files'], data['environment'],
+                       data['files'], data['inputs'], data['templates_url'],
+                       environment_directories=data.get(
+                           'environment_directories'),
+                       directories=data.get('directories'))
+        if compiled.hash != data.get('hash'):
+            raise exceptions.InvalidConfiguration(
+                "Compiled environment %s doesn't match its hash, compile it "
+                "again" % path)
+        return compiled
+
+
+def compile_environments(environment_files, tht_root, user_tht_root,
+                         environment_directories=()):
+    """Process and merge environment files into a CompiledEnvironment
+
+    The files of environment_directories come first, then
+    environment_files. tht_root and user_tht_root are the arguments of
+    utils.process_multiple_environments.
+    """
+
+    tht_root = os.path.normpath(tht_root)
+    user_tht_root = os.path.normpath(user_tht_root)
+    # load_environment_directories adds TRIPLEO_ENVIRONMENT_DIRECTORY
+    scanned = list(environment_directories)
+    all_files = (utils.load_environment_directories(scanned) +
+                 list(environment_files))
+    env_files, env = utils.process_multiple_environments(
+        all_files, tht_root, user_tht_root)
+
+    index = environment_index.get_index()
+    directories = dict((os.path.realpath(d), index.directory_hash(d))
+                       for d in scanned if os.path.exists(d) and d != '.')
+    index.save()
+
+    inputs = {}
+    paths = [os.path.abspath(p) for p in all_files]
+    paths.extend(name[len(_FILE_PREFIX):] for name in env_files
+                 if name.startswith(_FILE_PREFIX))
+    for path in paths:
+        # The environments of the user templates directory are read from
+        # the copy in tht_root, like process_multiple_environments does
+        name = (_relative_to(path, tht_root) or
+                _relative_to(path, user_tht_root) or path)
+        inputs[name] = _digest(os.path.join(tht_root, name))
+
+    return CompiledEnvironment(
+        [os.path.abspath(p) for p in environment_files], env, env_files,
+        inputs, '%s%s/' % (_FILE_PREFIX, tht_root),
+        environment_directories=environment_directories,
+        directories=directories)
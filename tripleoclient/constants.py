@@ -33,6 +33,49 @@ USER_PARAMETERS = 'user-environments/tripleoclient-parameters.yaml'
 DEFAULT_ENV_DIRECTORY = os.path.join(os.environ.get('HOME'),
                                      '.tripleo', 'environments')
 
+# Index of the files found in the environment directories
+ENVIRONMENT_INDEX_FILE = os.path.join('~', '.tripleo',
+                                      'environment-index.json')
+
+# Local cache of the objects read from the plan containers, and its
+# maximum size in bytes
+PLAN_CACHE_DIRECTORY = os.path.join('~', '.tripleo', 'plan-cache')
+PLAN_CACHE_SIZE = 256 * 1024 * 1024
+
+# Where the graph of the files referenced by the templates of each stack
+# is stored by the deploy commands
+TEMPLATE_GRAPH_DIRECTORY = os.path.join('~', '.tripleo', 'template-graphs')
+
+# Number of environment files processed at the same time by a deploy
+ENVIRONMENT_WORKERS = 8
+
+# Cache of the templates rendered by the undercloud deploy, the number of
+# seconds its entries are kept after they were last used, and the number of
+# templates rendered at the same time
+RENDER_CACHE_DIRECTORY = os.path.join('~', '.tripleo', 'render-cache')
+RENDER_CACHE_MAX_AGE = 30 * 24 * 3600
+RENDER_WORKERS = 8
+
+# Seconds without messages from a workflow before its execution is looked
+# up on Mistral, the first interval at which an execution is polled when
+# the websocket is unavailable, and the maximum interval of both, which
+# double while the execution runs
+WEBSOCKET_QUIET_TIMEOUT = 10
+WORKFLOW_POLL_INTERVAL = 2
+WORKFLOW_POLL_MAX_INTERVAL = 60
+
+# Seconds the last message of an execution found finished on Mistral is
+# still waited for, while the websocket is connected
+WEBSOCKET_DRAIN_TIMEOUT = 5
+
+# Number of workflows run at the same time by the commands which run
+# independent workflows
+WORKFLOW_WORKERS = 4
+
+# Commands running for longer than this number of seconds print the timings
+# of the workflows they ran
+TRACE_SUMMARY_DURATION = 60
+
 TRIPLEO_PUPPET_MODULES = "/usr/share/openstack-puppet/modules/"
 UPGRADE_CONVERGE_FILE = "major-upgrade-converge-docker.yaml"
 PUPPET_MODULES = "/etc/puppet/modules/"
@@ -50,3 +93,15 @@ MAJOR_UPGRADE_PLAYBOOKS = ["upgrade_steps_playbook.yaml",
                            "deploy_steps_playbook.yaml",
                            "post_upgrade_steps_playbook.yaml"]
 MAJOR_UPGRADE_SKIP_TAGS = ['validation', 'pre-upgrade']
+
+# Number of concurrent workers used to transfer objects to and from Swift,
+# and how often (and after what initial delay in seconds) a failed
+# transfer is retried.
+SWIFT_WORKERS = 8
+SWIFT_RETRIES = 3
+SWIFT_RETRY_BACKOFF = 0.5
+
+# Size of the chunks downloads are written to disk with, and how often an
+# interrupted download is resumed.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 3
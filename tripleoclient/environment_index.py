@@ -0,0 +1,164 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Index of the environment files found in environment directories"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+from tripleoclient import constants
+
+LOG = logging.getLogger(__name__)
+
+# Changes made within this many nanoseconds of a modification time may not
+# change it on filesystems with a coarse resolution, such recent times are
+# not trusted.
+_RACY_WINDOW = 2 * 10 ** 9
+
+
+def _trusted(mtime):
+    return time.time() * 1e9 - mtime > _RACY_WINDOW
+
+
+def _mtime(st):
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return mtime
+
+
+def _digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class DirectoryIndex(object):
+    """Names, modification times, sizes and checksums of environment files
+
+    A directory is only listed again when its own modification time
+    changed, which happens whenever a file is added, removed or renamed in
+    it. A file is only read again when its modification time or size
+    changed. The index is stored in a JSON file, shared by the following
+    commands.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(
+            path or constants.ENVIRONMENT_INDEX_FILE)
+        self._directories = None
+        self._changed = False
+
+    @property
+    def directories(self):
+        if self._directories is None:
+            try:
+                with open(self.path) as f:
+                    self._directories = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._directories = {}
+        return self._directories
+
+    def _scan(self, directory, mtime):
+        LOG.debug("Scanning environment directory %s" % directory)
+        old = dict((f['name'], f) for f in
+                   self.directories.get(directory, {}).get('files', []))
+        files = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.yaml'))):
+            if os.path.isfile(path):
+                name = os.path.basename(path)
+                files.append(old.get(name, {'name': name}))
+        entry = {'mtime': mtime if _trusted(mtime) else None, 'files': files}
+        self.directories[directory] = entry
+        self._changed = True
+        return entry
+
+    def _entry(self, directory):
+        directory = os.path.realpath(directory)
+        mtime = _mtime(os.stat(directory))
+        entry = self.directories.get(directory)
+        if entry is None or entry['mtime'] != mtime:
+            entry = self._scan(directory, mtime)
+        return directory, entry
+
+    def list_directory(self, directory):
+        """Return the paths of the environment files of a directory
+
+        These are the *.yaml files, in ascending sort order. Files removed
+        since the directory was listed, or links which are now broken, are
+        left out.
+        """
+
+        realpath, entry = self._entry(directory)
+        paths = [os.path.join(directory, f['name']) for f in entry['files']]
+        return [path for path in paths if os.path.isfile(path)]
+
+    def directory_hash(self, directory):
+        """Return a checksum of the names and contents of the environments"""
+
+        realpath, entry = self._entry(directory)
+        sha = hashlib.sha256()
+        for f in entry['files']:
+            path = os.path.join(realpath, f['name'])
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Removed since the directory was listed
+                entry['mtime'] = None
+                return self.directory_hash(directory)
+            if (f.get('mtime') != _mtime(st) or
+                    f.get('size') != st.st_size or 'sha256' not in f):
+                mtime = _mtime(st)
+                f.update(mtime=mtime if _trusted(mtime) else None,
+                         size=st.st_size, sha256=_digest(path))
+                self._changed = True
+            sha.update(('%s\0%s\0' % (f['name'], f['sha256'])).encode(
+                'utf-8'))
+        return sha.hexdigest()
+
+    def save(self):
+        """Store the index if it changed, failing silently"""
+
+        if not self._changed:
+            return
+        tmp = '%s.tmp-%d' % (self.path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path), 0o700)
+            with open(tmp, 'w') as f:
+                json.dump(self.directories, f)
+            os.rename(tmp, self.path)
+            self._changed = False
+        except (IOError, OSError) as e:
+            LOG.debug("Unable to store the environment index: %s" % e)
+
+
+_index = None
+
+
+def get_index():
+    """Return the index shared by the whole process"""
+
+    global _index
+    path = os.path.expanduser(constants.ENVIRONMENT_INDEX_FILE)
+    if _index is None or _index.path != path:
+        _index = DirectoryIndex(path)
+    return _index
@@ -28,6 +28,10 @@ class WebSocketTimeout(Exception):
     """Timed out waiting for messages on the websocket"""
 
 
+class WebSocketConnectionError(Exception):
+    """The connection to the websocket was lost"""
+
+
 class NotFound(Exception):
     """Resource not found"""
 
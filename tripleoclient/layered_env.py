@@ -0,0 +1,146 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Heat environments merged lazily from layers"""
+
+try:
+    from collections import abc as collections_abc
+except ImportError:  # Python 2
+    import collections as collections_abc
+
+
+def _resolve(entries):
+    """Merge the values a key has in several layers
+
+    entries are (layer name, value) tuples, from the lowest layer to the
+    highest one. The values are merged the way successive calls to
+    heatclient's template_utils.deep_update would merge them: mappings are
+    merged, any other value replaces what the lower layers have, except
+    None which doesn't replace a mapping.
+
+    :returns: the name of the highest layer the value comes from, and the
+              value, an _Overlay for mappings
+    """
+
+    mappings = []
+    name = value = None
+    for layer, layer_value in entries:
+        if isinstance(layer_value, collections_abc.Mapping):
+            if not mappings:
+                # A mapping replaces any other value
+                name = value = None
+            mappings.append((layer, layer_value))
+        elif layer_value is None and mappings:
+            continue
+        else:
+            mappings = []
+            name, value = layer, layer_value
+    if mappings:
+        return mappings[-1][0], _Overlay(mappings)
+    return name, value
+
+
+class _Overlay(collections_abc.Mapping):
+    """Read only view of mappings merged together"""
+
+    def __init__(self, layers):
+        self._layers = layers
+
+    def _entries(self, key):
+        return [(name, layer[key]) for name, layer in self._layers
+                if key in layer]
+
+    def _lookup(self, key):
+        entries = self._entries(key)
+        if not entries:
+            raise KeyError(key)
+        return _resolve(entries)
+
+    def __getitem__(self, key):
+        return self._lookup(key)[1]
+
+    def __iter__(self):
+        seen = set()
+        for name, layer in self._layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def origin(self, *path):
+        """Return the name of the layer which supplied a value
+
+        For a mapping, this is the highest layer contributing to it.
+
+        :raises: KeyError if there is no value at path
+        """
+
+        overlay = self
+        for key in path[:-1]:
+            overlay = overlay[key]
+            if not isinstance(overlay, _Overlay):
+                raise KeyError(key)
+        return overlay._lookup(path[-1])[0]
+
+    def to_dict(self):
+        """Return the merged mappings as new, plain dicts"""
+
+        result = {}
+        for key in self:
+            value = self[key]
+            if isinstance(value, _Overlay):
+                value = value.to_dict()
+            result[key] = value
+        return result
+
+
+class LayeredEnvironment(_Overlay):
+    """A heat environment made of several environments, merged lazily
+
+    Rather than being merged into a single dict with deep_update as soon as
+    they are available, the environments are kept as layers. A key is only
+    resolved when it is read, and the plain dict to send to Heat is built
+    once, by to_dict(). The result is the same as calling deep_update with
+    every layer in turn.
+
+    Each layer has a name (e.g. the path of an environment file), which
+    origin() and parameter_sources() report for the values.
+    """
+
+    def __init__(self):
+        super(LayeredEnvironment, self).__init__([])
+
+    def add_layer(self, name, environment):
+        """Add an environment on top of the current layers"""
+
+        if environment is not None:
+            self._layers.append((name, environment))
+
+    @property
+    def layer_names(self):
+        return [name for name, layer in self._layers]
+
+    def parameter_sources(self):
+        """Return the name of the layer which set each parameter"""
+
+        if 'parameter_defaults' not in self:
+            return {}
+        parameters = self['parameter_defaults']
+        if not isinstance(parameters, _Overlay):
+            return {}
+        return dict((key, parameters.origin(key)) for key in parameters)
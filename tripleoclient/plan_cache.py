@@ -0,0 +1,193 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Local cache of the objects stored in plan containers"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import six
+
+from tripleoclient import constants
+
+LOG = logging.getLogger(__name__)
+
+# Only plain objects, whose ETag is the MD5 checksum of their contents, are
+# cached. Anything else (e.g. the quoted ETags of large object manifests) is
+# always fetched from Swift.
+_ETAG_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_TMP_PREFIX = '.tmp-'
+
+
+def _is_cacheable(etag):
+    return isinstance(etag, six.string_types) and bool(_ETAG_RE.match(etag))
+
+
+class PlanCache(object):
+    """Cache of plan container objects keyed by container name and ETag
+
+    Objects are stored under <path>/<container>/<etag>. As the ETag of a
+    plan object is the MD5 checksum of its contents, an entry never needs
+    to be invalidated, knowing the current ETag of an object (from a HEAD
+    request or a container listing) is enough to decide whether the cached
+    copy can be used. The total size of the cache is bounded, the least
+    recently used entries are evicted first.
+
+    When the cache is disabled every read goes straight to Swift.
+    """
+
+    def __init__(self, swift_client, path=None, max_size=None, enabled=True):
+        self._swift_client = swift_client
+        self.path = os.path.expanduser(path or constants.PLAN_CACHE_DIRECTORY)
+        self.max_size = (constants.PLAN_CACHE_SIZE if max_size is None
+                         else max_size)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _entry(self, container, etag):
+        return os.path.join(self.path, container, etag)
+
+    def lookup(self, container, etag):
+        """Return the cached contents of the object with the given ETag
+
+        None is returned when the object isn't cached.
+        """
+
+        if not self.enabled or not _is_cacheable(etag):
+            return None
+        entry = self._entry(container, etag)
+        try:
+            with open(entry, 'rb') as f:
+                contents = f.read()
+            # Mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return contents
+
+    def store(self, container, etag, contents):
+        """Store the contents of an object downloaded from Swift
+
+        Contents which don't match the ETag are not stored.
+        """
+
+        if not self.enabled or not _is_cacheable(etag):
+            return
+        if isinstance(contents, six.text_type):
+            contents = contents.encode('utf-8')
+        if hashlib.md5(contents).hexdigest() != etag:
+            return
+
+        entry = self._entry(container, etag)
+        tmp = os.path.join(self.path, container, '%s%s.%d' % (
+            _TMP_PREFIX, etag, threading.current_thread().ident))
+        try:
+            # The plan environment holds the passwords of the overcloud
+            if not os.path.isdir(os.path.dirname(entry)):
+                os.makedirs(os.path.dirname(entry), 0o700)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(contents)
+            os.rename(tmp, entry)
+        except (IOError, OSError) as e:
+            # The cache is only an optimisation, never fail because of it
+            LOG.debug("Unable to cache %s/%s: %s", container, etag, e)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(contents)
+            if self._size > self.max_size:
+                self._evict()
+
+    def etags(self, container):
+        """Return the ETags of the objects in a container, by name
+
+        The container is only listed when the cache is enabled.
+        """
+
+        if not self.enabled:
+            return {}
+        objects = self._swift_client.get_container(container,
+                                                   full_listing=True)[1]
+        return dict((o['name'], o.get('hash')) for o in objects)
+
+    def get_object(self, container, name, etag=None):
+        """Read an object, from the cache when it is up to date
+
+        This returns the same (headers, contents) tuple as
+        swiftclient.client.Connection.get_object. The current ETag of the
+        object is checked with a HEAD request unless it is given, so callers
+        which already listed the container (see etags()) should pass it.
+        """
+
+        if not self.enabled:
+            return self._swift_client.get_object(container, name)
+
+        if etag is None:
+            etag = self._swift_client.head_object(container, name).get('etag')
+        contents = self.lookup(container, etag)
+        if contents is not None:
+            LOG.debug("Using cached copy of %s/%s", container, name)
+            return {'etag': etag}, contents
+
+        headers, contents = self._swift_client.get_object(container, name)
+        self.store(container, headers.get('etag'), contents)
+        return headers, contents
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.startswith(_TMP_PREFIX):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def _evict(self):
+        # Evict down to three quarters of the maximum size, so a run which
+        # adds many objects doesn't rescan the cache for every one of them.
+        entries, total = self._scan()
+        target = self.max_size * 3 // 4
+        for mtime, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+        LOG.debug("Evicted plan cache entries, %d bytes remaining", total)
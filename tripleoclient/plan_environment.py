@@ -0,0 +1,102 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Batched edits of a plan environment"""
+
+import logging
+
+from tripleoclient import constants
+from tripleoclient import yaml_serialization
+
+LOG = logging.getLogger(__name__)
+
+
+class PlanEnvironmentEditor(object):
+    """Edit the plan-environment.yaml of a plan with a single write
+
+    The edits are recorded and only applied by flush(), to the plan
+    environment as it is then, which is written back with a single PUT if
+    something changed. So one editor can collect the edits of a whole
+    command, even if workflows update the plan environment in the meantime.
+    """
+
+    def __init__(self, swift_client, container):
+        self._swift_client = swift_client
+        self.container = container
+        self._environments = []
+        self._passwords = None
+
+    @property
+    def pending(self):
+        """Whether some edits were not flushed yet"""
+
+        return bool(self._environments) or self._passwords is not None
+
+    def add_environment(self, path):
+        """Add an environment to the plan, unless it is already there"""
+
+        if path not in self._environments:
+            self._environments.append(path)
+
+    def set_passwords(self, passwords):
+        """Store passwords in the plan
+
+        The passwords the plan environment has and which are not given are
+        kept, e.g. the ones generated by the plan update.
+        """
+
+        self._passwords = passwords
+
+    def _apply(self, env):
+        changed = False
+        for path in self._environments:
+            environment = {'path': path}
+            environments = env.setdefault('environments', [])
+            if environment not in environments:
+                environments.append(environment)
+                changed = True
+        if self._passwords is not None:
+            passwords = env.get('passwords')
+            if isinstance(passwords, dict):
+                passwords = dict(passwords, **self._passwords)
+            else:
+                passwords = self._passwords
+            env['passwords'] = passwords
+            changed = True
+        return changed
+
+    def flush(self):
+        """Apply the edits and write the plan environment back to Swift"""
+
+        if not self.pending:
+            return
+
+        env = yaml_serialization.safe_load(self._swift_client.get_object(
+            self.container, constants.PLAN_ENVIRONMENT)[1])
+        if self._apply(env):
+            contents = yaml_serialization.safe_dump(env,
+                                                    default_flow_style=False)
+            self._swift_client.put_object(
+                self.container, constants.PLAN_ENVIRONMENT, contents)
+            LOG.debug("Updated the plan environment of %s", self.container)
+        self._environments = []
+        self._passwords = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
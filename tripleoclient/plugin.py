@@ -15,21 +15,49 @@
 
 """OpenStackClient Plugin interface"""
 
+import atexit
+import collections
 import json
 import logging
 import socket
+import threading
+import time
 import uuid
 
 from osc_lib import utils
-from swiftclient import client as swift_client
+from six.moves import queue
 import websocket
 
 from tripleoclient import exceptions
+from tripleoclient import swift_pool
 
 LOG = logging.getLogger(__name__)
 
 DEFAULT_TRIPLEOCLIENT_API_VERSION = '1'
 
+# Attempts to re-establish a lost websocket connection, and the delay
+# before the first one, doubled after each failure
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 1
+
+# How often a subscriber waiting with no timeout wakes up, so it can be
+# interrupted
+POLL_INTERVAL = 1
+
+# Seconds during which no connection to a queue is attempted after one
+# failed
+CONNECTION_RETRY_INTERVAL = 60
+
+# Lifetime in seconds of a subscription to a queue. A shared websocket
+# subscribes again once half of it has gone, checking at least every
+# SUBSCRIPTION_CHECK_INTERVAL seconds.
+SUBSCRIPTION_TTL = 10000
+SUBSCRIPTION_CHECK_INTERVAL = 60
+
+# Number of recent messages about executions nobody watched yet, kept for
+# the subscribers which watch them afterwards
+BACKLOG_SIZE = 100
+
 # Required by the OSC plugin interface
 API_NAME = 'tripleoclient'
 API_VERSION_OPTION = 'os_tripleoclient_api_version'
@@ -95,15 +123,28 @@ class WebsocketClient(object):
         # create and subscribe to a queue
         # NOTE: if the queue exists it will 204
         self.send('queue_create', {'queue_name': queue_name})
-        self.send('subscription_create', {
-            'queue_name': queue_name,
-            'ttl': 10000
-        })
+        self.send('subscription_create', self._subscription())
+        self.subscribed_at = time.time()
+
+    def _subscription(self):
+        return {'queue_name': self._queue_name, 'ttl': SUBSCRIPTION_TTL}
+
+    def renew_subscription(self):
+        """Subscribe to the queue again, before the subscription expires
+
+        The response isn't waited for, it is received like the messages.
+        """
+
+        self._send('subscription_create', self._subscription())
+        self.subscribed_at = time.time()
 
     def cleanup(self):
         self._ws.close()
 
-    def send(self, action, body=None, extra_headers=None):
+    def settimeout(self, timeout):
+        self._ws.settimeout(timeout)
+
+    def _send(self, action, body=None, extra_headers=None):
 
         headers = {
             'Client-ID': self._websocket_client_id,
@@ -117,6 +158,9 @@ class WebsocketClient(object):
         if body:
             msg['body'] = body
         self._ws.send(json.dumps(msg))
+
+    def send(self, action, body=None, extra_headers=None):
+        self._send(action, body, extra_headers)
         data = self.recv()
         if data['headers']['status'] not in (200, 201, 204):
             raise RuntimeError(data)
@@ -159,12 +203,280 @@ class WebsocketClient(object):
         self.cleanup()
 
 
+def _execution_ids(message):
+    """Return the IDs of the executions a message is about"""
+
+    try:
+        execution = message['body']['payload']['execution']
+    except (KeyError, TypeError):
+        return set()
+    return set(execution.get(k) for k in ('id', 'root_execution_id')
+               if execution.get(k))
+
+
+class WebsocketSession(object):
+    """A websocket on a queue, shared by all the commands of a process
+
+    A background thread reads the messages of the queue and dispatches them
+    to the subscribers. A message about an execution watched by some
+    subscribers is only given to them. The other messages are given to the
+    subscribers which don't watch any execution, and the recent ones are
+    kept for the subscribers which watch their execution later. When the
+    connection is lost it is established and the queue subscribed to
+    again, and the subscription is renewed before it expires.
+    """
+
+    def __init__(self, instance, queue_name="tripleo"):
+        self._instance = instance
+        self._queue_name = queue_name
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._backlog = collections.deque(maxlen=BACKLOG_SIZE)
+        self._sequence = 0
+        self._closed = False
+        self.alive = True
+
+        self._client = self._connect()
+
+        self._reader = threading.Thread(
+            target=self._read, name='websocket-%s' % queue_name)
+        self._reader.daemon = True
+        self._reader.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        client = WebsocketClient(self._instance, self._queue_name)
+        # Wake up the reader regularly, to renew the subscription
+        client.settimeout(SUBSCRIPTION_CHECK_INTERVAL)
+        return client
+
+    def subscribe(self):
+        subscriber = WebsocketSubscriber(self)
+        with self._lock:
+            subscriber.subscribed = self._sequence
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def watch(self, subscriber, execution_id):
+        with self._lock:
+            subscriber.execution_ids.add(execution_id)
+            # The messages which came before the subscriber subscribed, e.g.
+            # when the workflow was started first
+            missed = [message for sequence, ids, message in self._backlog
+                      if sequence <= subscriber.subscribed and
+                      execution_id in ids]
+        for message in missed:
+            subscriber.put(message)
+
+    def _dispatch(self, message):
+        try:
+            message['body']['payload']
+        except (KeyError, TypeError):
+            # The response to a request, e.g. renewing the subscription
+            status = message.get('headers', {}).get('status')
+            if status not in (200, 201, 204):
+                LOG.warning("Unexpected websocket message: %s" % message)
+            return
+
+        ids = _execution_ids(message)
+        with self._lock:
+            self._sequence += 1
+            subscribers = [s for s in self._subscribers
+                           if s.execution_ids & ids]
+            if not subscribers:
+                if ids:
+                    self._backlog.append((self._sequence, ids, message))
+                subscribers = [s for s in self._subscribers
+                               if not s.execution_ids]
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def _renew_subscription(self):
+        if time.time() - self._client.subscribed_at < SUBSCRIPTION_TTL / 2:
+            return
+        LOG.debug("Renewing the subscription to the queue %s"
+                  % self._queue_name)
+        self._client.renew_subscription()
+
+    def _reconnect(self):
+        delay = RECONNECT_DELAY
+        for attempt in range(RECONNECT_ATTEMPTS):
+            time.sleep(delay)
+            delay *= 2
+            if self._closed:
+                return False
+            try:
+                client = self._connect()
+            except (socket.error, websocket.WebSocketException,
+                    RuntimeError) as e:
+                LOG.warning("Unable to reconnect to the Zaqar websocket "
+                            "(attempt %d of %d): %s"
+                            % (attempt + 1, RECONNECT_ATTEMPTS, e))
+                continue
+            self._client = client
+            LOG.info("Reconnected to the Zaqar websocket")
+            return True
+        return False
+
+    def _read(self):
+        while not self._closed:
+            try:
+                message = self._client.recv()
+            except ValueError as e:
+                LOG.warning("Ignoring invalid websocket message: %s" % e)
+                continue
+            except websocket.WebSocketTimeoutException:
+                message = None
+            except (socket.error, websocket.WebSocketException) as e:
+                if self._closed:
+                    return
+                LOG.warning("Lost the connection to the Zaqar websocket: "
+                            "%s" % e)
+                try:
+                    self._client.cleanup()
+                except (socket.error, websocket.WebSocketException):
+                    pass
+                if not self._reconnect():
+                    break
+                continue
+            try:
+                self._renew_subscription()
+            except (socket.error, websocket.WebSocketException) as e:
+                # The connection is lost, which the next read notices
+                LOG.debug("Unable to renew the subscription: %s" % e)
+            if message is not None:
+                self._dispatch(message)
+
+        # The subscribers waiting for messages would never get them
+        with self._lock:
+            self.alive = False
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(None)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._client.cleanup()
+        except (socket.error, websocket.WebSocketException):
+            pass
+
+
+class WebsocketSubscriber(object):
+    """The messages of a shared websocket for one of its consumers
+
+    It is used like a WebsocketClient, cleaning it up unsubscribes it.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._messages = queue.Queue()
+        self.execution_ids = set()
+        self.subscribed = 0
+
+    def watch(self, execution_id):
+        """Receive the messages about an execution, and only this one
+
+        The messages about other executions, which were received before,
+        are dropped.
+        """
+
+        self._session.watch(self, execution_id)
+
+    def put(self, message):
+        self._messages.put(message)
+
+    def recv(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = POLL_INTERVAL
+            if deadline is not None:
+                wait = max(min(deadline - time.time(), POLL_INTERVAL), 0)
+            try:
+                message = self._messages.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.time() >= deadline:
+                    raise exceptions.WebSocketTimeout()
+                continue
+            if message is None:
+                raise exceptions.WebSocketConnectionError()
+            if self._watches(message):
+                return message
+
+    def _watches(self, message):
+        if not self.execution_ids:
+            return True
+        return bool(_execution_ids(message) & self.execution_ids)
+
+    def wait_for_messages(self, timeout=None):
+        """Wait for messages on the Zaqar queue
+
+        Like WebsocketClient.wait_for_messages, the timeout applies to each
+        message.
+        """
+
+        if timeout is None:
+            LOG.warning("Waiting for messages on queue '{}' with no timeout."
+                        .format(self._session._queue_name))
+
+        while True:
+            yield self.recv(timeout)['body']['payload']
+
+    def cleanup(self):
+        self._session.unsubscribe(self)
+
+    def __enter__(self):
+        """Return self to allow usage as a context manager"""
+        return self
+
+    def __exit__(self, *exc):
+        """Call cleanup when exiting the context manager"""
+        self.cleanup()
+
+
+class DisconnectedWebsocket(object):
+    """Stands for a websocket which couldn't be connected
+
+    Waiting for its messages raises WebSocketConnectionError, the workflows
+    are followed through the Mistral API instead.
+    """
+
+    def watch(self, execution_id):
+        pass
+
+    def recv(self, timeout=None):
+        raise exceptions.WebSocketConnectionError()
+
+    def wait_for_messages(self, timeout=None):
+        raise exceptions.WebSocketConnectionError()
+        # This is a generator, like the other wait_for_messages
+        yield
+
+    def cleanup(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
 class ClientWrapper(object):
 
     def __init__(self, instance):
         self._instance = instance
         self._object_store = None
         self._local_orchestration = None
+        self._websockets = {}
+        self._websocket_failures = {}
+        self._websockets_lock = threading.Lock()
 
     def local_orchestration(self, api_port):
         """Returns an local_orchestration service client"""
@@ -194,8 +506,32 @@ class ClientWrapper(object):
         return self._local_orchestration
 
     def messaging_websocket(self, queue_name='tripleo'):
-        """Returns a websocket for the messaging service"""
-        return WebsocketClient(self._instance, queue_name)
+        """Returns a websocket for the messaging service
+
+        The connection to a queue is shared by all the commands and threads,
+        each one gets its own subscriber to it. When it can't be connected,
+        a DisconnectedWebsocket is returned.
+        """
+
+        with self._websockets_lock:
+            session = self._websockets.get(queue_name)
+            if session is None or not session.alive:
+                failed = self._websocket_failures.get(queue_name)
+                if (failed is not None and
+                        time.time() - failed < CONNECTION_RETRY_INTERVAL):
+                    return DisconnectedWebsocket()
+                try:
+                    session = WebsocketSession(self._instance, queue_name)
+                except (socket.error, websocket.WebSocketException,
+                        RuntimeError) as e:
+                    LOG.warning("Following the workflows through the "
+                                "Mistral API, as the messaging websocket is "
+                                "unavailable: %s" % e)
+                    self._websocket_failures[queue_name] = time.time()
+                    return DisconnectedWebsocket()
+                self._websockets[queue_name] = session
+                self._websocket_failures.pop(queue_name, None)
+        return session.subscribe()
 
     @property
     def object_store(self):
@@ -203,6 +539,10 @@ class ClientWrapper(object):
 
         The Swift/Object client returned by python-openstack client isn't an
         instance of python-swiftclient, and had far less functionality.
+
+        The client is shared by all the commands and threads: it keeps a
+        pool of keep-alive connections and gets a new token from the
+        session when the current one expires.
         """
 
         if self._object_store is not None:
@@ -216,9 +556,11 @@ class ClientWrapper(object):
         token = self._instance.auth.get_token(self._instance.session)
 
         kwargs = {
-            'preauthurl': endpoint,
-            'preauthtoken': token
+            'session': self._instance.session,
+            # Keep using the same endpoint after re-authenticating
+            'os_options': {'object_storage_url': endpoint},
         }
 
-        self._object_store = swift_client.Connection(**kwargs)
+        self._object_store = swift_pool.ConnectionPool(endpoint, token,
+                                                       **kwargs)
         return self._object_store
@@ -0,0 +1,163 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""A thread safe Swift client sharing a pool of keep-alive connections"""
+
+import logging
+import threading
+import time
+
+from swiftclient import client as swift_client
+
+from tripleoclient import constants
+
+LOG = logging.getLogger(__name__)
+
+
+class RequestStats(object):
+    """Number and duration of the requests made, by method"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, method, duration):
+        with self._lock:
+            count, total, slowest = self._stats.get(method, (0, 0.0, 0.0))
+            self._stats[method] = (count + 1, total + duration,
+                                   max(slowest, duration))
+
+    def get(self, method):
+        """Return the (count, total time, slowest time) of a method"""
+
+        with self._lock:
+            return self._stats.get(method, (0, 0.0, 0.0))
+
+    def summary(self):
+        with self._lock:
+            return ', '.join(
+                '{0}: {1} requests in {2:.2f}s (max {3:.3f}s)'.format(
+                    method, count, total, slowest)
+                for method, (count, total, slowest)
+                in sorted(self._stats.items()))
+
+
+class ConnectionPool(object):
+    """Swift client which can be shared by any number of threads
+
+    Every request is made with a swiftclient Connection taken from a pool,
+    so the HTTP connections are kept alive from one request to the next.
+    The connections authenticate with the keystoneauth session: when a
+    token expires during a long operation Swift answers 401, the
+    connection gets a new token from the session and retries. The new token
+    is then handed to the other connections of the pool.
+
+    The methods of swiftclient.client.Connection are available, the number
+    and duration of the requests are counted in stats.
+    """
+
+    def __init__(self, url, token, session=None, os_options=None,
+                 size=constants.SWIFT_WORKERS, **kwargs):
+        self.url = url
+        self.token = token
+        self._session = session
+        self._os_options = os_options
+        self._kwargs = kwargs
+        self._size = size
+        self._lock = threading.Lock()
+        self._idle = []
+        self.stats = RequestStats()
+
+    def _new_connection(self):
+        return swift_client.Connection(
+            preauthurl=self.url, preauthtoken=self.token,
+            session=self._session, os_options=self._os_options,
+            **self._kwargs)
+
+    def _acquire(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+            token = self.token
+        if connection is None:
+            return self._new_connection()
+        if connection.token != token:
+            # Another connection of the pool was re-authenticated
+            connection.url, connection.token = self.url, token
+        return connection
+
+    def _release(self, connection):
+        with self._lock:
+            if connection.token and connection.token != self.token:
+                LOG.debug("Using the new token of a re-authenticated Swift "
+                          "connection")
+                self.url, self.token = connection.url, connection.token
+            if len(self._idle) < self._size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, method, *args, **kwargs):
+        connection = self._acquire()
+        start = time.time()
+        try:
+            return getattr(connection, method)(*args, **kwargs)
+        finally:
+            self.stats.record(method, time.time() - start)
+            self._release(connection)
+
+    def _stream(self, connection, body):
+        # The connection is busy until the whole body has been read
+        try:
+            for chunk in body:
+                yield chunk
+        finally:
+            self._release(connection)
+
+    def get_object(self, container, obj, **kwargs):
+        """Like swiftclient's get_object
+
+        When resp_chunk_size is given, the connection is only returned to
+        the pool once the returned body has been read completely.
+        """
+
+        if not kwargs.get('resp_chunk_size'):
+            return self._request('get_object', container, obj, **kwargs)
+        connection = self._acquire()
+        start = time.time()
+        try:
+            headers, body = connection.get_object(container, obj, **kwargs)
+        except Exception:
+            self._release(connection)
+            raise
+        finally:
+            self.stats.record('get_object', time.time() - start)
+        return headers, self._stream(connection, body)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(
+                getattr(swift_client.Connection, name, None)):
+            raise AttributeError(name)
+
+        def request(*args, **kwargs):
+            return self._request(name, *args, **kwargs)
+        return request
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+        if self.stats.summary():
+            LOG.debug("Swift requests: %s", self.stats.summary())
@@ -0,0 +1,288 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Concurrent transfers of objects to and from Swift"""
+
+from concurrent import futures
+import logging
+import os
+import socket
+import threading
+import time
+
+import six
+from swiftclient import client as swift_client
+from swiftclient import exceptions as swift_exc
+
+from tripleoclient import constants
+
+LOG = logging.getLogger(__name__)
+
+# HTTP statuses which indicate a transient failure worth retrying
+_RETRY_STATUSES = (408, 429)
+
+
+def _is_retryable(exc):
+    if isinstance(exc, swift_exc.ClientException):
+        status = exc.http_status
+        return status is None or status >= 500 or status in _RETRY_STATUSES
+    return isinstance(exc, socket.error)
+
+
+def _clone_connection(connection):
+    """Return a connection which can be used from another thread
+
+    A swiftclient Connection holds a single HTTP connection and must not be
+    shared between threads. Any other object (for example a
+    swift_pool.ConnectionPool, which is already safe to share) is returned
+    as is.
+    """
+
+    if not isinstance(connection, swift_client.Connection):
+        return connection
+    return swift_client.Connection(
+        preauthurl=connection.url,
+        preauthtoken=connection.token,
+        retries=connection.retries,
+        os_options=connection.os_options,
+        cacert=connection.cacert,
+        insecure=connection.insecure,
+        timeout=connection.timeout,
+        session=connection.session)
+
+
+class TransferStats(object):
+    """Aggregate counters for a set of Swift transfers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.count = 0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, size, latency):
+        with self._lock:
+            self.count += 1
+            self.bytes += size
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def summary(self, action='Transferred'):
+        elapsed = max(time.time() - self.started, 1e-6)
+        avg_latency = self.total_latency / self.count if self.count else 0.0
+        return ("{action} {count} objects ({size} bytes) in {elapsed:.2f}s: "
+                "{rate:.1f} objects/s, {throughput:.1f} KiB/s, latency avg "
+                "{avg:.3f}s max {max:.3f}s, {retries} retries, {errors} "
+                "errors").format(
+                    action=action, count=self.count, size=self.bytes,
+                    elapsed=elapsed, rate=self.count / elapsed,
+                    throughput=self.bytes / 1024.0 / elapsed,
+                    avg=avg_latency, max=self.max_latency,
+                    retries=self.retries, errors=self.errors)
+
+
+class _TransferExecutor(object):
+    """Run Swift requests on a bounded pool of workers
+
+    Every worker thread uses its own Swift connection. Transient failures
+    are retried with an exponential backoff. Callers must call wait() (or
+    use the executor as a context manager) to make sure the submitted
+    requests finished, the first error raised by one of them is re-raised
+    from there.
+    """
+
+    _action = 'Transferred'
+
+    def __init__(self, swift_client, workers=constants.SWIFT_WORKERS,
+                 retries=constants.SWIFT_RETRIES,
+                 backoff=constants.SWIFT_RETRY_BACKOFF):
+        self._swift_client = swift_client
+        self._retries = retries
+        self._backoff = backoff
+        self._local = threading.local()
+        self._pool = futures.ThreadPoolExecutor(max_workers=max(workers, 1))
+        self._pending = []
+        self.stats = TransferStats()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = _clone_connection(self._swift_client)
+            self._local.client = client
+        return client
+
+    def _retry(self, description, request, rewind=None):
+        """Call request() until it succeeds or fails permanently"""
+
+        attempt = 0
+        while True:
+            try:
+                return request()
+            except Exception as e:
+                if attempt >= self._retries or not _is_retryable(e):
+                    self.stats.record_error()
+                    raise
+                attempt += 1
+                self.stats.record_retry()
+                delay = self._backoff * (2 ** (attempt - 1))
+                LOG.debug("%s failed (%s), retrying in %.1fs",
+                          description, e, delay)
+                if rewind is not None:
+                    rewind()
+                time.sleep(delay)
+
+    def _submit(self, fn, *args, **kwargs):
+        future = self._pool.submit(fn, *args, **kwargs)
+        self._pending.append(future)
+        return future
+
+    def wait(self):
+        """Wait for all the submitted requests to finish
+
+        :raises: the first exception raised by one of the requests
+        """
+
+        pending, self._pending = self._pending, []
+        error = None
+        for future in pending:
+            exc = future.exception()
+            if exc is not None and error is None:
+                error = exc
+        if error is not None:
+            raise error
+
+    def shutdown(self):
+        """Wait for the running requests and release the workers"""
+
+        self._pool.shutdown(wait=True)
+        self._pending = []
+        if self.stats.count or self.stats.errors:
+            LOG.debug(self.stats.summary(self._action))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.shutdown()
+
+
+class UploadExecutor(_TransferExecutor):
+    """Upload objects to Swift with a bounded pool of workers
+
+    Uploads are submitted with put_object or put_file and run concurrently.
+    """
+
+    _action = 'Uploaded'
+
+    def _put(self, container, obj, contents, size, **kwargs):
+        def request():
+            start = time.time()
+            result = self._client().put_object(container, obj, contents,
+                                               **kwargs)
+            self.stats.record(size, time.time() - start)
+            return result
+
+        rewind = getattr(contents, 'seek', None)
+        return self._retry("Upload of %s/%s" % (container, obj), request,
+                           rewind and (lambda: rewind(0)))
+
+    def _put_file(self, container, obj, filename, mode, **kwargs):
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            size = 0
+        with (open(filename, mode) if mode else open(filename)) as contents:
+            return self._put(container, obj, contents, size, **kwargs)
+
+    def put_object(self, container, obj, contents, **kwargs):
+        """Submit the upload of contents (a string) as container/obj"""
+
+        size = len(contents) if hasattr(contents, '__len__') else 0
+        return self._submit(self._put, container, obj, contents, size,
+                            **kwargs)
+
+    def put_file(self, container, obj, filename, mode=None, **kwargs):
+        """Submit the upload of a local file as container/obj
+
+        The file is only opened by the worker which uploads it, in text mode
+        unless another mode is given.
+        """
+
+        return self._submit(self._put_file, container, obj, filename, mode,
+                            **kwargs)
+
+
+class DownloadExecutor(_TransferExecutor):
+    """Download objects from Swift with a bounded pool of workers"""
+
+    _action = 'Downloaded'
+
+    def _get(self, container, obj):
+        def request():
+            start = time.time()
+            result = self._client().get_object(container, obj)
+            self.stats.record(len(result[1]), time.time() - start)
+            return result
+
+        return self._retry("Download of %s/%s" % (container, obj), request)
+
+    def get_object(self, container, obj):
+        """Submit the download of container/obj
+
+        The future returned resolves to a (headers, contents) tuple.
+        """
+
+        return self._submit(self._get, container, obj)
+
+    def _save(self, container, obj, filename, etag, cache):
+        contents = cache.lookup(container, etag) if cache else None
+        if contents is None:
+            headers, contents = self._get(container, obj)
+            if cache:
+                cache.store(container, headers.get('etag'), contents)
+
+        mode = 'w' if isinstance(contents, six.text_type) else 'wb'
+        with open(filename, mode) as f:
+            f.write(contents)
+        return len(contents)
+
+    def save_object(self, container, obj, filename, etag=None, cache=None):
+        """Submit the download of container/obj to a local file
+
+        The contents are only held in memory by the worker until they are
+        written, so downloading many objects doesn't keep them all in
+        memory. When a plan_cache.PlanCache is given, it is used for the
+        object with the given ETag. The future returned resolves to the
+        number of bytes written.
+        """
+
+        return self._submit(self._save, container, obj, filename, etag,
+                            cache)
@@ -0,0 +1,95 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Tarballs of template trees streamed straight into Swift"""
+
+import logging
+import subprocess
+
+LOG = logging.getLogger(__name__)
+
+# The same exclusions as tripleo_common.utils.tarball.create_tarball
+_EXCLUDES = ('.git', '.tox', '*.pyc', '*.pyo')
+
+
+class TarballStream(object):
+    """A gzipped tarball of a directory, read while tar creates it
+
+    tar writes the tarball to a pipe, so it is never stored on disk and only
+    the chunk being read is held in memory. reset() starts it over, which is
+    what swiftclient calls before retrying a failed upload.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._process = None
+        self.reset()
+
+    def reset(self):
+        self.close()
+        cmd = ['/usr/bin/tar', '-C', self.directory, '-czf', '-']
+        for exclude in _EXCLUDES:
+            cmd.extend(['--exclude', exclude])
+        cmd.append('.')
+        self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def read(self, size=-1):
+        data = self._process.stdout.read(size)
+        if not data:
+            returncode = self._process.wait()
+            if returncode:
+                raise subprocess.CalledProcessError(
+                    returncode, 'tar -C %s -czf -' % self.directory)
+        return data
+
+    def close(self):
+        if self._process is None:
+            return
+        self._process.stdout.close()
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def create_tarball_stream(directory):
+    """Return a TarballStream of directory"""
+
+    LOG.debug('Streaming tarball of %s' % directory)
+    return TarballStream(directory)
+
+
+def tarball_extract_to_swift_container(object_client, stream, container):
+    """Upload a tarball stream to be extracted into a Swift container
+
+    As the size of the tarball isn't known in advance, it is sent with
+    chunked transfer encoding.
+    """
+
+    LOG.debug('Uploading tarball of %s to Swift container %s'
+              % (stream.directory, container))
+    object_client.put_object(
+        container=container,
+        obj='',
+        contents=stream,
+        query_string='extract-archive=tar.gz',
+        headers={'X-Detect-Content-Type': 'true'}
+    )
@@ -0,0 +1,216 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Index of the files a Heat template and its environment reference"""
+
+import json
+import logging
+import os
+
+try:
+    from collections import abc as collections_abc
+except ImportError:  # Python 2
+    import collections as collections_abc
+
+import six
+
+from tripleoclient import constants
+from tripleoclient import yaml_serialization
+
+LOG = logging.getLogger(__name__)
+
+# Once heatclient has processed them, the values of these keys in the
+# templates are the URLs the files are stored under
+LINK_KEYS = ('get_file', 'type')
+
+
+def _parse_template(contents):
+    """Return contents as a template, or None if it isn't one
+
+    heatclient stores the nested templates as JSON, any other file is
+    kept as it was read (scripts, configuration files...).
+    """
+
+    if not isinstance(contents, six.string_types):
+        return None
+    if 'heat_template_version' not in contents:
+        return None
+    try:
+        if contents.lstrip().startswith('{'):
+            template = json.loads(contents)
+        else:
+            template = yaml_serialization.safe_load(contents)
+    except Exception:
+        return None
+    if isinstance(template, dict) and 'heat_template_version' in template:
+        return template
+    return None
+
+
+def _template_links(part, files):
+    links = []
+    if isinstance(part, dict):
+        for key, value in part.items():
+            if (key in LINK_KEYS and isinstance(value, six.string_types) and
+                    value in files):
+                links.append(value)
+            else:
+                links.extend(_template_links(value, files))
+    elif isinstance(part, list):
+        for value in part:
+            links.extend(_template_links(value, files))
+    return links
+
+
+def _registry_links(part, files):
+    links = []
+    if isinstance(part, collections_abc.Mapping):
+        for value in part.values():
+            links.extend(_registry_links(value, files))
+    elif isinstance(part, six.string_types) and part in files:
+        links.append(part)
+    return links
+
+
+def _unique(values):
+    seen = set()
+    return [v for v in values if not (v in seen or seen.add(v))]
+
+
+class TemplateGraph(object):
+    """Which files of a stack reference which others
+
+    roots are the files the template and the environment reference
+    directly, edges maps every file to the files it references and sizes
+    holds the size of every file, reachable or not.
+    """
+
+    def __init__(self, roots=None, edges=None, sizes=None):
+        self.roots = list(roots or [])
+        self.edges = dict(edges or {})
+        self.sizes = dict(sizes or {})
+
+    @classmethod
+    def build(cls, template, environment, files):
+        """Build the graph of a stack, as heatclient prepared it
+
+        :param template: the parsed top level template
+        :param environment: the merged environment (any mapping)
+        :param files: the files dict to send to Heat
+        """
+
+        roots = _template_links(template, files)
+        registry = (environment or {}).get('resource_registry')
+        if registry:
+            roots.extend(_registry_links(registry, files))
+        edges = {}
+        sizes = {}
+        for name, contents in files.items():
+            sizes[name] = len(contents or '')
+            nested = _parse_template(contents)
+            edges[name] = (_unique(_template_links(nested, files))
+                           if nested else [])
+        return cls(_unique(roots), edges, sizes)
+
+    def reachable(self):
+        """Return the set of the files reachable from the roots"""
+
+        seen = set()
+        pending = list(self.roots)
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            pending.extend(self.edges.get(name, []))
+        return seen
+
+    def unreachable(self):
+        return set(self.sizes) - self.reachable()
+
+    def prune(self, files):
+        """Return the entries of files which are reachable"""
+
+        reachable = self.reachable()
+        pruned = dict((k, v) for k, v in files.items() if k in reachable)
+        if len(pruned) != len(files):
+            LOG.debug("Leaving out %d unreachable files: %s",
+                      len(files) - len(pruned),
+                      ', '.join(sorted(set(files) - reachable)))
+        return pruned
+
+    def summary(self):
+        reachable = self.reachable()
+        unreachable = set(self.sizes) - reachable
+        return {
+            'files': len(self.sizes),
+            'references': sum(len(v) for v in self.edges.values()),
+            'reachable': len(reachable),
+            'reachable_bytes': sum(self.sizes.get(n, 0) for n in reachable),
+            'unreachable': len(unreachable),
+            'unreachable_bytes': sum(self.sizes[n] for n in unreachable),
+        }
+
+    def to_dict(self):
+        return {'roots': self.roots, 'edges': self.edges,
+                'sizes': self.sizes}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('roots'), data.get('edges'), data.get('sizes'))
+
+
+def index_path(stack_name):
+    directory = os.path.expanduser(constants.TEMPLATE_GRAPH_DIRECTORY)
+    return os.path.join(directory, '%s.json' % stack_name)
+
+
+def save(stack_name, graph):
+    """Store the graph of a stack, for the template graph command
+
+    Failing to store it doesn't fail the deployment.
+    """
+
+    path = index_path(stack_name)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0o700)
+        with open(path, 'w') as f:
+            json.dump(graph.to_dict(), f, indent=1, sort_keys=True)
+    except (IOError, OSError) as e:
+        LOG.warning("Unable to store the template graph in %s: %s", path, e)
+        return None
+    return path
+
+
+def load(stack_name):
+    """Return the graph stored by the last deployment of a stack
+
+    :raises: IOError if there is none
+    """
+
+    with open(index_path(stack_name)) as f:
+        return TemplateGraph.from_dict(json.load(f))
+
+
+def prune_files(template, environment, files):
+    """Index the files of a stack
+
+    :returns: the graph of the files and the reachable ones
+    """
+
+    graph = TemplateGraph.build(template, environment, files)
+    LOG.debug("Template graph: %s", graph.summary())
+    return graph, graph.prune(files)
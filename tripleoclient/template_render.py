@@ -0,0 +1,328 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Rendering of the jinja2 templates of a tripleo-heat-templates tree
+
+This does what tools/process-templates.py of tripleo-heat-templates does
+when run in the templates directory, without starting another
+interpreter. The templates are rendered concurrently and each output is
+stored in a cache, keyed on the hashes of the template (and the templates
+it includes), of the roles data and of the networks data, so only the
+outputs whose inputs changed are rendered again.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from concurrent import futures
+import jinja2
+from jinja2 import meta
+import six
+
+from tripleoclient import constants
+from tripleoclient import exceptions
+from tripleoclient import yaml_serialization
+
+LOG = logging.getLogger(__name__)
+
+ROLE_SUFFIX = '.role.j2.yaml'
+NETWORK_SUFFIX = '.network.j2.yaml'
+J2_SUFFIX = '.j2.yaml'
+
+
+def _sha256(data):
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path, contents):
+    # The file may be a link to the original templates, replace it
+    if os.path.lexists(path):
+        os.remove(path)
+    with open(path, 'w') as f:
+        f.write(contents)
+
+
+class RenderCache(object):
+    """Rendered templates, stored in a directory, one file per key
+
+    The entries are kept for max_age seconds after they were last used, so
+    switching between e.g. two roles data files reuses the outputs of both.
+    """
+
+    def __init__(self, path=None, max_age=None):
+        self.path = os.path.expanduser(
+            path or constants.RENDER_CACHE_DIRECTORY)
+        self.max_age = (constants.RENDER_CACHE_MAX_AGE if max_age is None
+                        else max_age)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def lookup(self, key):
+        entry = self._entry(key)
+        try:
+            contents = _read(entry)
+            # Mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError):
+            return None
+        return contents
+
+    def store(self, key, contents):
+        entry = self._entry(key)
+        tmp = '%s.tmp-%d' % (entry, os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0o700)
+            with open(tmp, 'w') as f:
+                f.write(contents)
+            os.rename(tmp, entry)
+        except (IOError, OSError) as e:
+            LOG.debug("Unable to cache the rendered template: %s" % e)
+
+    def prune(self):
+        """Remove the entries which weren't used for max_age seconds"""
+
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        oldest = time.time() - self.max_age
+        for name in names:
+            entry = self._entry(name)
+            try:
+                if os.path.getmtime(entry) < oldest:
+                    os.remove(entry)
+            except OSError:
+                pass
+
+
+class Renderer(object):
+    """Render the j2 templates of a tree next to themselves
+
+    Like process-templates.py, the templates a template includes are looked
+    for in its own directory first, then in tht_root.
+
+    :param tht_root: the templates directory, which is modified
+    :param roles_file: path of the roles data, relative to tht_root
+    :param networks_file: path of the networks data, relative to tht_root
+    :param cache: a RenderCache, or None to always render
+    """
+
+    def __init__(self, tht_root, roles_file=constants.UNDERCLOUD_ROLES_FILE,
+                 networks_file=constants.OVERCLOUD_NETWORKS_FILE,
+                 cache=None, workers=constants.RENDER_WORKERS):
+        self.tht_root = tht_root
+        self.roles_path = os.path.join(tht_root, roles_file)
+        self.networks_path = os.path.join(tht_root, networks_file)
+        self.cache = cache
+        self.workers = workers
+        self.rendered = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._environments = {}
+        self._include_hashes = {}
+        self._template_includes = {}
+
+    def _search_path(self, template_path):
+        return (os.path.dirname(template_path), self.tht_root)
+
+    def _environment(self, search_path):
+        with self._lock:
+            environment = self._environments.get(search_path)
+            if environment is None:
+                environment = jinja2.Environment(
+                    loader=jinja2.FileSystemLoader(list(search_path)))
+                self._environments[search_path] = environment
+        return environment
+
+    def _load_data(self):
+        roles_data = _read(self.roles_path)
+        self.roles = yaml_serialization.safe_load(roles_data) or []
+        if os.path.exists(self.networks_path):
+            networks_data = _read(self.networks_path)
+            self.networks = yaml_serialization.safe_load(networks_data) or []
+        else:
+            networks_data = ''
+            self.networks = []
+        self.data_hash = _sha256(_sha256(roles_data) + _sha256(networks_data))
+
+        excludes_path = os.path.join(self.tht_root, 'j2_excludes.yaml')
+        excludes = {}
+        if os.path.exists(excludes_path):
+            excludes = yaml_serialization.safe_load(_read(excludes_path))
+        self.excludes = set((excludes or {}).get('name') or [])
+
+    def _includes_hash(self, source, search_path, seen=()):
+        """Return a hash of the templates a template includes
+
+        None when they can't be known, e.g. when their names are computed.
+        """
+
+        try:
+            names = meta.find_referenced_templates(
+                self._environment(search_path).parse(source))
+        except jinja2.exceptions.TemplateError:
+            # The error is reported when the template is rendered
+            return None
+        hashes = []
+        for name in names:
+            if name is None or name in seen:
+                return None
+            key = (search_path, name)
+            if key not in self._include_hashes:
+                included = None
+                for directory in search_path:
+                    try:
+                        included = _read(os.path.join(directory, name))
+                        break
+                    except (IOError, OSError):
+                        continue
+                if included is None:
+                    return None
+                nested = self._includes_hash(included, search_path,
+                                             seen + (name,))
+                if nested is None:
+                    return None
+                self._include_hashes[key] = _sha256(
+                    _sha256(included) + nested)
+            hashes.append(self._include_hashes[key])
+        return _sha256(''.join(hashes))
+
+    def _jobs(self):
+        """Return (path, template, output path, template data) tuples"""
+
+        role_names = [r.get('name') for r in self.roles]
+        r_map = dict((r.get('name'), r) for r in self.roles)
+        n_map = {}
+        for n in self.networks:
+            if n.get('enabled') is not False:
+                n_map[n.get('name')] = n
+                if not n.get('name_lower'):
+                    n['name_lower'] = n.get('name').lower()
+
+        jobs = []
+        for subdir, dirs, files in os.walk(self.tht_root):
+            # Hidden directories and files are never rendered, nor the
+            # templates of the tools
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            if subdir == self.tht_root and 'tools' in dirs:
+                dirs.remove('tools')
+            for f in sorted(files):
+                if f.startswith('.'):
+                    continue
+                path = os.path.join(subdir, f)
+                if f.endswith(ROLE_SUFFIX):
+                    template = _read(path)
+                    for role in role_names:
+                        out_f = "-".join([role.lower(),
+                                          f.replace(ROLE_SUFFIX, '.yaml')])
+                        if '{{role.name}}' in template:
+                            j2_data = {'role': r_map[role]}
+                        else:
+                            # Backwards compatibility with templates
+                            # that use {{role}} rather than {{role.name}}
+                            j2_data = {'role': role}
+                        # For the undercloud installer heat doesn't check
+                        # the nova/glance APIs
+                        if r_map[role].get('disable_constraints', False):
+                            j2_data['disable_constraints'] = True
+                        jobs.append((path, template,
+                                     os.path.join(subdir, out_f), j2_data))
+                elif f.endswith(NETWORK_SUFFIX):
+                    template = _read(path)
+                    for network in n_map.values():
+                        out_f = f.replace(NETWORK_SUFFIX, '.yaml')
+                        if os.path.basename(subdir) == 'ports':
+                            out_f = out_f.replace('port',
+                                                  network['name_lower'])
+                        else:
+                            out_f = out_f.replace('network',
+                                                  network['name_lower'])
+                        jobs.append((path, template,
+                                     os.path.join(subdir, out_f),
+                                     {'network': network}))
+                elif f.endswith(J2_SUFFIX):
+                    jobs.append((path, _read(path), os.path.join(
+                        subdir, f.replace(J2_SUFFIX, '.yaml')),
+                        {'roles': self.roles, 'networks': self.networks}))
+
+        return [job for job in jobs if os.path.relpath(
+                job[2], self.tht_root) not in self.excludes]
+
+    def _key(self, path, template, out_path):
+        template_hash = _sha256(template)
+        search_path = self._search_path(path)
+        if (template_hash, search_path) not in self._template_includes:
+            self._template_includes[template_hash, search_path] = \
+                self._includes_hash(template, search_path)
+        includes = self._template_includes[template_hash, search_path]
+        if includes is None:
+            return None
+        return _sha256('\0'.join([
+            template_hash, includes, self.data_hash,
+            os.path.relpath(out_path, self.tht_root)]))
+
+    def _render(self, job):
+        path, template, out_path, j2_data = job
+        key = self._key(path, template, out_path) if self.cache else None
+        if key is not None:
+            contents = self.cache.lookup(key)
+            if contents is not None:
+                _write(out_path, contents)
+                return False
+
+        LOG.debug("Rendering %s to %s" % (path, out_path))
+        try:
+            environment = self._environment(self._search_path(path))
+            contents = environment.from_string(template).render(**j2_data)
+        except jinja2.exceptions.TemplateError as e:
+            raise exceptions.InvalidConfiguration(
+                "Error rendering template %s: %s" % (
+                    out_path, six.text_type(e)))
+        _write(out_path, contents)
+        if key is not None:
+            self.cache.store(key, contents)
+        return True
+
+    def render(self):
+        """Render every j2 template of the tree
+
+        :returns: the number of outputs rendered and the number reused
+                  from the cache
+        """
+
+        self._load_data()
+        jobs = self._jobs()
+        workers = max(min(self.workers, len(jobs)), 1)
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for rendered in executor.map(self._render, jobs):
+                if rendered:
+                    self.rendered += 1
+                else:
+                    self.reused += 1
+        if self.cache:
+            self.cache.prune()
+        return self.rendered, self.reused
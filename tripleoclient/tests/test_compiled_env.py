@@ -0,0 +1,145 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import os
+import shutil
+
+from tripleoclient import compiled_env
+from tripleoclient import exceptions
+from tripleoclient.tests import base
+
+
+class TestCompiledEnvironment(base.TestCase):
+
+    def setUp(self):
+        super(TestCompiledEnvironment, self).setUp()
+        self.user_tht = os.path.join(self.temp_homedir, 'tht')
+        self.tht = os.path.join(self.temp_homedir, 'work')
+        self.write(self.user_tht, 'environments/foo.yaml',
+                   'resource_registry:\n'
+                   '  OS::TripleO::Foo: ../foo.yaml\n'
+                   'parameter_defaults:\n'
+                   '  Foo: 1\n')
+        self.write(self.user_tht, 'foo.yaml',
+                   'heat_template_version: pike\n')
+        shutil.copytree(self.user_tht, self.tht)
+        self.user_env = self.write(self.temp_homedir, 'user.yaml',
+                                   'parameter_defaults:\n'
+                                   '  Foo: 2\n'
+                                   '  Bar: 3\n')
+        self.env_files = [
+            os.path.join(self.user_tht, 'environments/foo.yaml'),
+            self.user_env]
+
+    def write(self, root, name, contents):
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_compile(self):
+        compiled = compiled_env.compile_environments(
+            self.env_files, self.tht, self.user_tht)
+
+        self.assertEqual(
+            {'resource_registry': {
+                'OS::TripleO::Foo': 'file://%s/foo.yaml' % self.tht},
+             'parameter_defaults': {'Foo': 2, 'Bar': 3}},
+            compiled.environment)
+        self.assertEqual(['file://%s/foo.yaml' % self.tht],
+                         list(compiled.files))
+        self.assertEqual(
+            set(['environments/foo.yaml', 'foo.yaml', self.user_env]),
+            set(compiled.inputs))
+        self.assertEqual([], compiled.changed_inputs(self.tht))
+
+    def test_save_and_load(self):
+        compiled = compiled_env.compile_environments(
+            self.env_files, self.tht, self.user_tht)
+        path = os.path.join(self.temp_homedir, 'compiled.json')
+        compiled.save(path)
+
+        loaded = compiled_env.CompiledEnvironment.load(path)
+
+        self.assertEqual(compiled.to_dict(), loaded.to_dict())
+
+    def test_load_modified(self):
+        compiled = compiled_env.compile_environments(
+            self.env_files, self.tht, self.user_tht)
+        data = compiled.to_dict()
+        data['environment']['parameter_defaults']['Foo'] = 4
+        path = os.path.join(self.temp_homedir, 'compiled.json')
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+        self.assertRaises(exceptions.InvalidConfiguration,
+                          compiled_env.CompiledEnvironment.load, path)
+
+    def test_load_missing(self):
+        self.assertRaises(exceptions.InvalidConfiguration,
+                          compiled_env.CompiledEnvironment.load,
+                          os.path.join(self.temp_homedir, 'missing.json'))
+
+    def test_changed_inputs(self):
+        compiled = compiled_env.compile_environments(
+            self.env_files, self.tht, self.user_tht)
+        other = os.path.join(self.temp_homedir, 'other')
+        shutil.copytree(self.user_tht, other)
+        self.assertEqual([], compiled.changed_inputs(other))
+
+        self.write(other, 'foo.yaml', 'heat_template_version: queens\n')
+        os.remove(self.user_env)
+
+        self.assertEqual(sorted(['foo.yaml', self.user_env]),
+                         compiled.changed_inputs(other))
+
+    def test_relocate(self):
+        compiled = compiled_env.compile_environments(
+            self.env_files, self.tht, self.user_tht)
+
+        files, env = compiled.relocate('/tmp/other/')
+
+        self.assertEqual(['file:///tmp/other/foo.yaml'], list(files))
+        self.assertEqual('file:///tmp/other/foo.yaml',
+                         env['resource_registry']['OS::TripleO::Foo'])
+        # The compiled environment itself is left as it is
+        self.assertEqual(
+            'file://%s/foo.yaml' % self.tht,
+            compiled.environment['resource_registry']['OS::TripleO::Foo'])
+
+    def test_environment_directories(self):
+        env_dir = os.path.join(self.temp_homedir, 'environments')
+        dir_env = self.write(env_dir, 'a.yaml',
+                             'parameter_defaults:\n  Foo: 5\n  Baz: 6\n')
+
+        compiled = compiled_env.compile_environments(
+            [self.user_env], self.tht, self.user_tht, [env_dir])
+
+        self.assertEqual({'Foo': 2, 'Bar': 3, 'Baz': 6},
+                         compiled.environment['parameter_defaults'])
+        self.assertEqual([self.user_env], compiled.environment_files)
+        self.assertEqual([os.path.realpath(env_dir)],
+                         list(compiled.directories))
+        self.assertIn(dir_env, compiled.inputs)
+        self.assertEqual([], compiled.changed_inputs(self.tht))
+
+        new_env = self.write(env_dir, 'b.yaml', 'parameter_defaults: {}\n')
+
+        self.assertEqual([env_dir], compiled.changed_inputs(self.tht))
+        self.assertEqual([dir_env, new_env, self.user_env],
+                         compiled.all_environment_files())
@@ -0,0 +1,136 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import time
+
+import fixtures
+import mock
+
+from tripleoclient import environment_index
+from tripleoclient.tests import base
+from tripleoclient import utils
+
+
+class TestDirectoryIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestDirectoryIndex, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.environment_index._index', None))
+        self.env_dir = os.path.join(self.temp_homedir, 'environments')
+        os.makedirs(os.path.join(self.env_dir, 'sub.yaml'))
+        for name in ('b.yaml', 'a.yaml', 'c.txt'):
+            self.write(name, 'parameter_defaults: {}\n')
+        self.index_file = os.path.join(self.temp_homedir, 'index.json')
+
+    def write(self, name, contents, age=60):
+        path = os.path.join(self.env_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        # Recent modification times are not trusted by the index
+        past = time.time() - age
+        os.utime(path, (past, past))
+        os.utime(self.env_dir, (past, past))
+
+    def index(self):
+        return environment_index.DirectoryIndex(self.index_file)
+
+    def test_list_directory(self):
+        self.assertEqual([os.path.join(self.env_dir, 'a.yaml'),
+                          os.path.join(self.env_dir, 'b.yaml')],
+                         self.index().list_directory(self.env_dir))
+
+    @mock.patch('glob.glob', wraps=__import__('glob').glob)
+    def test_unchanged_directory(self, mock_glob):
+        index = self.index()
+        files = index.list_directory(self.env_dir)
+        index.save()
+        self.assertEqual(1, mock_glob.call_count)
+
+        self.assertEqual(files, self.index().list_directory(self.env_dir))
+        self.assertEqual(1, mock_glob.call_count)
+
+    def test_added_file(self):
+        index = self.index()
+        index.list_directory(self.env_dir)
+        index.save()
+
+        self.write('0.yaml', 'parameter_defaults: {}\n', age=30)
+
+        self.assertEqual([os.path.join(self.env_dir, '0.yaml'),
+                          os.path.join(self.env_dir, 'a.yaml'),
+                          os.path.join(self.env_dir, 'b.yaml')],
+                         self.index().list_directory(self.env_dir))
+
+    def test_recent_directory(self):
+        index = self.index()
+        os.utime(self.env_dir, None)
+        index.list_directory(self.env_dir)
+
+        with mock.patch('glob.glob', return_value=[]) as mock_glob:
+            self.assertEqual([], index.list_directory(self.env_dir))
+        mock_glob.assert_called_once_with(os.path.join(self.env_dir,
+                                                       '*.yaml'))
+
+    def test_directory_hash(self):
+        index = self.index()
+        digest = index.directory_hash(self.env_dir)
+        index.save()
+
+        with mock.patch('tripleoclient.environment_index._digest') as m:
+            self.assertEqual(digest,
+                             self.index().directory_hash(self.env_dir))
+        m.assert_not_called()
+
+        self.write('a.yaml', 'parameter_defaults: {Foo: 1}\n', age=30)
+        self.assertNotEqual(digest, self.index().directory_hash(self.env_dir))
+
+    def test_directory_hash_removed_file(self):
+        index = self.index()
+        digest = index.directory_hash(self.env_dir)
+
+        os.remove(os.path.join(self.env_dir, 'b.yaml'))
+
+        self.assertNotEqual(digest, index.directory_hash(self.env_dir))
+        self.assertEqual([os.path.join(self.env_dir, 'a.yaml')],
+                         index.list_directory(self.env_dir))
+
+    def test_removed_file(self):
+        target = os.path.join(self.temp_homedir, 'target.yaml')
+        with open(target, 'w') as f:
+            f.write('parameter_defaults: {}\n')
+        os.symlink(target, os.path.join(self.env_dir, 'd.yaml'))
+        os.utime(self.env_dir, (1000000000, 1000000000))
+        index = self.index()
+        self.assertEqual(3, len(index.list_directory(self.env_dir)))
+
+        # Neither changes the modification time of the directory
+        os.remove(target)
+        os.remove(os.path.join(self.env_dir, 'b.yaml'))
+        os.utime(self.env_dir, (1000000000, 1000000000))
+
+        self.assertEqual([os.path.join(self.env_dir, 'a.yaml')],
+                         index.list_directory(self.env_dir))
+
+    def test_load_environment_directories(self):
+        missing = os.path.join(self.temp_homedir, 'missing')
+
+        self.assertEqual([os.path.join(self.env_dir, 'a.yaml'),
+                          os.path.join(self.env_dir, 'b.yaml')],
+                         utils.load_environment_directories(
+                             [missing, self.env_dir]))
+        self.assertTrue(os.path.exists(
+            environment_index.get_index().path))
@@ -0,0 +1,116 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import copy
+
+from heatclient.common import template_utils
+
+from tripleoclient import layered_env
+from tripleoclient.tests import base
+
+
+class TestLayeredEnvironment(base.TestCase):
+
+    LAYERS = [
+        ('user-environment.yaml', {
+            'resource_registry': {'OS::TripleO::Foo': 'foo.yaml'},
+            'parameter_defaults': {'ControllerCount': 1,
+                                   'NtpServer': 'pool.ntp.org',
+                                   'ExtraConfig': {'a': 1, 'b': 2}},
+        }),
+        ('user-environments/tripleoclient-parameters.yaml', {
+            'parameter_defaults': {'ControllerCount': 3},
+        }),
+        ('/home/stack/network.yaml', {
+            'resource_registry': {'OS::TripleO::Bar': 'bar.yaml'},
+            'parameter_defaults': {'ExtraConfig': {'b': 3, 'c': 4},
+                                   'NtpServer': None,
+                                   'DnsServers': ['8.8.8.8']},
+        }),
+        ('/home/stack/overrides.yaml', {
+            'parameter_defaults': {'ExtraConfig': None,
+                                   'DnsServers': ['1.1.1.1'],
+                                   'Flags': {'x': True}},
+        }),
+        ('/home/stack/scalar.yaml', {
+            'parameter_defaults': {'Flags': 'none'},
+        }),
+    ]
+
+    def setUp(self):
+        super(TestLayeredEnvironment, self).setUp()
+        self.env = layered_env.LayeredEnvironment()
+        for name, layer in self.LAYERS:
+            self.env.add_layer(name, layer)
+
+    def _deep_updated(self):
+        env = {}
+        for name, layer in copy.deepcopy(self.LAYERS):
+            template_utils.deep_update(env, layer)
+        return env
+
+    def test_same_as_deep_update(self):
+        self.assertEqual(self._deep_updated(), self.env.to_dict())
+        self.assertEqual(self._deep_updated(), self.env)
+
+    def test_lookup(self):
+        parameters = self.env['parameter_defaults']
+        self.assertEqual(3, parameters['ControllerCount'])
+        # None only doesn't replace mappings
+        self.assertIsNone(parameters.get('NtpServer'))
+        self.assertEqual({'a': 1, 'b': 3, 'c': 4}, parameters['ExtraConfig'])
+        self.assertEqual(['1.1.1.1'], parameters['DnsServers'])
+        self.assertEqual('none', parameters['Flags'])
+        self.assertNotIn('Missing', parameters)
+        self.assertRaises(KeyError, lambda: self.env['Missing'])
+
+    def test_to_dict_copies(self):
+        result = self.env.to_dict()
+        result['parameter_defaults']['ExtraConfig']['d'] = 5
+        result['resource_registry'].clear()
+
+        self.assertNotIn('d', self.LAYERS[0][1]['parameter_defaults'][
+            'ExtraConfig'])
+        self.assertEqual(self._deep_updated(), self.env.to_dict())
+
+    def test_origin(self):
+        self.assertEqual('user-environments/tripleoclient-parameters.yaml',
+                         self.env.origin('parameter_defaults',
+                                         'ControllerCount'))
+        self.assertEqual('user-environment.yaml',
+                         self.env.origin('resource_registry',
+                                         'OS::TripleO::Foo'))
+        self.assertEqual('/home/stack/network.yaml',
+                         self.env.origin('resource_registry',
+                                         'OS::TripleO::Bar'))
+        self.assertRaises(KeyError, self.env.origin, 'parameter_defaults',
+                          'Missing')
+
+    def test_parameter_sources(self):
+        self.assertEqual(
+            {'ControllerCount':
+                'user-environments/tripleoclient-parameters.yaml',
+             'NtpServer': '/home/stack/network.yaml',
+             'ExtraConfig': '/home/stack/network.yaml',
+             'DnsServers': '/home/stack/overrides.yaml',
+             'Flags': '/home/stack/scalar.yaml'},
+            self.env.parameter_sources())
+
+    def test_empty(self):
+        env = layered_env.LayeredEnvironment()
+        env.add_layer('empty.yaml', None)
+        self.assertEqual({}, env.to_dict())
+        self.assertEqual({}, env.parameter_sources())
+        self.assertEqual([], env.layer_names)
@@ -0,0 +1,128 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import mock
+import os
+import stat
+
+from tripleoclient import plan_cache
+from tripleoclient.tests import base
+
+
+def _etag(contents):
+    return hashlib.md5(contents).hexdigest()
+
+
+class TestPlanCache(base.TestCase):
+
+    def setUp(self):
+        super(TestPlanCache, self).setUp()
+        self.swift = mock.Mock()
+        self.path = os.path.join(self.temp_homedir, 'cache')
+        self.cache = plan_cache.PlanCache(self.swift, path=self.path)
+
+    def test_get_object_miss_then_hit(self):
+        etag = _etag(b'contents')
+        self.swift.head_object.return_value = {'etag': etag}
+        self.swift.get_object.return_value = ({'etag': etag}, b'contents')
+
+        self.assertEqual(({'etag': etag}, b'contents'),
+                         self.cache.get_object('plan', 'overcloud.yaml'))
+        self.assertEqual(({'etag': etag}, b'contents'),
+                         self.cache.get_object('plan', 'overcloud.yaml'))
+
+        self.swift.get_object.assert_called_once_with('plan',
+                                                      'overcloud.yaml')
+        self.assertEqual(2, self.swift.head_object.call_count)
+        self.assertEqual(1, self.cache.hits)
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'plan', etag)))
+
+    def test_get_object_known_etag(self):
+        etag = _etag(b'contents')
+        self.cache.store('plan', etag, b'contents')
+
+        self.assertEqual(({'etag': etag}, b'contents'),
+                         self.cache.get_object('plan', 'roles_data.yaml',
+                                               etag))
+
+        self.swift.head_object.assert_not_called()
+        self.swift.get_object.assert_not_called()
+
+    def test_get_object_changed(self):
+        old_etag = _etag(b'old')
+        new_etag = _etag(b'new')
+        self.cache.store('plan', old_etag, b'old')
+        self.swift.get_object.return_value = ({'etag': new_etag}, b'new')
+
+        self.assertEqual(b'new', self.cache.get_object(
+            'plan', 'roles_data.yaml', new_etag)[1])
+        self.swift.get_object.assert_called_once_with('plan',
+                                                      'roles_data.yaml')
+
+    def test_store_mismatched_etag(self):
+        self.cache.store('plan', _etag(b'other'), b'contents')
+        self.cache.store('plan', '"manifest-etag"', b'contents')
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_store_private(self):
+        self.cache.store('plan', _etag(b'passwords'), b'passwords')
+
+        entry = os.path.join(self.path, 'plan', _etag(b'passwords'))
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(entry).st_mode))
+        self.assertEqual(0o700, stat.S_IMODE(
+            os.stat(os.path.dirname(entry)).st_mode))
+
+    def test_disabled(self):
+        cache = plan_cache.PlanCache(self.swift, path=self.path,
+                                     enabled=False)
+        etag = _etag(b'contents')
+        self.swift.get_object.return_value = ({'etag': etag}, b'contents')
+
+        cache.get_object('plan', 'overcloud.yaml')
+        cache.get_object('plan', 'overcloud.yaml')
+
+        self.assertEqual({}, cache.etags('plan'))
+        self.assertEqual(2, self.swift.get_object.call_count)
+        self.swift.head_object.assert_not_called()
+        self.swift.get_container.assert_not_called()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_etags(self):
+        self.swift.get_container.return_value = ({}, [
+            {'name': 'overcloud.yaml', 'hash': 'abc'},
+            {'name': 'roles_data.yaml', 'hash': 'def'}])
+
+        self.assertEqual({'overcloud.yaml': 'abc', 'roles_data.yaml': 'def'},
+                         self.cache.etags('plan'))
+        self.swift.get_container.assert_called_once_with(
+            'plan', full_listing=True)
+
+    def test_evict_least_recently_used(self):
+        cache = plan_cache.PlanCache(self.swift, path=self.path, max_size=40)
+        contents = [(b'%d' % i) * 10 for i in range(4)]
+        for i, c in enumerate(contents):
+            cache.store('plan', _etag(c), c)
+            entry = os.path.join(self.path, 'plan', _etag(c))
+            os.utime(entry, (i, i))
+        # Using the oldest entry makes it the most recently used one
+        self.assertEqual(contents[0], cache.lookup('plan', _etag(contents[0])))
+
+        cache.store('plan', _etag(b'x' * 10), b'x' * 10)
+
+        cached = sorted(os.listdir(os.path.join(self.path, 'plan')))
+        self.assertEqual(sorted([_etag(contents[0]), _etag(contents[3]),
+                                 _etag(b'x' * 10)]), cached)
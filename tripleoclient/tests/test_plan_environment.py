@@ -0,0 +1,71 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import yaml
+
+from tripleoclient import plan_environment
+from tripleoclient.tests import base
+
+
+class TestPlanEnvironmentEditor(base.TestCase):
+
+    def setUp(self):
+        super(TestPlanEnvironmentEditor, self).setUp()
+        self.swift = mock.Mock()
+        self.swift.get_object.return_value = (
+            {'etag': 'abc'},
+            'environments:\n- path: overcloud-resource-registry.yaml\n')
+        self.editor = plan_environment.PlanEnvironmentEditor(
+            self.swift, 'overcloud')
+
+    def test_single_write(self):
+        with self.editor as editor:
+            editor.add_environment('user-environment.yaml')
+            editor.set_passwords({'AdminPassword': 'secret'})
+
+        self.swift.get_object.assert_called_once_with(
+            'overcloud', 'plan-environment.yaml')
+        self.swift.put_object.assert_called_once_with(
+            'overcloud', 'plan-environment.yaml', mock.ANY)
+        env = yaml.safe_load(self.swift.put_object.call_args[0][2])
+        self.assertEqual({
+            'environments': [{'path': 'overcloud-resource-registry.yaml'},
+                             {'path': 'user-environment.yaml'}],
+            'passwords': {'AdminPassword': 'secret'}}, env)
+
+    def test_unchanged(self):
+        with self.editor as editor:
+            editor.add_environment('overcloud-resource-registry.yaml')
+
+        self.swift.put_object.assert_not_called()
+
+    def test_edits_applied_when_flushed(self):
+        self.editor.add_environment('user-environment.yaml')
+        self.editor.set_passwords({'AdminPassword': 'secret'})
+        # e.g. the plan update workflow generated passwords meanwhile
+        self.swift.get_object.return_value = (
+            {'etag': 'def'},
+            'passwords:\n  AdminPassword: generated\n'
+            '  NovaPassword: generated\n')
+
+        self.editor.flush()
+
+        env = yaml.safe_load(self.swift.put_object.call_args[0][2])
+        self.assertEqual({
+            'environments': [{'path': 'user-environment.yaml'}],
+            'passwords': {'AdminPassword': 'secret',
+                          'NovaPassword': 'generated'}}, env)
+        self.assertFalse(self.editor.pending)
@@ -15,80 +15,255 @@
 import json
 import mock
 import socket
+import time
 
+from six.moves import queue
+import websocket
+
+from tripleoclient import exceptions
 from tripleoclient import plugin
 from tripleoclient.tests import base
 from tripleoclient.tests import fakes
 
 
+ACK = {"headers": {"status": 200}}
+
+
+def _message(execution_id, **execution):
+    execution['id'] = execution_id
+    return {"body": {"payload": {"status": "RUNNING",
+                                 "execution": execution}}}
+
+
+class FakeConnection(object):
+    """A websocket connection receiving the messages it is given"""
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        # Creating a client waits for three acknowledgements
+        for i in range(3):
+            self.messages.put(ACK)
+        self.sent = []
+        self.timeout = None
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self):
+        try:
+            message = self.messages.get(timeout=self.timeout)
+        except queue.Empty:
+            raise websocket.WebSocketTimeoutException()
+        if isinstance(message, Exception):
+            raise message
+        return json.dumps(message)
+
+    def close(self):
+        self.messages.put(websocket.WebSocketConnectionClosedException())
+
+
 class TestPlugin(base.TestCase):
 
+    def setUp(self):
+        super(TestPlugin, self).setUp()
+        self.clientmgr = mock.MagicMock()
+        self.clientmgr.get_endpoint_for_service_type.return_value = (
+            fakes.WS_URL)
+        self.clientmgr.auth.get_token.return_value = "TOKEN"
+        self.clientmgr.auth_ref.project_id = "ID"
+
+    def make_client(self):
+        client = plugin.make_client(self.clientmgr)
+        self.addCleanup(self.close_websockets, client)
+        return client
+
+    def close_websockets(self, client):
+        for session in client._websockets.values():
+            session.close()
+
     @mock.patch("websocket.create_connection")
     def test_make_client(self, ws_create_connection):
-        clientmgr = mock.MagicMock()
-        clientmgr.get_endpoint_for_service_type.return_value = fakes.WS_URL
-
-        clientmgr.auth.get_token.return_value = "TOKEN"
-        clientmgr.auth_ref.project_id = "ID"
-        ws_create_connection.return_value.recv.return_value = json.dumps({
-            "headers": {
-                "status": 200
-            }
-        })
-        client = plugin.make_client(clientmgr)
+        ws_create_connection.side_effect = lambda url: FakeConnection()
+        client = self.make_client()
 
         websocket = client.messaging_websocket()
-        # The second access should not return the same client:
-        self.assertIsNot(client.messaging_websocket(), websocket)
+        # The second access returns another subscriber to the same
+        # connection
+        other = client.messaging_websocket()
+        self.assertIsNot(other, websocket)
+        self.assertIs(other._session, websocket._session)
 
-        plugin.make_client(clientmgr)
+        self.make_client()
 
-        # And the functions should only be called when the client is created:
-        self.assertEqual(clientmgr.auth.get_token.call_count, 2)
-        self.assertEqual(clientmgr.get_endpoint_for_service_type.call_count, 2)
-        ws_create_connection.assert_called_with("ws://0.0.0.0")
+        # And the functions should only be called when the connection is
+        # created:
+        self.assertEqual(self.clientmgr.auth.get_token.call_count, 1)
+        self.assertEqual(
+            self.clientmgr.get_endpoint_for_service_type.call_count, 1)
+        ws_create_connection.assert_called_once_with("ws://0.0.0.0")
 
-    @mock.patch.object(plugin.WebsocketClient, "recv")
-    @mock.patch("websocket.create_connection")
-    def test_handle_websocket_multiple(self, ws_create_connection, recv_mock):
-
-        send_ack = {
-            "headers": {
-                "status": 200
-            }
-        }
-
-        # Creating the websocket sends three messages and closing sends one.
-        # The one being tested is wrapped between these
-        recv_mock.side_effect = [send_ack, send_ack, send_ack, {
-            "body": {
-                "payload": {
-                    "status": 200,
-                    "message": "Result for IDID",
-                    "execution": {"id": "IDID"},
-                }
-            }
-        }, send_ack]
+        # Other queues have their own connection
+        self.assertIsNot(client.messaging_websocket('other')._session,
+                         websocket._session)
 
-        clientmgr = mock.MagicMock()
-        clientmgr.get_endpoint_for_service_type.return_value = fakes.WS_URL
-        clientmgr.auth.get_token.return_value = "TOKEN"
-        clientmgr.auth_ref.project_id = "ID"
-
-        client = plugin.make_client(clientmgr)
+    @mock.patch("websocket.create_connection")
+    def test_handle_websocket_multiple(self, ws_create_connection):
+        connection = FakeConnection()
+        ws_create_connection.return_value = connection
+        client = self.make_client()
 
         with client.messaging_websocket() as ws:
+            connection.messages.put(_message("IDID"))
             for payload in ws.wait_for_messages():
                 self.assertEqual(payload, {
-                    "status": 200,
-                    "message": "Result for IDID",
+                    "status": "RUNNING",
                     "execution": {"id": "IDID"},
                 })
-                # We only want to test the first message, as there is only one.
-                # The last one, the send_ack will be used by the context
-                # manager when it is closed.
                 break
 
+        self.assertEqual(['authenticate', 'queue_create',
+                          'subscription_create'],
+                         [m['action'] for m in connection.sent])
+        self.assertEqual(set(), client._websockets['tripleo']._subscribers)
+
+    @mock.patch("websocket.create_connection")
+    def test_dispatch_by_execution(self, ws_create_connection):
+        connection = FakeConnection()
+        ws_create_connection.return_value = connection
+        client = self.make_client()
+
+        first = client.messaging_websocket()
+        second = client.messaging_websocket()
+        unwatched = client.messaging_websocket()
+        first.watch("A")
+        second.watch("B")
+        for message in (_message("B"), _message("C", root_execution_id="A"),
+                        _message("A"), _message("D")):
+            connection.messages.put(message)
+
+        self.assertEqual(["C", "A"],
+                         [first.recv(1)['body']['payload']['execution']['id']
+                          for i in range(2)])
+        self.assertEqual(["B"],
+                         [second.recv(1)['body']['payload']['execution']['id']
+                          for i in range(1)])
+        # The messages nobody watches only go to the subscribers which
+        # don't watch any execution
+        self.assertEqual(
+            "D", unwatched.recv(1)['body']['payload']['execution']['id'])
+        self.assertRaises(exceptions.WebSocketTimeout, first.recv, 0.1)
+        self.assertRaises(exceptions.WebSocketTimeout, second.recv, 0.1)
+
+    @mock.patch("websocket.create_connection")
+    def test_watch_after_start(self, ws_create_connection):
+        connection = FakeConnection()
+        ws_create_connection.return_value = connection
+        client = self.make_client()
+
+        watching = client.messaging_websocket()
+        watching.watch("B")
+        # A message about a workflow started before subscribing
+        connection.messages.put(_message("A"))
+        connection.messages.put(_message("B"))
+        self.assertEqual(
+            "B", watching.recv(1)['body']['payload']['execution']['id'])
+
+        late = client.messaging_websocket()
+        other = client.messaging_websocket()
+        connection.messages.put(_message("C"))
+        late.watch("A")
+        other.watch("C")
+
+        # The subscriber watching A gets the message it missed, and drops
+        # the one about C it got before watching
+        self.assertEqual(
+            "A", late.recv(1)['body']['payload']['execution']['id'])
+        self.assertRaises(exceptions.WebSocketTimeout, late.recv, 0.1)
+        # The one watching C doesn't get the message about A
+        self.assertEqual(
+            "C", other.recv(1)['body']['payload']['execution']['id'])
+        self.assertRaises(exceptions.WebSocketTimeout, other.recv, 0.1)
+
+    @mock.patch.object(plugin, "SUBSCRIPTION_CHECK_INTERVAL", 0.01)
+    @mock.patch("websocket.create_connection")
+    def test_renew_subscription(self, ws_create_connection):
+        connection = FakeConnection()
+        ws_create_connection.return_value = connection
+        clock = [0]
+        fake_time = mock.Mock(wraps=time)
+        fake_time.time.side_effect = lambda: clock[0]
+        client = self.make_client()
+
+        with mock.patch.object(plugin, "time", fake_time):
+            with client.messaging_websocket() as ws:
+                clock[0] = plugin.SUBSCRIPTION_TTL / 2 - 1
+                time.sleep(0.1)
+                self.assertEqual(1, self.count_subscriptions(connection))
+
+                clock[0] = plugin.SUBSCRIPTION_TTL / 2
+                for i in range(100):
+                    if self.count_subscriptions(connection) == 2:
+                        break
+                    time.sleep(0.01)
+                self.assertEqual(2, self.count_subscriptions(connection))
+
+                # The response to the renewal isn't taken for a message
+                connection.messages.put(ACK)
+                connection.messages.put(_message("IDID"))
+                self.assertEqual(
+                    "IDID", next(ws.wait_for_messages())['execution']['id'])
+
+    def count_subscriptions(self, connection):
+        return len([m for m in connection.sent
+                    if m['action'] == 'subscription_create'])
+
+    @mock.patch("websocket.create_connection")
+    def test_wait_for_messages_timeout(self, ws_create_connection):
+        ws_create_connection.return_value = FakeConnection()
+        client = self.make_client()
+
+        with client.messaging_websocket() as ws:
+            self.assertRaises(exceptions.WebSocketTimeout, next,
+                              ws.wait_for_messages(timeout=0.01))
+
+    @mock.patch.object(plugin, "RECONNECT_DELAY", 0)
+    @mock.patch("websocket.create_connection")
+    def test_reconnect(self, ws_create_connection):
+        connections = [FakeConnection(), FakeConnection()]
+        ws_create_connection.side_effect = connections
+        client = self.make_client()
+
+        with client.messaging_websocket() as ws:
+            connections[0].messages.put(socket.error())
+            connections[1].messages.put(_message("IDID"))
+            self.assertEqual("IDID",
+                             ws.recv(1)['body']['payload']['execution']['id'])
+
+        self.assertEqual(2, self.clientmgr.auth.get_token.call_count)
+        self.assertEqual(['authenticate', 'queue_create',
+                          'subscription_create'],
+                         [m['action'] for m in connections[1].sent])
+
+    @mock.patch.object(plugin, "RECONNECT_ATTEMPTS", 2)
+    @mock.patch.object(plugin, "RECONNECT_DELAY", 0)
+    @mock.patch("websocket.create_connection")
+    def test_reconnect_failure(self, ws_create_connection):
+        connection = FakeConnection()
+        ws_create_connection.side_effect = [connection, socket.error,
+                                            socket.error, FakeConnection()]
+        client = self.make_client()
+
+        with client.messaging_websocket() as ws:
+            connection.messages.put(socket.error())
+            self.assertRaises(exceptions.WebSocketConnectionError,
+                              ws.recv, 1)
+
+        # The next subscriber gets a new connection
+        self.assertIsNot(ws._session, client.messaging_websocket()._session)
+
     @mock.patch("websocket.create_connection")
     def test_websocket_creation_error(self, ws_create_connection):
 
@@ -104,5 +279,18 @@ class TestPlugin(base.TestCase):
         msg = ("Could not establish a connection to the Zaqar websocket. The "
                "command was sent but the answer could not be read.")
         with mock.patch('tripleoclient.plugin.LOG') as mock_log:
-            self.assertRaises(socket.error, client.messaging_websocket)
+            ws = client.messaging_websocket()
             mock_log.error.assert_called_once_with(msg)
+
+        # The workflows are followed through Mistral instead
+        self.assertIsInstance(ws, plugin.DisconnectedWebsocket)
+        with ws:
+            self.assertRaises(exceptions.WebSocketConnectionError, next,
+                              ws.wait_for_messages())
+
+        # And no connection is attempted again for a while
+        client.messaging_websocket()
+        self.assertEqual(1, ws_create_connection.call_count)
+        with mock.patch.object(plugin, 'CONNECTION_RETRY_INTERVAL', 0):
+            client.messaging_websocket()
+        self.assertEqual(2, ws_create_connection.call_count)
@@ -0,0 +1,116 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+
+from tripleoclient import swift_pool
+from tripleoclient.tests import base
+
+
+class TestConnectionPool(base.TestCase):
+
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        patcher = mock.patch('swiftclient.client.Connection', autospec=True)
+        self.mock_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_connection.side_effect = self._connection
+        self.session = mock.Mock()
+        self.pool = swift_pool.ConnectionPool(
+            'http://swift/v1', 'token', session=self.session, size=1)
+
+    def _connection(self, **kwargs):
+        connection = mock.Mock()
+        connection.url = kwargs['preauthurl']
+        connection.token = kwargs['preauthtoken']
+        return connection
+
+    def test_connection_reused(self):
+        self.pool.head_container('overcloud')
+        self.pool.put_object('overcloud', 'a', 'contents')
+
+        self.mock_connection.assert_called_once_with(
+            preauthurl='http://swift/v1', preauthtoken='token',
+            session=self.session, os_options=None)
+        connection = self.pool._idle[0]
+        connection.head_container.assert_called_once_with('overcloud')
+        connection.put_object.assert_called_once_with(
+            'overcloud', 'a', 'contents')
+
+    def test_extra_connections_closed(self):
+        first = self.pool._acquire()
+        second = self.pool._acquire()
+        self.pool._release(first)
+        self.pool._release(second)
+
+        self.assertEqual([first], self.pool._idle)
+        second.close.assert_called_once_with()
+        first.close.assert_not_called()
+
+    def test_new_token_shared(self):
+        first = self.pool._acquire()
+        second = self.pool._acquire()
+        self.pool._release(second)
+
+        # first got a new token from the session after a 401
+        first.token = 'new-token'
+        self.pool._release(first)
+        self.assertEqual('new-token', self.pool.token)
+
+        self.pool._idle = [second]
+        self.assertIs(second, self.pool._acquire())
+        self.assertEqual('new-token', second.token)
+
+    def test_stats(self):
+        self.pool.head_object('overcloud', 'a')
+        self.pool.head_object('overcloud', 'b')
+
+        count, total, slowest = self.pool.stats.get('head_object')
+        self.assertEqual(2, count)
+        self.assertLessEqual(slowest, total)
+        self.assertIn('head_object: 2 requests', self.pool.stats.summary())
+
+    def test_stats_failed_request(self):
+        connection = self.pool._acquire()
+        connection.delete_object.side_effect = Exception('boom')
+        self.pool._release(connection)
+
+        self.assertRaises(Exception, self.pool.delete_object, 'overcloud', 'a')
+        self.assertEqual(1, self.pool.stats.get('delete_object')[0])
+        self.assertEqual([connection], self.pool._idle)
+
+    def test_get_object_streamed(self):
+        connection = self.pool._acquire()
+        connection.get_object.return_value = ({}, iter([b'a', b'b']))
+        self.pool._release(connection)
+
+        headers, body = self.pool.get_object('overcloud', 'a',
+                                             resp_chunk_size=1)
+        # The connection is in use until the body has been read
+        self.assertEqual([], self.pool._idle)
+        self.assertEqual([b'a', b'b'], list(body))
+        self.assertEqual([connection], self.pool._idle)
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, self.pool, 'not_a_method')
+        self.assertRaises(AttributeError, getattr, self.pool, '_retry')
+
+    def test_close(self):
+        connection = self.pool._acquire()
+        self.pool._release(connection)
+        self.pool.close()
+
+        connection.close.assert_called_once_with()
+        self.assertEqual([], self.pool._idle)
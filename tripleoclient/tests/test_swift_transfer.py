@@ -0,0 +1,165 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import fixtures
+import mock
+import os
+
+from swiftclient import client as swift_client
+from swiftclient import exceptions as swift_exc
+
+from tripleoclient import swift_transfer
+from tripleoclient.tests import base
+
+
+class TestUploadExecutor(base.TestCase):
+
+    def setUp(self):
+        super(TestUploadExecutor, self).setUp()
+        self.swift = mock.Mock()
+        sleep = mock.patch('time.sleep', autospec=True)
+        self.mock_sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_put_object(self):
+        with swift_transfer.UploadExecutor(self.swift, workers=4) as uploader:
+            for i in range(10):
+                uploader.put_object('plan', 'obj%d' % i, 'content')
+
+        self.assertEqual(10, self.swift.put_object.call_count)
+        self.swift.put_object.assert_any_call('plan', 'obj7', 'content')
+        self.assertEqual(10, uploader.stats.count)
+        self.assertEqual(70, uploader.stats.bytes)
+
+    def test_put_file(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(tmp, 'roles_data.yaml')
+        with open(path, 'w') as f:
+            f.write('- name: Controller\n')
+        contents = []
+        self.swift.put_object.side_effect = (
+            lambda container, obj, f: contents.append(f.read()))
+
+        with swift_transfer.UploadExecutor(self.swift) as uploader:
+            uploader.put_file('plan', 'roles_data.yaml', path)
+
+        self.assertEqual(['- name: Controller\n'], contents)
+        self.assertEqual(19, uploader.stats.bytes)
+
+    def test_retry_transient_error(self):
+        self.swift.put_object.side_effect = [
+            swift_exc.ClientException('unavailable', http_status=503),
+            swift_exc.ClientException('timeout'),
+            'etag']
+
+        with swift_transfer.UploadExecutor(self.swift,
+                                           backoff=1) as uploader:
+            future = uploader.put_object('plan', 'obj', 'content')
+
+        self.assertEqual('etag', future.result())
+        self.assertEqual(3, self.swift.put_object.call_count)
+        self.mock_sleep.assert_has_calls([mock.call(1), mock.call(2)])
+        self.assertEqual(2, uploader.stats.retries)
+
+    def test_retries_exhausted(self):
+        self.swift.put_object.side_effect = swift_exc.ClientException(
+            'unavailable', http_status=503)
+
+        uploader = swift_transfer.UploadExecutor(self.swift, retries=2)
+        uploader.put_object('plan', 'obj', 'content')
+
+        self.assertRaises(swift_exc.ClientException, uploader.wait)
+        self.assertEqual(3, self.swift.put_object.call_count)
+        self.assertEqual(1, uploader.stats.errors)
+        uploader.shutdown()
+
+    def test_no_retry_client_error(self):
+        self.swift.put_object.side_effect = swift_exc.ClientException(
+            'not found', http_status=404)
+
+        uploader = swift_transfer.UploadExecutor(self.swift)
+        uploader.put_object('plan', 'obj', 'content')
+
+        self.assertRaises(swift_exc.ClientException, uploader.wait)
+        self.swift.put_object.assert_called_once_with(
+            'plan', 'obj', 'content')
+        self.mock_sleep.assert_not_called()
+        uploader.shutdown()
+
+    @mock.patch('tripleoclient.swift_transfer.LOG')
+    def test_summary_logged(self, mock_log):
+        with swift_transfer.UploadExecutor(self.swift) as uploader:
+            uploader.put_object('plan', 'obj', 'content')
+
+        mock_log.debug.assert_called_once_with(mock.ANY)
+        summary = mock_log.debug.call_args[0][0]
+        self.assertIn('Uploaded 1 objects (7 bytes)', summary)
+
+    def test_connection_per_worker(self):
+        connection = swift_client.Connection(
+            preauthurl='http://swift/v1/AUTH_test', preauthtoken='token')
+        uploader = swift_transfer.UploadExecutor(connection)
+
+        clone = uploader._client()
+
+        self.assertIsNot(connection, clone)
+        self.assertIs(clone, uploader._client())
+        self.assertEqual('http://swift/v1/AUTH_test', clone.url)
+        self.assertEqual('token', clone.token)
+        uploader.shutdown()
+
+
+class TestDownloadExecutor(base.TestCase):
+
+    def setUp(self):
+        super(TestDownloadExecutor, self).setUp()
+        self.swift = mock.Mock()
+
+    def test_get_object(self):
+        self.swift.get_object.return_value = ({'etag': 'abc'}, 'content')
+
+        with swift_transfer.DownloadExecutor(self.swift) as downloader:
+            future = downloader.get_object('plan', 'obj')
+
+        self.assertEqual(({'etag': 'abc'}, 'content'), future.result())
+        self.swift.get_object.assert_called_once_with('plan', 'obj')
+        self.assertEqual(7, downloader.stats.bytes)
+
+    def test_save_object(self):
+        self.swift.get_object.return_value = ({'etag': 'abc'}, b'content')
+        cache = mock.Mock()
+        cache.lookup.return_value = None
+        path = os.path.join(self.temp_homedir, 'obj')
+
+        with swift_transfer.DownloadExecutor(self.swift) as downloader:
+            future = downloader.save_object('plan', 'obj', path, 'abc', cache)
+
+        self.assertEqual(7, future.result())
+        with open(path, 'rb') as f:
+            self.assertEqual(b'content', f.read())
+        cache.store.assert_called_once_with('plan', 'abc', b'content')
+
+    def test_save_object_cached(self):
+        cache = mock.Mock()
+        cache.lookup.return_value = b'cached'
+        path = os.path.join(self.temp_homedir, 'obj')
+
+        with swift_transfer.DownloadExecutor(self.swift) as downloader:
+            downloader.save_object('plan', 'obj', path, 'abc', cache)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(b'cached', f.read())
+        cache.lookup.assert_called_once_with('plan', 'abc')
+        self.swift.get_object.assert_not_called()
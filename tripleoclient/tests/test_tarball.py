@@ -0,0 +1,76 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import io
+import mock
+import os
+import subprocess
+import tarfile
+
+from tripleoclient import tarball
+from tripleoclient.tests import base
+
+
+class TestTarballStream(base.TestCase):
+
+    def setUp(self):
+        super(TestTarballStream, self).setUp()
+        self.tht = os.path.join(self.temp_homedir, 'tht')
+        for path in ('overcloud.j2.yaml', 'puppet/services/keystone.yaml',
+                     '.git/config', 'tools/render.pyc'):
+            path = os.path.join(self.tht, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(path)
+
+    def _members(self, data):
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+            return sorted(m.name for m in tar.getmembers() if m.isfile())
+
+    def test_read_in_chunks(self):
+        with tarball.create_tarball_stream(self.tht) as stream:
+            data = b''.join(iter(lambda: stream.read(16), b''))
+
+        self.assertEqual(['./overcloud.j2.yaml',
+                          './puppet/services/keystone.yaml'],
+                         self._members(data))
+
+    def test_reset(self):
+        with tarball.create_tarball_stream(self.tht) as stream:
+            stream.read(16)
+            stream.reset()
+            data = b''.join(iter(lambda: stream.read(16), b''))
+
+        self.assertEqual(2, len(self._members(data)))
+
+    def test_tar_failure(self):
+        stream = tarball.create_tarball_stream(
+            os.path.join(self.temp_homedir, 'missing'))
+
+        self.assertRaises(subprocess.CalledProcessError,
+                          lambda: list(iter(stream.read, b'')))
+        stream.close()
+
+    def test_extract_to_swift_container(self):
+        swift = mock.Mock()
+        stream = mock.Mock(directory=self.tht)
+
+        tarball.tarball_extract_to_swift_container(swift, stream, 'plan')
+
+        swift.put_object.assert_called_once_with(
+            container='plan', obj='', contents=stream,
+            query_string='extract-archive=tar.gz',
+            headers={'X-Detect-Content-Type': 'true'})
@@ -0,0 +1,161 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+
+from heatclient.common import template_utils
+
+from tripleoclient import template_graph
+from tripleoclient.tests import base
+
+
+TEMPLATES = {
+    'overcloud.yaml': """heat_template_version: pike
+resources:
+  Controller:
+    type: OS::TripleO::Controller
+  Config:
+    type: OS::Heat::SoftwareConfig
+    properties:
+      config: {get_file: scripts/config.sh}
+""",
+    'scripts/config.sh': "#!/bin/sh\n",
+    'controller.yaml': """heat_template_version: pike
+resources:
+  Port:
+    type: ports/noop.yaml
+""",
+    'ports/noop.yaml': "heat_template_version: pike\n",
+    'old-controller.yaml': """heat_template_version: pike
+resources:
+  Config:
+    type: OS::Heat::SoftwareConfig
+    properties:
+      config: {get_file: scripts/old.sh}
+""",
+    'scripts/old.sh': "#!/bin/sh\nexit 1\n",
+    'old.yaml': """resource_registry:
+  OS::TripleO::Controller: old-controller.yaml
+""",
+    'new.yaml': """resource_registry:
+  OS::TripleO::Controller: controller.yaml
+""",
+}
+
+
+class TestTemplateGraph(base.TestCase):
+
+    def setUp(self):
+        super(TestTemplateGraph, self).setUp()
+        self.tht = os.path.join(self.temp_homedir, 'tht')
+        for name, contents in TEMPLATES.items():
+            path = os.path.join(self.tht, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(contents)
+
+        self.env_files, self.env = (
+            template_utils.process_multiple_environments_and_files(
+                [self.path('old.yaml'), self.path('new.yaml')]))
+        self.template_files, self.template = (
+            template_utils.get_template_contents(self.path('overcloud.yaml')))
+        self.files = dict(list(self.template_files.items()) +
+                          list(self.env_files.items()))
+
+    def path(self, name):
+        return os.path.join(self.tht, name)
+
+    def url(self, name):
+        return 'file://' + self.path(name)
+
+    def test_build(self):
+        graph = template_graph.TemplateGraph.build(
+            self.template, self.env, self.files)
+
+        self.assertEqual(set([self.url('scripts/config.sh'),
+                              self.url('controller.yaml')]),
+                         set(graph.roots))
+        self.assertEqual([self.url('ports/noop.yaml')],
+                         graph.edges[self.url('controller.yaml')])
+        self.assertEqual([self.url('scripts/old.sh')],
+                         graph.edges[self.url('old-controller.yaml')])
+        self.assertEqual([], graph.edges[self.url('scripts/config.sh')])
+
+    def test_prune(self):
+        graph = template_graph.TemplateGraph.build(
+            self.template, self.env, self.files)
+
+        pruned = graph.prune(self.files)
+
+        self.assertEqual(set([self.url('scripts/config.sh'),
+                              self.url('controller.yaml'),
+                              self.url('ports/noop.yaml')]),
+                         set(pruned))
+        self.assertEqual(set([self.url('old-controller.yaml'),
+                              self.url('scripts/old.sh')]),
+                         graph.unreachable())
+        summary = graph.summary()
+        self.assertEqual(5, summary['files'])
+        self.assertEqual(3, summary['reachable'])
+        self.assertEqual(2, summary['unreachable'])
+        self.assertEqual(sum(len(self.files[n]) for n in pruned),
+                         summary['reachable_bytes'])
+
+    def test_environment_resources(self):
+        env = {'resource_registry': {
+            'resources': {'Controller': {
+                'OS::TripleO::Controller': self.url('old-controller.yaml'),
+                'hooks': 'pre-create'}}}}
+
+        graph = template_graph.TemplateGraph.build({}, env, self.files)
+
+        self.assertEqual(set([self.url('old-controller.yaml'),
+                              self.url('scripts/old.sh')]),
+                         graph.reachable())
+
+    def test_cycle(self):
+        files = {'a.yaml': '{"heat_template_version": "pike", '
+                           '"resources": {"b": {"type": "b.yaml"}}}',
+                 'b.yaml': '{"heat_template_version": "pike", '
+                           '"resources": {"a": {"type": "a.yaml"}}}'}
+        template = {'resources': {'a': {'type': 'a.yaml'}}}
+
+        graph = template_graph.TemplateGraph.build(template, {}, files)
+
+        self.assertEqual(set(files), graph.reachable())
+
+    def test_prune_files(self):
+        graph, pruned = template_graph.prune_files(
+            self.template, self.env, self.files)
+
+        self.assertEqual(set(pruned), graph.reachable())
+        self.assertEqual(len(self.files), len(graph.sizes))
+        self.assertFalse(os.path.exists(
+            template_graph.index_path('overcloud')))
+
+    def test_save_and_load(self):
+        graph = template_graph.TemplateGraph.build(
+            self.template, self.env, self.files)
+
+        template_graph.save('overcloud', graph)
+
+        self.assertEqual(graph.to_dict(),
+                         template_graph.load('overcloud').to_dict())
+        self.assertTrue(template_graph.index_path('overcloud').startswith(
+            self.temp_homedir))
+
+    def test_load_missing(self):
+        self.assertRaises(IOError, template_graph.load, 'undercloud')
@@ -0,0 +1,171 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import shutil
+
+from tripleoclient import exceptions
+from tripleoclient import template_render
+from tripleoclient.tests import base
+
+
+TEMPLATES = {
+    'roles_data_undercloud.yaml': """- name: Undercloud
+  disable_constraints: true
+- name: Compute
+""",
+    'network_data.yaml': """- name: External
+- name: InternalApi
+  name_lower: internal_api
+- name: Tenant
+  enabled: false
+""",
+    'overcloud.j2.yaml': """{% include 'common.txt' %}
+{% for role in roles %}{{role.name}}: {{networks|length}}
+{% endfor %}""",
+    'common.txt': "# common\n",
+    'puppet/role.role.j2.yaml':
+        "{{role.name}} {{disable_constraints|default(false)}}\n",
+    'puppet/legacy.role.j2.yaml': "{{role}}\n",
+    'network/network.network.j2.yaml': "{{network.name}}\n",
+    'network/ports/port.network.j2.yaml': "{{network.name_lower}}\n",
+    'environments/excluded.j2.yaml': "excluded\n",
+    'j2_excludes.yaml': "name:\n  - environments/excluded.yaml\n",
+    '.git/hidden.j2.yaml': "hidden\n",
+    'tools/tool.j2.yaml': "tool\n",
+    'plain.yaml': "{{not rendered}}\n",
+}
+
+
+class TestRenderer(base.TestCase):
+
+    def setUp(self):
+        super(TestRenderer, self).setUp()
+        self.tht = os.path.join(self.temp_homedir, 'tht')
+        for name, contents in TEMPLATES.items():
+            self.write(name, contents)
+        self.cache_dir = os.path.join(self.temp_homedir, 'cache')
+
+    def write(self, name, contents, root=None):
+        path = os.path.join(root or self.tht, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def read(self, name, root=None):
+        with open(os.path.join(root or self.tht, name)) as f:
+            return f.read()
+
+    def render(self, root=None):
+        renderer = template_render.Renderer(
+            root or self.tht,
+            cache=template_render.RenderCache(self.cache_dir))
+        return renderer.render()
+
+    def test_render(self):
+        self.assertEqual((9, 0), self.render())
+
+        self.assertEqual("# common\nUndercloud: 3\nCompute: 3\n",
+                         self.read('overcloud.yaml'))
+        self.assertEqual("Undercloud True",
+                         self.read('puppet/undercloud-role.yaml'))
+        self.assertEqual("Compute False",
+                         self.read('puppet/compute-role.yaml'))
+        self.assertEqual("Compute", self.read('puppet/compute-legacy.yaml'))
+        self.assertEqual("External", self.read('network/external.yaml'))
+        self.assertEqual("InternalApi",
+                         self.read('network/internal_api.yaml'))
+        self.assertEqual("internal_api",
+                         self.read('network/ports/internal_api.yaml'))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tht, 'network', 'tenant.yaml')))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tht, 'environments', 'excluded.yaml')))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tht, '.git', 'hidden.yaml')))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tht, 'tools', 'tool.yaml')))
+        self.assertEqual("{{not rendered}}\n", self.read('plain.yaml'))
+
+    def test_unchanged_inputs(self):
+        self.render()
+        copy = os.path.join(self.temp_homedir, 'copy')
+        shutil.copytree(self.tht, copy)
+
+        self.assertEqual((0, 9), self.render(copy))
+        self.assertEqual("# common\nUndercloud: 3\nCompute: 3\n",
+                         self.read('overcloud.yaml', copy))
+
+    def test_changed_inputs(self):
+        self.render()
+
+        self.write('common.txt', "# changed\n")
+        self.assertEqual((1, 8), self.render())
+        self.assertEqual("# changed\nUndercloud: 3\nCompute: 3\n",
+                         self.read('overcloud.yaml'))
+
+        self.write('roles_data_undercloud.yaml', "- name: Undercloud\n")
+        self.assertEqual((7, 0), self.render())
+
+    def test_template_directory_first(self):
+        self.write('network/common.txt', "# network\n")
+        self.write('network/nic.j2.yaml', "{% include 'common.txt' %}")
+        self.write('puppet/nic.j2.yaml', "{% include 'common.txt' %}")
+
+        self.render()
+
+        self.assertEqual("# network", self.read('network/nic.yaml'))
+        self.assertEqual("# common", self.read('puppet/nic.yaml'))
+
+        self.write('network/common.txt', "# changed\n")
+        self.assertEqual((1, 10), self.render())
+        self.assertEqual("# changed", self.read('network/nic.yaml'))
+
+    def test_cache_pruned(self):
+        self.render()
+        self.write('roles_data_undercloud.yaml', "- name: Undercloud\n")
+        self.render()
+
+        # The entries of both roles data files are kept
+        self.assertEqual(16, len(os.listdir(self.cache_dir)))
+
+        for name in os.listdir(self.cache_dir):
+            os.utime(os.path.join(self.cache_dir, name), (0, 0))
+        self.assertEqual((0, 7), self.render())
+
+        self.assertEqual(7, len(os.listdir(self.cache_dir)))
+
+    def test_no_cache(self):
+        renderer = template_render.Renderer(self.tht)
+        self.assertEqual((9, 0), renderer.render())
+        self.assertEqual((9, 0), template_render.Renderer(self.tht).render())
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_render_error(self):
+        self.write('broken.j2.yaml', "{% if %}\n")
+
+        self.assertRaises(exceptions.InvalidConfiguration, self.render)
+
+    def test_linked_output(self):
+        # Outputs linked to the original templates are replaced, not
+        # written through
+        original = os.path.join(self.temp_homedir, 'original.yaml')
+        self.write(original, "original\n")
+        os.link(original, os.path.join(self.tht, 'overcloud.yaml'))
+
+        self.render()
+
+        self.assertEqual("original\n", self.read(original))
@@ -0,0 +1,105 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import os
+import sys
+
+import mock
+
+from tripleoclient import command
+from tripleoclient import tracing
+from tripleoclient.tests import base
+from tripleoclient.workflows import base as workflows_base
+
+
+class TestTracing(base.TestCommand):
+
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        self.tracer = tracing.reset()
+        self.mistral = mock.Mock()
+        self.execution = self.mistral.executions.create.return_value
+        self.execution.id = 'IDID'
+        self.mistral.executions.get.return_value.state = 'SUCCESS'
+        self.websocket = mock.Mock()
+        self.websocket.wait_for_messages.return_value = iter([
+            {'execution': {'id': 'SUB'}},
+            {'execution': {'id': 'IDID'}, 'status': 'SUCCESS'}])
+
+    def test_workflow_span(self):
+        execution = workflows_base.start_workflow(
+            self.mistral, 'tripleo.test', {})
+        list(workflows_base.wait_for_messages(self.mistral, self.websocket,
+                                              execution))
+
+        span, = self.tracer.spans
+        # The message of the sub-workflow isn't counted
+        self.assertEqual(('workflow', 'tripleo.test', 'IDID', 1, 'SUCCESS'),
+                         (span.kind, span.name, span.execution_id,
+                          span.messages, span.state))
+        self.assertLessEqual(span.first_message, span.duration)
+
+    def test_action_span(self):
+        result = self.mistral.action_executions.create.return_value
+        result.id = 'ACTION'
+        result.state = 'SUCCESS'
+        result.output = '{"result": "output"}'
+
+        workflows_base.call_action(self.mistral, 'tripleo.test.action')
+
+        span, = self.tracer.spans
+        self.assertEqual(('action', 'tripleo.test.action', 'ACTION',
+                          'SUCCESS'),
+                         (span.kind, span.name, span.execution_id,
+                          span.state))
+        self.assertIsNotNone(span.duration)
+
+    def test_command_trace_file(self):
+        mistral = self.mistral
+        websocket = self.websocket
+
+        class TestCommand(command.Command):
+
+            def take_action(self, parsed_args):
+                execution = workflows_base.start_workflow(
+                    mistral, 'tripleo.test', {})
+                list(workflows_base.wait_for_messages(mistral, websocket,
+                                                      execution))
+
+        cmd = TestCommand(self.app, None)
+        trace_file = os.path.join(self.temp_homedir, 'trace.json')
+        parsed_args = self.check_parser(cmd, ['--trace-file', trace_file],
+                                        [('trace_file', trace_file)])
+
+        with mock.patch('tripleoclient.utils.store_cli_param'):
+            with mock.patch('tripleoclient.constants.'
+                            'TRACE_SUMMARY_DURATION', 0):
+                with mock.patch('tripleoclient.command.print') as mock_print:
+                    cmd.run(parsed_args)
+
+        with open(trace_file) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual(1, len(spans))
+        self.assertEqual({'kind': 'workflow', 'name': 'tripleo.test',
+                          'execution_id': 'IDID', 'messages': 1,
+                          'state': 'SUCCESS'},
+                         dict((k, spans[0][k]) for k in (
+                             'kind', 'name', 'execution_id', 'messages',
+                             'state')))
+        self.assertEqual(sys.stderr, mock_print.call_args[1]['file'])
+        table = str(mock_print.call_args[0][0])
+        self.assertIn('tripleo.test', table)
+        self.assertIn('SUCCESS', table)
@@ -16,9 +16,13 @@
 
 import argparse
 import datetime
+import hashlib
 import mock
 import os.path
+import shutil
+import socket
 import tempfile
+import time
 
 from heatclient import exc as hc_exc
 
@@ -28,6 +32,7 @@ from unittest import TestCase
 import yaml
 
 from tripleoclient import exceptions
+from tripleoclient import layered_env
 from tripleoclient import utils
 
 
@@ -561,6 +566,47 @@ class TestReplaceLinks(TestCase):
             utils.replace_links_in_template_contents(
                 source, self.link_replacement))
 
+    def test_replace_links_bytes(self):
+        # get_file targets are read as bytes by heatclient
+        source = b'#!/bin/bash\nfile:///home/stack/test.sh\n'
+        self.assertIs(
+            source,
+            utils.replace_links_in_template_contents(
+                source, self.link_replacement))
+
+    def test_replace_links_no_link(self):
+        source = (
+            'heat_template_version: "2014-10-16"\n'
+            'resources:\n'
+            '  test_config:\n'
+            '    properties:\n'
+            '      config: {get_file: "file:///home/stack/other.sh"}\n'
+            '    type: OS::Heat::SoftwareConfig\n'
+        )
+        with mock.patch('tripleoclient.yaml_serialization.safe_load') as \
+                mock_load:
+            self.assertEqual(
+                source,
+                utils.replace_links_in_template_contents(
+                    source, self.link_replacement))
+        mock_load.assert_not_called()
+
+    def test_replace_links_in_lists(self):
+        template = {
+            'heat_template_version': '2014-10-16',
+            'resources': {'test_config': {
+                'type': 'OS::Heat::SoftwareConfig',
+                'properties': {'inputs': [
+                    {'get_file': 'file:///home/stack/test.sh'},
+                    {'get_file': 'file:///home/stack/other.sh'}]}}},
+        }
+        result = utils.replace_links_in_template(template,
+                                                 self.link_replacement)
+        self.assertEqual(
+            [{'get_file': 'user-files/home/stack/test.sh'},
+             {'get_file': 'file:///home/stack/other.sh'}],
+            result['resources']['test_config']['properties']['inputs'])
+
     def test_relative_link_replacement(self):
         current_dir = 'user-files/home/stack'
         expected = {
@@ -682,7 +728,47 @@ class ProcessMultipleEnvironments(TestCase):
             mock.call(env_path='/twd/templates/environments/myenv.yaml'),
             mock.call(env_path='/tmp/thtroot42/notouch.yaml'),
             mock.call(env_path='./tmp/thtroot/notouch2.yaml'),
-            mock.call(env_path='../outside.yaml')])
+            mock.call(env_path='../outside.yaml')], any_order=True)
+
+    @mock.patch('heatclient.common.template_utils.'
+                'process_environment_and_files', autospec=True)
+    def test_merge_in_order(self, mock_hc_process):
+        env_paths = ['/tmp/env%d.yaml' % i for i in range(10)]
+
+        def hc_process(env_path):
+            i = env_paths.index(env_path)
+            # The first environments are the last ones to be processed
+            time.sleep((len(env_paths) - i) * 0.01)
+            return ({'file:///tmp/common.yaml': str(i)},
+                    {'parameter_defaults': {'Common': i,
+                                            'Param%d' % i: i}})
+        mock_hc_process.side_effect = hc_process
+
+        files, env = utils.process_multiple_environments(
+            env_paths, self.tht_root, self.user_tht_root)
+
+        self.assertEqual({'file:///tmp/common.yaml': '9'}, files)
+        expected = dict(('Param%d' % i, i) for i in range(10))
+        expected['Common'] = 9
+        self.assertEqual({'parameter_defaults': expected}, env)
+
+    @mock.patch('heatclient.common.template_utils.'
+                'process_environment_and_files', autospec=True)
+    def test_layered_environment(self, mock_hc_process):
+        mock_hc_process.side_effect = [
+            ({}, {'parameter_defaults': {'A': 1, 'B': 1}}),
+            ({}, {'parameter_defaults': {'B': 2}})]
+        environment = layered_env.LayeredEnvironment()
+
+        files, env = utils.process_multiple_environments(
+            ['/tmp/one.yaml', '/tmp/two.yaml'], self.tht_root,
+            self.user_tht_root, workers=1, environment=environment)
+
+        self.assertIs(environment, env)
+        self.assertEqual({'parameter_defaults': {'A': 1, 'B': 2}},
+                         env.to_dict())
+        self.assertEqual({'A': '/tmp/one.yaml', 'B': '/tmp/two.yaml'},
+                         env.parameter_sources())
 
     @mock.patch('heatclient.common.template_utils.'
                 'process_environment_and_files', return_value=({}, {}),
@@ -694,13 +780,14 @@ class ProcessMultipleEnvironments(TestCase):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('heatclient.common.template_format.'
                 'parse', autospec=True, return_value=dict())
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_serialization.safe_dump', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
+    @mock.patch('heatclient.common.template_utils.'
+                'resolve_environment_urls', autospec=True)
     def test_rewrite_env_files(self,
+                               mock_resolve,
                                mock_temp, mock_open,
-                               mock_yaml_load,
                                mock_yaml_dump,
                                mock_hc_templ_parse,
                                mock_hc_env_parse,
@@ -730,7 +817,7 @@ class ProcessMultipleEnvironments(TestCase):
             'OS::Foo::Corge': '/tmp/thtroot/puppet/foo.yaml'
             }
         }
-        mock_yaml_load.return_value = myenv
+        mock_hc_env_parse.return_value = myenv
 
         utils.process_multiple_environments(self.created_env_files,
                                             self.tht_root,
@@ -738,3 +825,141 @@ class ProcessMultipleEnvironments(TestCase):
 
         mock_yaml_dump.assert_has_calls([mock.call(rewritten_env,
                                         default_flow_style=False)])
+        mock_resolve.assert_called_once_with(
+            rewritten_env['resource_registry'], {},
+            'file:///twd/templates')
+
+    def test_rewrite_env_in_memory(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        user_tht_root = os.path.join(tmp, 'user')
+        tht_root = os.path.join(tmp, 'work')
+        os.makedirs(os.path.join(user_tht_root, 'environments'))
+        os.makedirs(os.path.join(tht_root, 'environments'))
+        env = ('resource_registry:\n'
+               '  OS::TripleO::Foo: ../foo.yaml\n'
+               'parameter_defaults:\n'
+               '  Foo: 1\n')
+        for root in (user_tht_root, tht_root):
+            with open(os.path.join(root, 'environments/foo.yaml'), 'w') as f:
+                f.write(env)
+        # foo.yaml is only in the working templates, as if it was rendered
+        with open(os.path.join(tht_root, 'foo.yaml'), 'w') as f:
+            f.write('heat_template_version: pike\n')
+        env_path = os.path.join(user_tht_root, 'environments/foo.yaml')
+
+        files, env = utils.process_multiple_environments(
+            [os.path.relpath(env_path)], tht_root, user_tht_root)
+
+        foo_url = 'file://%s/foo.yaml' % tht_root
+        self.assertEqual({foo_url: '{"heat_template_version": "pike"}'},
+                         files)
+        self.assertEqual({'resource_registry': {'OS::TripleO::Foo': foo_url},
+                          'parameter_defaults': {'Foo': 1}}, env)
+        # The rewritten environment isn't written next to the templates
+        self.assertEqual(['environments', 'foo.yaml'],
+                         sorted(os.listdir(tht_root)))
+
+    @mock.patch('heatclient.common.template_utils.'
+                'process_environment_and_files', autospec=True,
+                side_effect=hc_exc.CommandError)
+    def test_rewrite_env_parsed_like_heat(self, mock_hc_process):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        env_path = os.path.join(tmp, 'env.yaml')
+        with open(env_path, 'w') as f:
+            f.write('resource_registry:\n'
+                    '  OS::TripleO::Foo: OS::Heat::None\n'
+                    'parameter_defaults:\n'
+                    '  Release: 2018-02-01\n')
+
+        files, env = utils.process_multiple_environments(
+            [env_path], self.tht_root, self.user_tht_root)
+
+        # Like heat, dates are not turned into datetime.date
+        self.assertEqual({'Release': '2018-02-01'}, env['parameter_defaults'])
+
+        with open(env_path, 'a') as f:
+            f.write('parameters_defaults:\n'
+                    '  Typo: 1\n')
+        self.assertRaises(ValueError, utils.process_multiple_environments,
+                          [env_path], self.tht_root, self.user_tht_root)
+
+
+class TestDownloadFile(TestCase):
+
+    CONTENTS = b'0123456789' * 10
+    ETAG = hashlib.md5(CONTENTS).hexdigest()
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'plan.tar.gz')
+
+    def _response(self, chunks, code=200, headers=None):
+        response = mock.Mock()
+        response.getcode.return_value = code
+        response.info.return_value = headers or {
+            'Content-Length': str(len(self.CONTENTS)),
+            'ETag': '"%s"' % self.ETAG}
+        response.read.side_effect = chunks + [b'']
+        return response
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    @mock.patch('six.moves.urllib.request.urlopen', autospec=True)
+    def test_download(self, mock_urlopen):
+        mock_urlopen.return_value = self._response(
+            [self.CONTENTS[:64], self.CONTENTS[64:]])
+        progress = mock.Mock()
+
+        utils.download_file('http://swift/tempurl', self.path,
+                            progress=progress)
+
+        self.assertEqual(self.CONTENTS, self._read())
+        progress.assert_has_calls([mock.call(64, 100), mock.call(100, 100)])
+
+    @mock.patch('six.moves.urllib.request.urlopen', autospec=True)
+    def test_resume(self, mock_urlopen):
+        interrupted = self._response([self.CONTENTS[:40]])
+        interrupted.read.side_effect = [self.CONTENTS[:40],
+                                        socket.error('reset')]
+        mock_urlopen.side_effect = [
+            interrupted,
+            self._response([self.CONTENTS[40:]], code=206, headers={
+                'Content-Range': 'bytes 40-99/100'})]
+
+        utils.download_file('http://swift/tempurl', self.path)
+
+        self.assertEqual(self.CONTENTS, self._read())
+        resumed = mock_urlopen.call_args[0][0]
+        self.assertEqual('bytes=40-', resumed.get_header('Range'))
+        self.assertEqual('"%s"' % self.ETAG, resumed.get_header('If-range'))
+
+    @mock.patch('six.moves.urllib.request.urlopen', autospec=True)
+    def test_resume_restarted(self, mock_urlopen):
+        interrupted = self._response([])
+        interrupted.read.side_effect = [b'garbage', socket.error('reset')]
+        mock_urlopen.side_effect = [interrupted,
+                                    self._response([self.CONTENTS])]
+
+        utils.download_file('http://swift/tempurl', self.path)
+
+        self.assertEqual(self.CONTENTS, self._read())
+
+    @mock.patch('six.moves.urllib.request.urlopen', autospec=True)
+    def test_retries_exhausted(self, mock_urlopen):
+        mock_urlopen.side_effect = socket.error('unreachable')
+
+        self.assertRaises(exceptions.DownloadError, utils.download_file,
+                          'http://swift/tempurl', self.path, retries=2)
+        self.assertEqual(3, mock_urlopen.call_count)
+
+    @mock.patch('six.moves.urllib.request.urlopen', autospec=True)
+    def test_checksum_mismatch(self, mock_urlopen):
+        mock_urlopen.return_value = self._response([b'x' * 100])
+
+        self.assertRaises(exceptions.DownloadError, utils.download_file,
+                          'http://swift/tempurl', self.path)
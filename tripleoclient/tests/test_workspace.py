@@ -0,0 +1,88 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import errno
+import mock
+import os
+
+from tripleoclient.tests import base
+from tripleoclient import workspace
+
+
+class TestWorkspace(base.TestCase):
+
+    def setUp(self):
+        super(TestWorkspace, self).setUp()
+        self.src = os.path.join(self.temp_homedir, 'tht')
+        self.dst = os.path.join(self.temp_homedir, 'work', 'tht')
+        os.makedirs(os.path.join(self.src, 'puppet', 'services'))
+        self._write('overcloud.j2.yaml', 'j2')
+        self._write('puppet/services/keystone.yaml', 'keystone')
+        os.symlink('services', os.path.join(self.src, 'puppet', 'link'))
+        os.symlink('keystone.yaml',
+                   os.path.join(self.src, 'puppet', 'services', 'ks.yaml'))
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.src, name), 'w') as f:
+            f.write(contents)
+
+    def _read(self, root, name):
+        with open(os.path.join(root, name)) as f:
+            return f.read()
+
+    def test_build(self):
+        shared = workspace.build(self.src, self.dst)
+
+        self.assertEqual(10, shared)
+        self.assertEqual('keystone', self._read(
+            self.dst, 'puppet/services/keystone.yaml'))
+        self.assertEqual('services', os.readlink(
+            os.path.join(self.dst, 'puppet', 'link')))
+        self.assertEqual('keystone.yaml', os.readlink(
+            os.path.join(self.dst, 'puppet', 'services', 'ks.yaml')))
+
+    def test_build_private(self):
+        shared = workspace.build(self.src, self.dst,
+                                 private=workspace.rendered_templates)
+
+        self.assertEqual(8, shared)
+        self.assertEqual(1, os.stat(
+            os.path.join(self.dst, 'overcloud.j2.yaml')).st_nlink)
+
+    @mock.patch('os.link', autospec=True)
+    @mock.patch('tripleoclient.workspace.fcntl', None)
+    def test_build_copy_fallback(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'Cross-device link')
+
+        shared = workspace.build(self.src, self.dst)
+
+        self.assertEqual(0, shared)
+        # Linking is only attempted once
+        self.assertEqual(1, mock_link.call_count)
+        self.assertEqual('j2', self._read(self.dst, 'overcloud.j2.yaml'))
+
+    @mock.patch('tripleoclient.workspace.fcntl', None)
+    def test_materialize(self):
+        workspace.build(self.src, self.dst)
+        path = os.path.join(self.dst, 'puppet', 'services', 'keystone.yaml')
+
+        workspace.materialize(path)
+        with open(path, 'w') as f:
+            f.write('changed')
+
+        self.assertEqual('keystone', self._read(
+            self.src, 'puppet/services/keystone.yaml'))
+        self.assertEqual('changed', self._read(
+            self.dst, 'puppet/services/keystone.yaml'))
@@ -0,0 +1,84 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+
+from tripleoclient.tests import base
+from tripleoclient import yaml_cache
+from tripleoclient import yaml_serialization
+
+
+class TestParseCache(base.TestCase):
+
+    def setUp(self):
+        super(TestParseCache, self).setUp()
+        self.filename = os.path.join(self.temp_homedir, 'env.yaml')
+        self._write('parameter_defaults:\n  ComputeCount: 1\n')
+        self.cache = yaml_cache.ParseCache()
+
+    def _write(self, contents, mtime=None):
+        with open(self.filename, 'w') as f:
+            f.write(contents)
+        if mtime:
+            os.utime(self.filename, (mtime, mtime))
+
+    def test_load_cached(self):
+        expected = {'parameter_defaults': {'ComputeCount': 1}}
+        self.assertEqual(expected, self.cache.load(self.filename))
+        with mock.patch.object(yaml_serialization, 'safe_load') as mock_load:
+            self.assertEqual(expected, self.cache.load(self.filename))
+        mock_load.assert_not_called()
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_load_returns_copies(self):
+        self.cache.load(self.filename)['parameter_defaults'].clear()
+        self.cache.load(self.filename)['parameter_defaults'].clear()
+        self.assertEqual({'parameter_defaults': {'ComputeCount': 1}},
+                         self.cache.load(self.filename))
+
+    def test_load_modified(self):
+        self._write('parameter_defaults:\n  ComputeCount: 1\n', 1000)
+        self.cache.load(self.filename)
+        self._write('parameter_defaults:\n  ComputeCount: 2\n', 2000)
+        self.assertEqual({'parameter_defaults': {'ComputeCount': 2}},
+                         self.cache.load(self.filename))
+        self.assertEqual(2, self.cache.misses)
+
+    def test_load_missing(self):
+        self.assertRaises(IOError, self.cache.load,
+                          os.path.join(self.temp_homedir, 'missing.yaml'))
+
+    def test_load_from_directory(self):
+        path = os.path.join(self.temp_homedir, 'cache')
+        yaml_cache.ParseCache(path).load(self.filename)
+
+        cache = yaml_cache.ParseCache(path)
+        with mock.patch.object(yaml_serialization, 'safe_load') as mock_load:
+            self.assertEqual({'parameter_defaults': {'ComputeCount': 1}},
+                             cache.load(self.filename))
+        mock_load.assert_not_called()
+        self.assertEqual(1, cache.hits)
+
+    def test_load_from_directory_stale(self):
+        path = os.path.join(self.temp_homedir, 'cache')
+        self._write('parameter_defaults:\n  ComputeCount: 1\n', 1000)
+        yaml_cache.ParseCache(path).load(self.filename)
+        self._write('parameter_defaults:\n  ComputeCount: 2\n', 2000)
+
+        cache = yaml_cache.ParseCache(path)
+        self.assertEqual({'parameter_defaults': {'ComputeCount': 2}},
+                         cache.load(self.filename))
+        self.assertEqual(1, cache.misses)
@@ -0,0 +1,73 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+from six.moves import reload_module
+import yaml
+
+from tripleoclient.tests import base
+from tripleoclient import yaml_serialization
+
+
+class TestYamlSerialization(base.TestCase):
+
+    def test_safe_load(self):
+        self.assertEqual({'parameter_defaults': {'ComputeCount': 1}},
+                         yaml_serialization.safe_load(
+                             'parameter_defaults:\n  ComputeCount: 1\n'))
+
+    def test_safe_load_unsafe_tag(self):
+        self.assertRaises(yaml.YAMLError, yaml_serialization.safe_load,
+                          '!!python/object/apply:os.system ["true"]')
+
+    def test_safe_dump(self):
+        data = {'resource_registry': {'OS::TripleO::Foo': 'foo.yaml'}}
+        self.assertEqual(
+            yaml.safe_dump(data, default_flow_style=False),
+            yaml_serialization.safe_dump(data, default_flow_style=False))
+
+    def test_safe_dump_no_aliases(self):
+        services = ['OS::TripleO::Services::Ntp']
+        data = {'ControllerServices': services, 'ComputeServices': services}
+        self.assertIn('&', yaml_serialization.safe_dump(data))
+        contents = yaml_serialization.safe_dump(data, aliases=False)
+        self.assertNotIn('&', contents)
+        self.assertEqual(data, yaml_serialization.safe_load(contents))
+
+    def test_safe_dump_no_aliases_dumper(self):
+        class Dumper(yaml.SafeDumper):
+            def represent_str(self, data):
+                return self.represent_scalar(
+                    'tag:yaml.org,2002:str', data, style='"')
+
+        Dumper.add_representer(str, Dumper.represent_str)
+        services = ['OS::TripleO::Services::Ntp']
+        data = {'ControllerServices': services, 'ComputeServices': services}
+
+        contents = yaml_serialization.safe_dump(data, aliases=False,
+                                                dumper=Dumper)
+
+        self.assertNotIn('&', contents)
+        self.assertIn('"OS::TripleO::Services::Ntp"', contents)
+
+    def test_without_libyaml(self):
+        self.addCleanup(reload_module, yaml_serialization)
+        with mock.patch.object(yaml, 'CSafeLoader', create=True):
+            # As when PyYAML is built without libyaml
+            del yaml.CSafeLoader
+            reload_module(yaml_serialization)
+        self.assertFalse(yaml_serialization.LIBYAML)
+        self.assertIs(yaml.SafeLoader, yaml_serialization.SafeLoader)
+        self.assertEqual({'a': 1}, yaml_serialization.safe_load('a: 1'))
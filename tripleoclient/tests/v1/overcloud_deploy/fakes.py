@@ -13,6 +13,7 @@
 #   under the License.
 #
 
+import fixtures
 import mock
 from osc_lib.tests import utils
 
@@ -120,10 +121,13 @@ class FakeObjectClient(object):
         self._instance = mock.Mock()
         self.put_object = mock.Mock()
 
-    def get_object(self, *args):
+    def get_object(self, *args, **kwargs):
         return [None, "fake"]
 
-    def get_container(self, *args):
+    def head_object(self, *args, **kwargs):
+        return {}
+
+    def get_container(self, *args, **kwargs):
         return [None, [{"name": "fake"}]]
 
 
@@ -131,6 +135,20 @@ class TestDeployOvercloud(utils.TestCommand):
 
     def setUp(self):
         super(TestDeployOvercloud, self).setUp()
+        # Keep the plan cache, the template graphs and the environment index
+        # out of the real home directory
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.constants.PLAN_CACHE_DIRECTORY',
+            self.useFixture(fixtures.TempDir()).path))
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.constants.TEMPLATE_GRAPH_DIRECTORY',
+            self.useFixture(fixtures.TempDir()).path))
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.constants.ENVIRONMENT_INDEX_FILE',
+            self.useFixture(fixtures.TempDir()).join(
+                'environment-index.json')))
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.environment_index._index', None))
 
         self.app.client_manager.auth_ref = mock.Mock(auth_token="TOKEN")
         self.app.client_manager.baremetal = mock.Mock()
@@ -14,6 +14,7 @@
 #
 
 import fixtures
+import hashlib
 import os
 import shutil
 import six
@@ -25,6 +26,7 @@ import mock
 from osc_lib import exceptions as oscexc
 from swiftclient.exceptions import ClientException as ObjectClientException
 
+from tripleoclient import compiled_env
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient.tests.v1.overcloud_deploy import fakes
@@ -94,7 +96,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 autospec=True)
     @mock.patch('uuid.uuid1', autospec=True)
     @mock.patch('time.time', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_tht_scale(self, mock_copy, mock_time, mock_uuid1,
                        mock_get_template_contents,
                        wait_for_stack_ready_mock,
@@ -206,7 +208,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
     @mock.patch('uuid.uuid1', autospec=True)
     @mock.patch('uuid.uuid4', autospec=True)
     @mock.patch('time.time', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     def test_tht_deploy(self, mock_tmpdir, mock_copy, mock_time,
                         mock_uuid4,
@@ -287,8 +289,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
 
         mock_validate_args.assert_called_once_with(parsed_args)
 
-        mock_tarball.create_tarball.assert_called_with(
-            self.tmp_dir.join('tripleo-heat-templates'), mock.ANY)
+        mock_tarball.create_tarball_stream.assert_called_with(
+            self.tmp_dir.join('tripleo-heat-templates'))
         mock_tarball.tarball_extract_to_swift_container.assert_called_with(
             clients.tripleoclient.object_store, mock.ANY, 'overcloud')
         self.assertFalse(mock_invoke_plan_env_wf.called)
@@ -349,7 +351,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 autospec=True)
     @mock.patch('uuid.uuid1', autospec=True)
     @mock.patch('time.time', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     def test_tht_deploy_with_plan_environment_file(
         self, mock_tmpdir, mock_copy, mock_time, mock_uuid1,
@@ -445,8 +447,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         mock_create_tempest_deployer.assert_called_with()
         mock_validate_args.assert_called_once_with(parsed_args)
 
-        mock_tarball.create_tarball.assert_called_with(
-            '/tmp/tht/tripleo-heat-templates', mock.ANY)
+        mock_tarball.create_tarball_stream.assert_called_with(
+            '/tmp/tht/tripleo-heat-templates')
         mock_tarball.tarball_extract_to_swift_container.assert_called_with(
             clients.tripleoclient.object_store, mock.ANY, 'overcloud')
 
@@ -487,7 +489,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
     @mock.patch('uuid.uuid1', autospec=True)
     @mock.patch('time.time', autospec=True)
     @mock.patch('shutil.rmtree', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     def test_tht_deploy_skip_deploy_identifier(
             self, mock_tmpdir, mock_copy, mock_rm, mock_time,
@@ -581,7 +583,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 autospec=True)
     @mock.patch('heatclient.common.template_utils.get_template_contents',
                 autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_deploy_custom_templates(self, mock_copy,
                                      mock_get_template_contents,
                                      wait_for_stack_ready_mock,
@@ -694,7 +696,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 '_update_parameters', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_environment_dirs(self, mock_copy, mock_deploy_heat,
                               mock_update_parameters, mock_post_config,
                               mock_utils_endpoint, mock_utils_createrc,
@@ -764,7 +766,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 '_update_parameters', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_environment_dirs_env(self, mock_copy, mock_deploy_heat,
                                   mock_update_parameters, mock_post_config,
                                   mock_utils_get_stack, mock_utils_endpoint,
@@ -811,6 +813,81 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         parsed_args = self.check_parser(self.cmd, arglist, verifylist)
         self.cmd.take_action(parsed_args)
 
+    @mock.patch(
+        'tripleoclient.workflows.plan_management.list_deployment_plans',
+        autospec=True)
+    @mock.patch('tripleoclient.workflows.plan_management.tarball',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.create_tempest_deployer_input',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.write_overcloudrc', autospec=True)
+    @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
+    @mock.patch('tripleoclient.utils.get_stack', autospec=True)
+    @mock.patch('tripleoclient.utils.process_multiple_environments',
+                autospec=True)
+    @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
+                '_deploy_postconfig', autospec=True)
+    @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
+                '_update_parameters', autospec=True)
+    @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
+                '_heat_deploy', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
+    def test_compiled_environment(self, mock_copy, mock_deploy_heat,
+                                  mock_update_parameters, mock_post_config,
+                                  mock_process_env, mock_utils_get_stack,
+                                  mock_utils_endpoint, mock_utils_createrc,
+                                  mock_utils_tempest, mock_tarball,
+                                  mock_list_plans):
+
+        clients = self.app.client_manager
+        mock_list_plans.return_value = []
+        workflow_client = clients.workflow_engine
+        workflow_client.action_executions.create.return_value = mock.MagicMock(
+            output='{"result":[]}')
+
+        mock_update_parameters.return_value = {}
+        mock_utils_get_stack.return_value = None
+        mock_utils_endpoint.return_value = 'foo.bar'
+        mock_process_env.side_effect = (
+            lambda env_files, tht_root, user_tht_root, cleanup, environment:
+            ({}, environment))
+
+        test_env = self.tmp_dir.join('foo3.yaml')
+        with open(test_env, 'w') as temp_file:
+            temp_file.write('resource_registry:\n  Test: OS::Heat::None')
+        compiled = compiled_env.CompiledEnvironment(
+            [test_env], {'resource_registry': {'Test': 'OS::Heat::None'}},
+            {}, {test_env: hashlib.sha256(
+                b'resource_registry:\n  Test: OS::Heat::None').hexdigest()},
+            'file:///tmp/compile/')
+        compiled_path = self.tmp_dir.join('compiled.json')
+        compiled.save(compiled_path)
+
+        arglist = ['--templates', '--update-plan-only',
+                   '--compiled-environment', compiled_path]
+        verifylist = [
+            ('templates', '/usr/share/openstack-tripleo-heat-templates/'),
+            ('compiled_environment', compiled_path),
+        ]
+
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        self.cmd.take_action(parsed_args)
+
+        # The environment files aren't processed again
+        self.assertEqual([], mock_process_env.call_args[0][0])
+        env = mock_deploy_heat.call_args[0][8]
+        self.assertEqual({'parameter_defaults': {},
+                          'resource_registry': {'Test': u'OS::Heat::None'}},
+                         env)
+        self.assertEqual([constants.USER_PARAMETERS, compiled_path],
+                         env.layer_names)
+
+        # Until one of them changes
+        with open(test_env, 'a') as temp_file:
+            temp_file.write('\n')
+        self.cmd.take_action(parsed_args)
+        self.assertEqual([test_env], mock_process_env.call_args[0][0])
+
     @mock.patch(
         'tripleoclient.workflows.plan_management.list_deployment_plans',
         autospec=True)
@@ -826,7 +903,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 '_update_parameters', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_environment_dirs_env_files_not_found(self, mock_copy,
                                                   mock_deploy_heat,
                                                   mock_update_parameters,
@@ -890,7 +967,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 '_update_parameters', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_environment_dirs_env_dir_not_found(self, mock_copy,
                                                 mock_deploy_heat,
                                                 mock_update_parameters,
@@ -927,7 +1004,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
     @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_deploy_tripleo_heat_templates', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_rhel_reg_params_provided(self, mock_copytree, mock_deploy_tht,
                                       mock_oc_endpoint,
                                       mock_create_ocrc,
@@ -979,7 +1056,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 autospec=True)
     @mock.patch('heatclient.common.template_utils.get_template_contents',
                 autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     @mock.patch('shutil.rmtree', autospec=True)
     @mock.patch('time.time', autospec=True)
@@ -1219,7 +1296,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
     @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     @mock.patch('shutil.rmtree', autospec=True)
     def test_answers_file(self, mock_rmtree, mock_tmpdir, mock_copy,
@@ -1313,10 +1390,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
             defaults,
             self.cmd._get_default_role_counts(parsed_args))
 
-    @mock.patch("yaml.safe_load")
-    @mock.patch("six.moves.builtins.open")
-    def test_get_default_role_counts_custom_roles(self, mock_open,
-                                                  mock_safe_load):
+    @mock.patch("tripleoclient.yaml_cache.load")
+    def test_get_default_role_counts_custom_roles(self, mock_load):
         parsed_args = mock.Mock()
         roles_data = [
             {'name': 'ControllerApi', 'CountDefault': 3},
@@ -1325,7 +1400,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
             {'name': 'ObjectStorage', 'CountDefault': 0},
             {'name': 'BlockStorage'}
         ]
-        mock_safe_load.return_value = roles_data
+        mock_load.return_value = roles_data
         role_counts = {
             'ControllerApiCount': 3,
             'ControllerPcmkCount': 3,
@@ -1349,7 +1424,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 'process_environment_and_files', autospec=True)
     @mock.patch('heatclient.common.template_utils.get_template_contents',
                 autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_ntp_server_mandatory(self, mock_copy,
                                   mock_get_template_contents,
                                   mock_process_env,
@@ -1418,7 +1493,7 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 autospec=True)
     @mock.patch('uuid.uuid1', autospec=True)
     @mock.patch('time.time', autospec=True)
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_tht_deploy_with_ntp(self, mock_copy, mock_time,
                                  mock_uuid1,
                                  mock_get_template_contents,
@@ -1768,19 +1843,72 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         # Set up the client mocks
         self.cmd._setup_clients(mock.Mock())
 
-        dirname = '/tmp/tht-missing'
-
-        mock_open = mock.mock_open()
-        mock_makedirs = mock.Mock()
-        builtin_mod = six.moves.builtins.__name__
-
-        with mock.patch('os.makedirs', mock_makedirs):
-            with mock.patch('%s.open' % builtin_mod, mock_open):
-                self.cmd._download_missing_files_from_plan(dirname,
-                                                           'overcast')
-
-        mock_makedirs.assert_called_with(dirname)
-        mock_open.assert_called()
+        dirname = self.tmp_dir.join('tht-missing')
+        os.makedirs(os.path.join(dirname, 'puppet'))
+        with open(os.path.join(dirname, 'present.yaml'), 'w') as f:
+            f.write('present')
+
+        object_client = mock.Mock()
+        object_client.get_container.return_value = (
+            {}, [{'name': 'present.yaml'}, {'name': 'overcloud.yaml'},
+                 {'name': 'puppet/controller-role.yaml'}])
+        object_client.get_object.side_effect = (
+            lambda container, obj: ({'etag': obj + '-etag'},
+                                    obj + ' contents'))
+        self.cmd.object_client = object_client
+
+        self.cmd._download_missing_files_from_plan(dirname, 'overcast')
+
+        object_client.get_object.assert_has_calls([
+            mock.call('overcast', 'overcloud.yaml'),
+            mock.call('overcast', 'puppet/controller-role.yaml'),
+        ], any_order=True)
+        self.assertEqual(2, object_client.get_object.call_count)
+        with open(os.path.join(dirname, 'puppet',
+                               'controller-role.yaml')) as f:
+            self.assertEqual('puppet/controller-role.yaml contents',
+                             f.read())
+
+    def test_download_missing_files_from_plan_cached(self):
+        self.cmd._download_missing_files_from_plan = self.real_download_missing
+        self.cmd._setup_clients(mock.Mock(no_plan_cache=False))
+        etag = hashlib.md5(b'rendered').hexdigest()
+        object_client = mock.Mock()
+        object_client.get_container.return_value = (
+            {}, [{'name': 'overcloud.yaml', 'hash': etag}])
+        object_client.get_object.return_value = ({'etag': etag}, b'rendered')
+        self.cmd.object_client = object_client
+
+        first = self.tmp_dir.join('first')
+        self.cmd._download_missing_files_from_plan(first, 'overcast')
+        object_client.get_object.assert_called_once_with(
+            'overcast', 'overcloud.yaml')
+
+        # The second deploy finds the unchanged file in the cache
+        object_client.get_object.reset_mock()
+        second = self.tmp_dir.join('second')
+        self.cmd._download_missing_files_from_plan(second, 'overcast')
+
+        object_client.get_object.assert_not_called()
+        with open(os.path.join(second, 'overcloud.yaml')) as f:
+            self.assertEqual('rendered', f.read())
+
+    def test_download_missing_files_from_plan_no_cache(self):
+        self.cmd._download_missing_files_from_plan = self.real_download_missing
+        self.cmd._setup_clients(mock.Mock(no_plan_cache=True))
+        etag = hashlib.md5(b'rendered').hexdigest()
+        object_client = mock.Mock()
+        object_client.get_container.return_value = (
+            {}, [{'name': 'overcloud.yaml', 'hash': etag}])
+        object_client.get_object.return_value = ({'etag': etag}, b'rendered')
+        self.cmd.object_client = object_client
+
+        self.cmd._download_missing_files_from_plan(
+            self.tmp_dir.join('first'), 'overcast')
+        self.cmd._download_missing_files_from_plan(
+            self.tmp_dir.join('second'), 'overcast')
+
+        self.assertEqual(2, object_client.get_object.call_count)
 
 
 class TestArgumentValidation(fakes.TestDeployOvercloud):
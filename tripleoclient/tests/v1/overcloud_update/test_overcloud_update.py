@@ -43,8 +43,8 @@ class TestOvercloudUpdatePrepare(fakes.TestOvercloudUpdatePrepare):
     @mock.patch('tripleoclient.workflows.package_update.update',
                 autospec=True)
     @mock.patch('os.path.abspath')
-    @mock.patch('yaml.load')
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_deploy_tripleo_heat_templates', autospec=True)
@@ -79,8 +79,8 @@ class TestOvercloudUpdatePrepare(fakes.TestOvercloudUpdatePrepare):
                 autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('os.path.abspath')
-    @mock.patch('yaml.load')
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_deploy_tripleo_heat_templates', autospec=True)
     def test_update_failed(self, mock_deploy, mock_copy, mock_yaml,
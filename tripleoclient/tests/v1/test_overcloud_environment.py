@@ -0,0 +1,79 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+import os
+
+import mock
+from osc_lib import exceptions as oscexc
+from swiftclient import exceptions as swift_exc
+
+from tripleoclient import compiled_env
+from tripleoclient import constants
+from tripleoclient.tests import base
+from tripleoclient.v1 import overcloud_environment
+
+
+class TestCompileEnvironment(base.TestCommand):
+
+    def setUp(self):
+        super(TestCompileEnvironment, self).setUp()
+        self.cmd = overcloud_environment.CompileEnvironment(self.app, None)
+        self.object_client = mock.Mock()
+        self.app.client_manager.tripleoclient.object_store = (
+            self.object_client)
+
+    @mock.patch('tripleoclient.compiled_env.compile_environments',
+                autospec=True)
+    @mock.patch('tripleoclient.workflows.plan_management.'
+                'download_missing_files', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
+    def test_compile(self, mock_build, mock_download, mock_compile):
+        env_dir = os.path.join(self.temp_homedir, 'environments')
+        output = os.path.join(self.temp_homedir, 'compiled.json')
+        mock_compile.return_value = compiled_env.CompiledEnvironment(
+            ['b.yaml'], {'parameter_defaults': {}}, {}, {},
+            'file:///tmp/tht/')
+
+        arglist = ['--templates', '/home/stack/tht', '--stack', 'overcast',
+                   '--environment-directory', env_dir, '-e', 'b.yaml',
+                   '-o', output]
+        verifylist = [('templates', '/home/stack/tht'),
+                      ('stack', 'overcast'),
+                      ('environment_files', ['b.yaml']),
+                      ('output_file', output)]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        self.cmd.take_action(parsed_args)
+
+        work_dir = mock_build.call_args[0][1]
+        self.assertEqual('/home/stack/tht', mock_build.call_args[0][0])
+        self.assertFalse(os.path.exists(work_dir))
+        mock_download.assert_called_once_with(
+            self.object_client, 'overcast', work_dir, mock.ANY)
+        mock_compile.assert_called_once_with(
+            ['b.yaml'], work_dir, '/home/stack/tht',
+            [os.path.expanduser(constants.DEFAULT_ENV_DIRECTORY), env_dir])
+        loaded = compiled_env.CompiledEnvironment.load(output)
+        self.assertEqual(mock_compile.return_value.hash, loaded.hash)
+
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
+    def test_compile_missing_plan(self, mock_build):
+        self.object_client.get_container.side_effect = (
+            swift_exc.ClientException('Container GET failed',
+                                      http_status=404))
+        parsed_args = self.check_parser(self.cmd, ['--stack', 'overcast'],
+                                        [('stack', 'overcast')])
+
+        error = self.assertRaises(oscexc.CommandError,
+                                  self.cmd.take_action, parsed_args)
+
+        self.assertIn('overcast', str(error))
+        self.assertFalse(os.path.exists(mock_build.call_args[0][1]))
@@ -103,6 +103,30 @@ class TestOvercloudDeletePlan(utils.TestCommand):
                       workflow_input={'container': 'test-plan2'}),
         ], any_order=True)
 
+    def test_delete_multiple_plans_failure(self):
+        argslist = ['test-plan1', 'test-plan2']
+        verifylist = [('plans', ['test-plan1', 'test-plan2'])]
+        parsed_args = self.check_parser(self.cmd, argslist, verifylist)
+
+        def create(workflow, workflow_input):
+            if workflow_input['container'] == 'test-plan1':
+                raise RuntimeError('plan1 failure')
+            return mock.Mock()
+        self.workflow.executions.create.side_effect = create
+
+        self.websocket.wait_for_messages.return_value = iter([{
+            "execution": {"id": "IDID"},
+            "status": "SUCCESS"
+        }])
+
+        error = self.assertRaises(exceptions.WorkflowServiceError,
+                                  self.cmd.take_action, parsed_args)
+
+        # The other plan is deleted all the same
+        self.assertEqual(2, self.workflow.executions.create.call_count)
+        self.assertEqual('Exception deleting plans: test-plan1: plan1 '
+                         'failure', str(error))
+
 
 class TestOvercloudCreatePlan(utils.TestCommand):
 
@@ -420,7 +444,9 @@ class TestOvercloudExportPlan(utils.TestCommand):
 
         # Mock urlopen
         f = mock.Mock()
-        f.read.return_value = 'tarball contents'
+        f.getcode.return_value = 200
+        f.info.return_value = {'Content-Length': '16'}
+        f.read.side_effect = [b'tarball contents', b'']
         urlopen_patcher = mock.patch('six.moves.urllib.request.urlopen',
                                      return_value=f)
         self.mock_urlopen = urlopen_patcher.start()
@@ -0,0 +1,60 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+import fixtures
+import mock
+import six
+
+from osc_lib import exceptions
+
+from tripleoclient import template_graph
+from tripleoclient.tests import base
+from tripleoclient.v1 import overcloud_templates
+
+
+class TestShowTemplateGraph(base.TestCommand):
+
+    def setUp(self):
+        super(TestShowTemplateGraph, self).setUp()
+        self.cmd = overcloud_templates.ShowTemplateGraph(self.app, None)
+        self.stdout = self.useFixture(
+            fixtures.MonkeyPatch('sys.stdout', six.StringIO())).new_value
+
+    def test_show(self):
+        graph = template_graph.TemplateGraph(
+            roots=['overcloud.yaml'],
+            edges={'overcloud.yaml': ['nested.yaml'], 'nested.yaml': [],
+                   'unused.yaml': []},
+            sizes={'overcloud.yaml': 100, 'nested.yaml': 20,
+                   'unused.yaml': 5})
+        template_graph.save('overcloud', graph)
+
+        parsed_args = self.check_parser(self.cmd, ['--unreachable'],
+                                        [('stack', 'overcloud'),
+                                         ('unreachable', True)])
+        self.cmd.take_action(parsed_args)
+
+        output = self.stdout.getvalue()
+        self.assertIn("overcloud.yaml (100 bytes)\n    -> nested.yaml\n",
+                      output)
+        self.assertIn("unused.yaml (5 bytes, unreachable)", output)
+        self.assertIn("Reachable: 2 files, 120 bytes", output)
+        self.assertIn("Unreachable: 1 files, 5 bytes", output)
+
+    @mock.patch('tripleoclient.template_graph.load', autospec=True,
+                side_effect=IOError('No such file'))
+    def test_show_missing(self, mock_load):
+        parsed_args = self.check_parser(self.cmd, ['--stack', 'other'],
+                                        [('stack', 'other')])
+        self.assertRaises(exceptions.CommandError,
+                          self.cmd.take_action, parsed_args)
+        mock_load.assert_called_once_with('other')
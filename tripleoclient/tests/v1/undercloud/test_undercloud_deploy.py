@@ -13,6 +13,7 @@
 #   under the License.
 #
 
+import fixtures
 import mock
 import os
 
@@ -34,6 +35,10 @@ class TestDeployUndercloud(TestPluginV1):
 
     def setUp(self):
         super(TestDeployUndercloud, self).setUp()
+        # Keep the template graphs out of the real home directory
+        self.useFixture(fixtures.MonkeyPatch(
+            'tripleoclient.constants.TEMPLATE_GRAPH_DIRECTORY',
+            self.useFixture(fixtures.TempDir()).path))
 
         # Get the command object to test
         self.cmd = undercloud_deploy.DeployUndercloud(self.app, None)
@@ -54,7 +59,7 @@ class TestDeployUndercloud(TestPluginV1):
     @mock.patch('os.chmod')
     @mock.patch('os.path.exists')
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_serialization.safe_dump')
     def test_update_passwords_env_init(self, mock_dump, mock_pw,
                                        mock_exists, mock_chmod):
         pw_dict = {"GeneratedPassword": 123}
@@ -81,7 +86,7 @@ class TestDeployUndercloud(TestPluginV1):
     @mock.patch('os.chmod')
     @mock.patch('os.path.exists')
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_serialization.safe_dump')
     def test_update_passwords_env_update(self, mock_dump, mock_pw,
                                          mock_exists, mock_chmod):
         pw_dict = {"GeneratedPassword": 123}
@@ -150,7 +155,7 @@ class TestDeployUndercloud(TestPluginV1):
             mock.call(env_path='/twd/templates/puppet/foo.yaml'),
             mock.call(env_path='/twd/templates/environments/myenv.yaml'),
             mock.call(env_path='/tmp/thtroot42/notouch.yaml'),
-            mock.call(env_path='../outside.yaml')])
+            mock.call(env_path='../outside.yaml')], any_order=True)
 
     @mock.patch('heatclient.common.template_utils.'
                 'process_environment_and_files', return_value=({}, {}),
@@ -164,11 +169,14 @@ class TestDeployUndercloud(TestPluginV1):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('tripleoclient.v1.undercloud_deploy.DeployUndercloud.'
                 '_setup_heat_environments', autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_serialization.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_serialization.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
+    @mock.patch('heatclient.common.template_utils.'
+                'resolve_environment_urls', autospec=True)
     def test_deploy_tripleo_heat_templates_rewrite(self,
+                                                   mock_resolve,
                                                    mock_temp, mock_open,
                                                    mock_yaml_load,
                                                    mock_yaml_dump,
@@ -206,6 +214,7 @@ class TestDeployUndercloud(TestPluginV1):
             }
         }
         mock_yaml_load.return_value = myenv
+        mock_hc_env_parse.return_value = myenv
 
         mock_setup_heat_envs.return_value = [
             './inside.yaml', '/tmp/thtroot/abs.yaml',
@@ -215,8 +224,12 @@ class TestDeployUndercloud(TestPluginV1):
 
         self.cmd._deploy_tripleo_heat_templates(self.orc, parsed_args)
 
+        # Without --cleanup the rewritten environment is kept for
+        # inspection, but it isn't parsed again
         mock_yaml_dump.assert_has_calls([mock.call(rewritten_env,
                                         default_flow_style=False)])
+        mock_resolve.assert_called_once_with(
+            rewritten_env['resource_registry'], {}, 'file:///twd/templates')
 
     @mock.patch('heatclient.common.template_utils.'
                 'process_environment_and_files', return_value=({}, {}),
@@ -228,13 +241,14 @@ class TestDeployUndercloud(TestPluginV1):
                 'process_multiple_environments', autospec=True)
     @mock.patch('tripleoclient.v1.undercloud_deploy.DeployUndercloud.'
                 '_update_passwords_env', autospec=True)
-    @mock.patch('subprocess.check_call', autospec=True)
+    @mock.patch('tripleoclient.template_render.Renderer.render',
+                autospec=True, return_value=(0, 0))
     @mock.patch('tempfile.mkdtemp', autospec=True, return_value='/twd')
-    @mock.patch('shutil.copytree', autospec=True)
+    @mock.patch('tripleoclient.workspace.build', autospec=True)
     def test_setup_heat_environments(self,
                                      mock_copy,
                                      mock_mktemp,
-                                     mock_exec,
+                                     mock_render,
                                      mock_update_pass_env,
                                      mock_process_multiple_environments,
                                      mock_hc_get_templ_cont,
@@ -267,3 +281,7 @@ class TestDeployUndercloud(TestPluginV1):
         environment = self.cmd._setup_heat_environments(parsed_args)
 
         self.assertEqual(environment, expected_env)
+        renderer = mock_render.call_args[0][0]
+        self.assertEqual('/twd/templates', renderer.tht_root)
+        self.assertEqual('/twd/templates/roles_data_undercloud.yaml',
+                         renderer.roles_path)
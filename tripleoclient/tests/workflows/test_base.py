@@ -16,6 +16,7 @@ import mock
 
 from osc_lib.tests import utils
 
+from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient.workflows import base
 
@@ -42,8 +43,51 @@ class TestBaseWorkflows(utils.TestCommand):
 
         self.assertEqual([payload_a, payload_b], messages)
 
-        self.assertFalse(mistral.executions.get.called)
-        websocket.wait_for_messages.assert_called_with(timeout=None)
+        # The messages are enough, the execution isn't looked up
+        mistral.executions.get.assert_not_called()
+        websocket.wait_for_messages.assert_called_with(
+            timeout=constants.WEBSOCKET_QUIET_TIMEOUT)
+
+    def test_wait_for_messages_no_state_checks(self):
+        payloads = [{'execution': {'id': 1}} for i in range(4)]
+
+        mistral = mock.Mock()
+        websocket = mock.Mock()
+        websocket.wait_for_messages.return_value = iter(payloads)
+        execution = mock.Mock()
+        execution.id = 1
+
+        messages = list(base.wait_for_messages(mistral, websocket, execution))
+
+        self.assertEqual(payloads, messages)
+        mistral.executions.get.assert_not_called()
+
+    def test_wait_for_messages_gap(self):
+        payload = {'execution': {'id': 1}}
+
+        mistral = mock.Mock()
+        mistral.executions.get.return_value = mock.Mock(
+            state='ERROR', id=1, state_info='Broken', output='{}')
+
+        def wait_for_messages():
+            yield payload
+            raise exceptions.WebSocketTimeout()
+        websocket = mock.Mock()
+        websocket.wait_for_messages.side_effect = [
+            wait_for_messages(), exceptions.WebSocketTimeout]
+        execution = mock.Mock()
+        execution.id = 1
+
+        messages = base.wait_for_messages(mistral, websocket, execution)
+
+        self.assertEqual(payload, next(messages))
+        mistral.executions.get.assert_not_called()
+        # The state is looked up once the messages stop. The execution
+        # ended without sending its last message.
+        self.assertEqual([{'execution': {'id': 1}, 'status': 'FAILED',
+                           'message': 'Broken'}], list(messages))
+        self.assertEqual([mock.call(1)],
+                         mistral.executions.get.call_args_list)
 
     def test_wait_for_messages_timeout(self):
         mistral = mock.Mock()
@@ -52,12 +96,136 @@ class TestBaseWorkflows(utils.TestCommand):
         execution = mock.Mock()
         execution.id = 1
 
-        messages = base.wait_for_messages(mistral, websocket, execution)
+        messages = base.wait_for_messages(mistral, websocket, execution, 0)
 
         self.assertRaises(exceptions.WebSocketTimeout, list, messages)
 
         self.assertTrue(mistral.executions.get.called)
-        websocket.wait_for_messages.assert_called_with(timeout=None)
+        websocket.wait_for_messages.assert_called_with(timeout=0)
+
+    @mock.patch('time.sleep')
+    def test_wait_for_messages_quiet(self, mock_sleep):
+        mistral = mock.Mock()
+        running = mock.Mock(state='RUNNING')
+        finished = mock.Mock(state='SUCCESS', id=1)
+        mistral.executions.get.side_effect = [running, finished, finished]
+        payload = {'execution': {'id': 1}, 'status': 'SUCCESS',
+                   'plans': ['overcloud']}
+        websocket = mock.Mock()
+        websocket.wait_for_messages.side_effect = [
+            exceptions.WebSocketTimeout, exceptions.WebSocketTimeout,
+            iter([payload])]
+        execution = mock.Mock()
+        execution.id = 1
+
+        messages = list(base.wait_for_messages(mistral, websocket, execution))
+
+        # The last message is still waited for once the execution finished
+        self.assertEqual([payload], messages)
+        # The websocket is waited on for longer after each quiet period
+        self.assertEqual(
+            [mock.call(timeout=constants.WEBSOCKET_QUIET_TIMEOUT),
+             mock.call(timeout=min(constants.WEBSOCKET_QUIET_TIMEOUT * 2,
+                                   constants.WORKFLOW_POLL_MAX_INTERVAL)),
+             mock.call(timeout=constants.WEBSOCKET_DRAIN_TIMEOUT)],
+            websocket.wait_for_messages.call_args_list)
+
+    @mock.patch('time.sleep')
+    def test_wait_for_messages_quiet_no_last_message(self, mock_sleep):
+        mistral = mock.Mock()
+        mistral.executions.get.return_value = mock.Mock(
+            state='SUCCESS', id=1, output='{"plans": ["overcloud"]}',
+            state_info=None)
+        websocket = mock.Mock()
+        websocket.wait_for_messages.side_effect = exceptions.WebSocketTimeout
+        execution = mock.Mock()
+        execution.id = 1
+
+        messages = list(base.wait_for_messages(mistral, websocket, execution))
+
+        # The last message is made up once it was waited for
+        self.assertEqual([{'execution': {'id': 1}, 'status': 'SUCCESS',
+                           'plans': ['overcloud'], 'message': ''}],
+                         messages)
+        self.assertEqual(
+            [mock.call(timeout=constants.WEBSOCKET_QUIET_TIMEOUT),
+             mock.call(timeout=constants.WEBSOCKET_DRAIN_TIMEOUT)],
+            websocket.wait_for_messages.call_args_list)
+        self.assertEqual(1, mistral.executions.get.call_count)
+
+    @mock.patch('time.sleep')
+    def test_wait_for_messages_unavailable(self, mock_sleep):
+        mistral = mock.Mock()
+        running = mock.Mock(state='RUNNING')
+        failed = mock.Mock(state='ERROR', id=1, state_info='Broken',
+                           output='{}')
+        mistral.executions.get.side_effect = [running, running, failed]
+        websocket = mock.Mock()
+        websocket.wait_for_messages.side_effect = (
+            exceptions.WebSocketConnectionError)
+        execution = mock.Mock()
+        execution.id = 1
+
+        messages = list(base.wait_for_messages(mistral, websocket, execution))
+
+        self.assertEqual([{'execution': {'id': 1}, 'status': 'FAILED',
+                           'message': 'Broken'}], messages)
+        self.assertEqual(1, websocket.wait_for_messages.call_count)
+        self.assertEqual([mock.call(constants.WORKFLOW_POLL_INTERVAL),
+                          mock.call(constants.WORKFLOW_POLL_INTERVAL * 2),
+                          mock.call(constants.WORKFLOW_POLL_INTERVAL * 4)],
+                         mock_sleep.call_args_list)
+
+    def test_run_workflows(self):
+        clients = mock.Mock()
+
+        def create(identifier, workflow_input):
+            execution = mock.Mock()
+            execution.id = workflow_input['name']
+            return execution
+        clients.workflow_engine.executions.create.side_effect = create
+
+        def messaging_websocket():
+            websocket = mock.MagicMock()
+            websocket.__enter__.return_value = websocket
+
+            def wait_for_messages(timeout=None):
+                execution_id = websocket.watch.call_args[0][0]
+                if execution_id == 'broken':
+                    raise RuntimeError('broken')
+                # e.g. a message about another execution on a queue shared
+                # with an older client
+                yield {'execution': {'id': 'other'}, 'status': 'RUNNING'}
+                yield {'execution': {'id': 'sub',
+                                     'root_execution_id': execution_id},
+                       'status': 'RUNNING'}
+                yield {'execution': {'id': execution_id},
+                       'status': 'SUCCESS'}
+            websocket.wait_for_messages.side_effect = wait_for_messages
+            return websocket
+        clients.tripleoclient.messaging_websocket.side_effect = (
+            messaging_websocket)
+        messages = []
+        started = []
+
+        results = base.run_workflows(
+            clients, [(name, 'tripleo.test', {'name': name})
+                      for name in ('a', 'broken', 'b')],
+            on_message=lambda key, payload: messages.append(
+                (key, payload['execution']['id'])),
+            on_start=started.append)
+
+        self.assertEqual(['a', 'broken', 'b'], [r.key for r in results])
+        self.assertEqual({'execution': {'id': 'a'}, 'status': 'SUCCESS'},
+                         results[0].payload)
+        self.assertIsNone(results[0].error)
+        self.assertEqual('broken', results[1].execution.id)
+        self.assertIsNone(results[1].payload)
+        self.assertIsInstance(results[1].error, RuntimeError)
+        self.assertIsNone(results[2].error)
+        self.assertEqual([('a', 'a'), ('a', 'sub'), ('b', 'b'), ('b', 'sub')],
+                         sorted(messages))
+        self.assertEqual(['a', 'b', 'broken'], sorted(started))
 
     def test_call_action_success(self):
         mistral = mock.Mock()
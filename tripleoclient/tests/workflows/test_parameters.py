@@ -59,7 +59,7 @@ class TestParameterWorkflows(utils.TestCommand):
             'tripleo.plan_management.v1.get_passwords',
             workflow_input={'container': 'container-name'})
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
     @mock.patch("six.moves.builtins.open")
     def test_invoke_plan_env_workflows(self, mock_open,
                                        mock_safe_load):
@@ -92,7 +92,7 @@ class TestParameterWorkflows(utils.TestCommand):
                 'user_inputs': {
                     'num_phy_cores_per_numa_node_for_pmd': 2}})
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
     @mock.patch("six.moves.builtins.open")
     def test_invoke_plan_env_workflow_failed(self, mock_open,
                                              mock_safe_load):
@@ -125,7 +125,7 @@ class TestParameterWorkflows(utils.TestCommand):
                 'user_inputs': {
                     'num_phy_cores_per_numa_node_for_pmd': 2}})
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
     @mock.patch("six.moves.builtins.open")
     def test_invoke_plan_env_workflows_no_workflow_params(
             self, mock_open, mock_safe_load):
@@ -139,7 +139,7 @@ class TestParameterWorkflows(utils.TestCommand):
 
         self.workflow.executions.create.assert_not_called()
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_serialization.safe_load')
     @mock.patch("six.moves.builtins.open")
     def test_invoke_plan_env_workflows_no_plan_env_file(
             self, mock_open, mock_safe_load):
@@ -12,12 +12,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import fixtures
+import hashlib
 import mock
+import os
 
 from osc_lib.tests import utils
 from swiftclient import exceptions as swift_exc
 
 from tripleoclient import exceptions
+from tripleoclient import plan_environment
 from tripleoclient.tests import base
 from tripleoclient.workflows import plan_management
 
@@ -210,6 +214,20 @@ class TestPlanCreationWorkflows(utils.TestCommand):
             workflow_input={'container': 'test-overcloud',
                             'generate_passwords': False})
 
+    @mock.patch('time.sleep')
+    def test_list_deployment_plans_websocket_unavailable(self, mock_sleep):
+        self.workflow.executions.create.return_value = mock.Mock(id='IDID')
+        self.workflow.executions.get.return_value = mock.Mock(
+            id='IDID', state='SUCCESS', state_info=None,
+            output='{"plans": ["overcloud"], "status": "SUCCESS"}')
+        self.websocket.wait_for_messages.side_effect = (
+            exceptions.WebSocketConnectionError)
+
+        plans = plan_management.list_deployment_plans(self.app.client_manager)
+
+        # The plans come from the output of the execution
+        self.assertEqual(['overcloud'], plans)
+
 
 class TestPlanUpdateWorkflows(base.TestCommand):
 
@@ -256,6 +274,16 @@ class TestPlanUpdateWorkflows(base.TestCommand):
             return {}, '{0}: mock content\n'.format(args[1])
         self.object_store.get_object.side_effect = get_object
 
+        # The contents uploaded to the plan, by object name
+        self.uploaded = {}
+
+        def put_object(container, obj, contents, **kwargs):
+            if hasattr(contents, 'read'):
+                contents = contents.read()
+            self.uploaded[obj] = contents
+            return mock.DEFAULT
+        self.object_store.put_object.side_effect = put_object
+
     @mock.patch('tripleoclient.workflows.plan_management.tarball',
                 autospec=True)
     @mock.patch('tripleo_common.utils.swift.empty_container',
@@ -273,24 +301,25 @@ class TestPlanUpdateWorkflows(base.TestCommand):
             self.object_store, 'test-overcloud')
 
         # make sure we're pushing the saved files back to plan
-        self.object_store.put_object.assert_has_calls(
-            [
-                mock.call('test-overcloud', 'plan-environment.yaml',
-                          'passwords: somepasswords\n'
-                          'plan-environment.yaml: mock content\n'),
-                mock.call('test-overcloud', 'user-environment.yaml',
-                          'user-environment.yaml: mock content\n'),
-                mock.call('test-overcloud', 'roles_data.yaml',
-                          'roles_data.yaml: mock content\n'),
-                mock.call('test-overcloud', 'network_data.yaml',
-                          'network_data.yaml: mock content\n'),
-                mock.call('test-overcloud', 'user-files/somecustomfile.yaml',
-                          'user-files/somecustomfile.yaml: mock content\n'),
-                mock.call('test-overcloud', 'user-files/othercustomfile.yaml',
-                          'user-files/othercustomfile.yaml: mock content\n'),
-            ],
-            any_order=True,
-        )
+        self.assertEqual(
+            {
+                'plan-environment.yaml':
+                    b'passwords: somepasswords\n'
+                    b'plan-environment.yaml: mock content\n',
+                'user-environment.yaml':
+                    b'user-environment.yaml: mock content\n',
+                'roles_data.yaml': b'roles_data.yaml: mock content\n',
+                'network_data.yaml': b'network_data.yaml: mock content\n',
+                'user-files/somecustomfile.yaml':
+                    b'user-files/somecustomfile.yaml: mock content\n',
+                'user-files/othercustomfile.yaml':
+                    b'user-files/othercustomfile.yaml: mock content\n',
+            },
+            self.uploaded)
+        # The saved files are removed once uploaded
+        spool_dir = os.path.dirname(
+            self.object_store.put_object.call_args[0][2].name)
+        self.assertFalse(os.path.exists(spool_dir))
 
         self.workflow.executions.create.assert_called_once_with(
             'tripleo.plan_management.v1.update_deployment_plan',
@@ -324,6 +353,148 @@ class TestPlanUpdateWorkflows(base.TestCommand):
             workflow_input={'container': 'test-overcloud',
                             'generate_passwords': True, 'source_url': None})
 
+    @mock.patch('tripleoclient.workflows.plan_management.tarball',
+                autospec=True)
+    @mock.patch('tripleo_common.utils.swift.empty_container',
+                autospec=True)
+    def test_update_plan_from_templates_passwords_first(
+            self, mock_empty_container, mock_tarball):
+        calls = []
+
+        def record(container_or_workflow, *args, **kwargs):
+            calls.append(args[0] if args else container_or_workflow)
+            return mock.DEFAULT
+        self.object_store.put_object.side_effect = record
+        self.workflow.executions.create.side_effect = record
+        editor = plan_environment.PlanEnvironmentEditor(self.object_store,
+                                                        'test-overcloud')
+
+        plan_management.update_plan_from_templates(
+            self.app.client_manager,
+            'test-overcloud',
+            '/tht-root/',
+            editor=editor)
+
+        # The plan update workflow sees the passwords of the plan
+        self.assertEqual(['plan-environment.yaml',
+                          'tripleo.plan_management.v1.update_deployment_plan'],
+                         calls)
+
+    def _create_templates(self, files):
+        tht_root = self.useFixture(fixtures.TempDir()).path
+        for name, content in files.items():
+            path = os.path.join(tht_root, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        return tht_root
+
+    def _md5(self, content):
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+    @mock.patch('tripleoclient.workflows.plan_management.tarball',
+                autospec=True)
+    @mock.patch('tripleo_common.utils.swift.empty_container',
+                autospec=True)
+    def test_update_plan_from_templates_sync(
+            self, mock_empty_container, mock_tarball):
+        tht_root = self._create_templates({
+            'unchanged.yaml': 'unchanged',
+            'changed.yaml': 'new content',
+            'new.yaml': 'new',
+            '.git/HEAD': 'ref',
+            'tools/script.pyc': 'bytecode',
+        })
+        self.object_store.get_container.return_value = (
+            {'x-container-meta-usage-tripleo': 'plan'},
+            [
+                {'name': 'plan-environment.yaml', 'hash': 'abc'},
+                {'name': 'unchanged.yaml', 'hash': self._md5('unchanged')},
+                {'name': 'changed.yaml', 'hash': self._md5('old content')},
+                {'name': 'removed.yaml', 'hash': 'def'},
+            ]
+        )
+
+        plan_management.update_plan_from_templates(
+            self.app.client_manager,
+            'test-overcloud',
+            tht_root,
+            sync=True)
+
+        mock_empty_container.assert_not_called()
+        mock_tarball.create_tarball_stream.assert_not_called()
+        self.object_store.delete_object.assert_has_calls([
+            mock.call('test-overcloud', 'plan-environment.yaml'),
+            mock.call('test-overcloud', 'removed.yaml'),
+        ])
+        self.assertEqual(2, self.object_store.delete_object.call_count)
+        uploaded = [c[0][1] for c in
+                    self.object_store.put_object.call_args_list]
+        self.assertEqual(['changed.yaml', 'new.yaml'], sorted(uploaded[:2]))
+        # The passwords are written back to the plan environment last
+        self.assertEqual(['plan-environment.yaml'], uploaded[2:])
+
+    @mock.patch('tripleoclient.workflows.plan_management.tarball',
+                autospec=True)
+    @mock.patch('tripleo_common.utils.swift.empty_container',
+                autospec=True)
+    def test_update_plan_from_templates_sync_keep_env(
+            self, mock_empty_container, mock_tarball):
+        tht_root = self._create_templates({
+            'plan-environment.yaml': 'skeleton',
+            'roles_data.yaml': 'roles',
+            'network_data.yaml': 'networks',
+        })
+        networks_file = os.path.join(
+            self._create_templates({'networks.yaml': 'custom networks'}),
+            'networks.yaml')
+        self.object_store.get_container.return_value = (
+            {'x-container-meta-usage-tripleo': 'plan'},
+            [
+                {'name': 'plan-environment.yaml', 'hash': 'abc'},
+                {'name': 'roles_data.yaml', 'hash': 'def'},
+                {'name': 'network_data.yaml', 'hash': 'mno'},
+                {'name': 'user-environment.yaml', 'hash': 'pqr',
+                 'bytes': 0},
+                {'name': 'user-files/somecustomfile.yaml', 'hash': 'ghi'},
+                {'name': 'overcloud.yaml', 'hash': 'jkl'},
+            ]
+        )
+
+        plan_management.update_plan_from_templates(
+            self.app.client_manager,
+            'test-overcloud',
+            tht_root,
+            networks_file=networks_file,
+            keep_env=True,
+            sync=True)
+
+        mock_empty_container.assert_not_called()
+        # The preserved files stay in the plan, unless empty
+        self.object_store.delete_object.assert_has_calls([
+            mock.call('test-overcloud', 'overcloud.yaml'),
+            mock.call('test-overcloud', 'user-environment.yaml'),
+        ], any_order=True)
+        self.assertEqual(2, self.object_store.delete_object.call_count)
+        self.object_store.get_object.assert_not_called()
+        # Only the local overrides are uploaded
+        self.assertEqual({'network_data.yaml': b'custom networks'},
+                         self.uploaded)
+
+    def test_update_plan_from_templates_sync_not_a_plan(self):
+        self.object_store.get_container.return_value = ({}, [])
+
+        self.assertRaises(
+            ValueError,
+            plan_management.update_plan_from_templates,
+            self.app.client_manager,
+            'test-overcloud',
+            self._create_templates({}),
+            keep_env=True,
+            sync=True)
+        self.object_store.delete_object.assert_not_called()
+
 
 class TestUpdatePasswords(base.TestCase):
 
@@ -371,3 +542,20 @@ parameter_defaults:
                                           {'SecretPassword': 'abcd'})
 
         self.swift_client.put_object.assert_not_called()
+
+    def test_shared_editor(self):
+        editor = plan_environment.PlanEnvironmentEditor(self.swift_client,
+                                                        self.plan_name)
+
+        editor.add_environment('user-environment.yaml')
+
+        plan_management._update_passwords(self.swift_client,
+                                          self.plan_name,
+                                          {'AdminPassword': "1234"},
+                                          editor=editor)
+
+        self.assertFalse(editor.pending)
+        self.swift_client.put_object.assert_called_once()
+        result = self.swift_client.put_object.call_args_list[0][0][2]
+        self.assertIn("\n  AdminPassword: '1234'", result)
+        self.assertIn("\n- path: user-environment.yaml", result)
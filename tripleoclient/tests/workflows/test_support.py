@@ -147,8 +147,8 @@ class TestDownloadContainer(fakes.TestDeployOvercloud):
     def test_download_files_not_enough_space(self):
         support.check_local_space = mock.MagicMock()
         support.check_local_space.return_value = False
-        oc = self.app.client_manager.object_store
-        oc.object_list.return_value = [{'bytes': 100}]
+        oc = self.app.client_manager.tripleoclient.object_store
+        oc.get_container.return_value = ({}, [{'bytes': 100}])
         self.assertRaises(DownloadError,
                           support.download_files,
                           self.app.client_manager,
@@ -160,12 +160,17 @@ class TestDownloadContainer(fakes.TestDeployOvercloud):
         support.check_local_space = mock.MagicMock()
         support.check_local_space.return_value = True
         exists_mock.return_value = True
-        oc = self.app.client_manager.object_store
-        oc.object_list.return_value = [
+        oc = self.app.client_manager.tripleoclient.object_store
+        oc.get_container.return_value = ({}, [
             {'name': 'test1'}
-        ]
-        oc.object_save = mock.MagicMock()
-        support.download_files(self.app.client_manager, 'test', '/test')
-        oc.object_save.assert_called_with(container='test',
-                                          object='test1',
-                                          file='/test/test1')
+        ])
+        oc.get_object.return_value = ({}, iter([b'log', b'data']))
+        mock_open = mock.mock_open()
+        with mock.patch('six.moves.builtins.open', mock_open):
+            support.download_files(self.app.client_manager, 'test', '/test')
+        oc.get_container.assert_called_once_with('test', full_listing=True)
+        oc.get_object.assert_called_with('test', 'test1',
+                                         resp_chunk_size=65536)
+        mock_open.assert_called_once_with('/test/test1', 'wb')
+        mock_open().write.assert_has_calls([mock.call(b'log'),
+                                            mock.call(b'data')])
@@ -0,0 +1,140 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Timings of the Mistral workflows and actions run by a command
+
+A span is recorded for each workflow started and each action called: when
+it was started, how long its first message took to come, how many messages
+came and when and how it ended. This tells the time spent waiting for
+Mistral to schedule a workflow from the time spent running it.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from prettytable import PrettyTable
+
+LOG = logging.getLogger(__name__)
+
+
+class Span(object):
+    """The timings of a workflow execution or of an action"""
+
+    def __init__(self, kind, name, execution_id=None):
+        self.kind = kind
+        self.name = name
+        self.execution_id = execution_id
+        self.started = time.time()
+        self.first_message = None
+        self.messages = 0
+        self.duration = None
+        self.state = None
+
+    def message(self):
+        if self.first_message is None:
+            self.first_message = time.time() - self.started
+        self.messages += 1
+
+    def finish(self, state):
+        if self.duration is None:
+            self.duration = time.time() - self.started
+            self.state = state
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'execution_id': self.execution_id,
+            'started': self.started,
+            'first_message': self.first_message,
+            'messages': self.messages,
+            'duration': self.duration,
+            'state': self.state,
+        }
+
+
+class Tracer(object):
+    """The spans recorded by a command, from all its threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+        self._executions = {}
+
+    def start(self, kind, name, execution_id=None):
+        span = Span(kind, name, execution_id)
+        with self._lock:
+            self.spans.append(span)
+            if execution_id is not None:
+                self._executions[execution_id] = span
+        return span
+
+    def set_execution(self, span, execution_id):
+        with self._lock:
+            span.execution_id = execution_id
+            self._executions[execution_id] = span
+
+    def execution(self, execution_id):
+        """Return the span of an execution, recording it if unknown"""
+
+        with self._lock:
+            span = self._executions.get(execution_id)
+        if span is None:
+            span = self.start('workflow', None, execution_id)
+        return span
+
+    def write(self, path):
+        """Write the spans to a file, as JSON lines"""
+
+        with open(path, 'w') as f:
+            for span in self.spans:
+                f.write(json.dumps(span.to_dict(), sort_keys=True) + '\n')
+
+    def summary_table(self):
+        table = PrettyTable(['Workflow or action', 'Execution ID',
+                             'First message (s)', 'Messages',
+                             'Duration (s)', 'State'])
+        table.align = 'l'
+        for span in self.spans:
+            table.add_row([
+                span.name or '-', span.execution_id or '-',
+                '-' if span.first_message is None
+                else '%.1f' % span.first_message,
+                span.messages,
+                '-' if span.duration is None else '%.1f' % span.duration,
+                span.state or '-'])
+        return table
+
+
+_tracer = None
+
+
+def get_tracer():
+    """Return the tracer shared by the whole process"""
+
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def reset():
+    """Forget the spans recorded so far, e.g. when a new command starts"""
+
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
@@ -14,14 +14,15 @@
 #
 
 from __future__ import print_function
+from concurrent import futures
 import csv
 import datetime
 import getpass
-import glob
 import hashlib
 import logging
 import os
 import os.path
+import re
 import simplejson
 import six
 import socket
@@ -31,15 +32,23 @@ import tempfile
 import time
 import yaml
 
+from heatclient.common import environment_format
 from heatclient.common import event_utils
 from heatclient.common import template_utils
+from heatclient.common import utils as heat_utils
 from heatclient.exc import HTTPNotFound
 from osc_lib.i18n import _
 from oslo_concurrency import processutils
 from six.moves import configparser
+from six.moves import http_client
+from six.moves.urllib import error as url_error
+from six.moves.urllib import request
 
 from heatclient import exc as hc_exc
+from tripleoclient import constants
+from tripleoclient import environment_index
 from tripleoclient import exceptions
+from tripleoclient import yaml_serialization
 
 
 def bracket_ipv6(address):
@@ -425,6 +434,89 @@ def file_checksum(filepath):
     return checksum.hexdigest()
 
 
+def _content_range_total(content_range):
+    # e.g. "bytes 1024-2047/4096"
+    match = re.match(r'bytes \d+-\d+/(\d+)$', content_range or '')
+    return int(match.group(1)) if match else None
+
+
+def download_file(url, path, chunk_size=constants.DOWNLOAD_CHUNK_SIZE,
+                  retries=constants.DOWNLOAD_RETRIES, progress=None):
+    """Download url to path, resuming the download if it is interrupted
+
+    The response is written to disk chunk by chunk as it is received. When
+    the connection fails the download carries on from where it stopped with
+    an HTTP Range request. If the response has the ETag of a plain Swift
+    object, the MD5 checksum of the file is checked against it.
+
+    :param url: URL to download, e.g. a Swift temporary URL
+    :param path: file to write the download to
+    :param progress: optional callable, called with the number of bytes
+                     downloaded and the total (or None when unknown)
+                     after every chunk
+    :raises: exceptions.DownloadError if the download can't be completed
+    """
+    log = logging.getLogger(__name__ + ".download_file")
+
+    etag = None
+    total = None
+    done = 0
+    attempt = 0
+    checksum = hashlib.md5()
+
+    with open(path, 'wb') as f:
+        while total is None or done < total:
+            req = request.Request(url)
+            if done:
+                req.add_header('Range', 'bytes=%d-' % done)
+                if etag:
+                    # Don't mix the parts of two different objects
+                    req.add_header('If-Range', '"%s"' % etag)
+            try:
+                response = request.urlopen(req)
+                if done and response.getcode() != 206:
+                    # The whole object was sent again
+                    f.seek(0)
+                    f.truncate()
+                    done = 0
+                    checksum = hashlib.md5()
+                    etag = None
+                if etag is None:
+                    etag = (response.info().get('ETag') or '').strip('"')
+                    if response.getcode() == 206:
+                        total = _content_range_total(
+                            response.info().get('Content-Range'))
+                    elif response.info().get('Content-Length'):
+                        total = int(response.info().get('Content-Length'))
+                for chunk in iter(lambda: response.read(chunk_size), b''):
+                    f.write(chunk)
+                    checksum.update(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+                if total is None:
+                    break
+                if done < total:
+                    raise http_client.IncompleteRead(b'', total - done)
+            except (IOError, socket.error, http_client.HTTPException) as e:
+                attempt += 1
+                client_error = (isinstance(e, url_error.HTTPError) and
+                                e.code < 500)
+                if attempt > retries or client_error:
+                    raise exceptions.DownloadError(
+                        _('Download of %(url)s failed: %(error)s') %
+                        {'url': url, 'error': e})
+                log.warning(_('Download interrupted after %(done)d bytes '
+                              '(%(error)s), resuming'),
+                            {'done': done, 'error': e})
+
+    if re.match(r'^[0-9a-f]{32}$', etag or '') and \
+            checksum.hexdigest() != etag:
+        raise exceptions.DownloadError(
+            _('Checksum of %(path)s does not match the ETag %(etag)s') %
+            {'path': path, 'etag': etag})
+
+
 def ensure_run_as_normal_user():
     """Check if the command runs under normal user (EUID!=0)"""
     if os.geteuid() == 0:
@@ -685,7 +777,7 @@ def parse_env_file(env_file, file_type=None):
     elif file_type == 'csv' or env_file.name.endswith('.csv'):
         nodes_config = _csv_to_nodes_dict(env_file)
     elif env_file.name.endswith('.yaml'):
-        nodes_config = yaml.safe_load(env_file)
+        nodes_config = yaml_serialization.safe_load(env_file)
     else:
         raise exceptions.InvalidConfiguration(
             _("Invalid file extension for %s, must be json, yaml or csv") %
@@ -741,13 +833,23 @@ def replace_links_in_template_contents(contents, link_replacement):
     file paths according to link_replacement dict. (Key/value in
     link_replacement are from/to, respectively.)
 
-    If the string contents don't look like a Heat template, return the
-    contents unmodified.
+    If the string contents don't look like a Heat template, or don't
+    contain any of the links to replace, return the contents unmodified.
+    Contents which aren't a string, e.g. scripts read as bytes for
+    get_file, are returned unmodified as well.
     """
 
+    if not isinstance(contents, six.string_types):
+        return contents
+    # A link can only be replaced when it appears in the contents, which
+    # is much quicker to check than parsing them.
+    if ('heat_template_version' not in contents or
+            not any(link in contents for link in link_replacement)):
+        return contents
+
     template = {}
     try:
-        template = yaml.safe_load(contents)
+        template = yaml_serialization.safe_load(contents)
     except yaml.YAMLError:
         return contents
 
@@ -755,9 +857,32 @@ def replace_links_in_template_contents(contents, link_replacement):
             template.get('heat_template_version')):
         return contents
 
-    template = replace_links_in_template(template, link_replacement)
+    replaced = []
+    template = _replace_links(template, link_replacement, replaced)
+    if not replaced:
+        return contents
 
-    return yaml.safe_dump(template)
+    return yaml_serialization.safe_dump(template)
+
+
+def _replace_links(template_part, link_replacement, replaced):
+    if isinstance(template_part, dict):
+        result = {}
+        for key, value in six.iteritems(template_part):
+            if ((key == 'get_file' or key == 'type') and
+                    isinstance(value, six.string_types)):
+                result[key] = link_replacement.get(value, value)
+                if result[key] != value:
+                    replaced.append(value)
+            else:
+                result[key] = _replace_links(value, link_replacement,
+                                             replaced)
+        return result
+    elif isinstance(template_part, list):
+        return [_replace_links(value, link_replacement, replaced)
+                for value in template_part]
+    else:
+        return template_part
 
 
 def replace_links_in_template(template_part, link_replacement):
@@ -768,23 +893,7 @@ def replace_links_in_template(template_part, link_replacement):
     dict. (Key/value in link_replacement are from/to, respectively.)
     """
 
-    def replaced_dict_value(key, value):
-        if ((key == 'get_file' or key == 'type') and
-                isinstance(value, six.string_types)):
-            return link_replacement.get(value, value)
-        else:
-            return replace_links_in_template(value, link_replacement)
-
-    def replaced_list_value(value):
-        return replace_links_in_template(value, link_replacement)
-
-    if isinstance(template_part, dict):
-        return {k: replaced_dict_value(k, v)
-                for k, v in six.iteritems(template_part)}
-    elif isinstance(template_part, list):
-        return map(replaced_list_value, template_part)
-    else:
-        return template_part
+    return _replace_links(template_part, link_replacement, [])
 
 
 def relative_link_replacement(link_replacement, current_dir):
@@ -805,14 +914,16 @@ def load_environment_directories(directories):
     if os.environ.get('TRIPLEO_ENVIRONMENT_DIRECTORY'):
         directories.append(os.environ.get('TRIPLEO_ENVIRONMENT_DIRECTORY'))
 
+    # Unchanged directories are resolved from the index rather than listed
+    index = environment_index.get_index()
     environments = []
     for d in directories:
         if os.path.exists(d) and d != '.':
             log.debug("Environment directory: %s" % d)
-            for f in sorted(glob.glob(os.path.join(d, '*.yaml'))):
+            for f in index.list_directory(d):
                 log.debug("Environment directory file: %s" % f)
-                if os.path.isfile(f):
-                    environments.append(f)
+                environments.append(f)
+    index.save()
     return environments
 
 
@@ -836,85 +947,156 @@ def get_tripleo_ansible_inventory(inventory_file='', ssh_user='heat-admin'):
             "Inventory file %s can not be found." % inventory_file)
 
 
-def process_multiple_environments(created_env_files, tht_root,
-                                  user_tht_root, cleanup=True):
+def _redirect_resource_registry(env_map, env_path, tht_root,
+                                user_tht_root):
+    """Point the resource registry of a parsed environment at tht_root
+
+    The paths are made absolute, and the ones inside user_tht_root are
+    redirected to tht_root. env_map is modified in place.
+
+    :returns: a dict mapping the original paths to the redirected ones
+    """
+
     log = logging.getLogger(__name__ + ".process_multiple_environments")
-    env_files = {}
-    localenv = {}
-    # Normalize paths for full match checks
-    user_tht_root = os.path.normpath(user_tht_root)
-    tht_root = os.path.normpath(tht_root)
-    for env_path in created_env_files:
-        log.debug("Processing environment files %s" % env_path)
-        abs_env_path = os.path.abspath(env_path)
-        if (abs_env_path.startswith(user_tht_root) and
-            ((user_tht_root + '/') in env_path or
-             (user_tht_root + '/') in abs_env_path or
-             user_tht_root == abs_env_path or
-             user_tht_root == env_path)):
-            new_env_path = env_path.replace(user_tht_root + '/',
-                                            tht_root + '/')
-            log.debug("Redirecting env file %s to %s"
-                      % (abs_env_path, new_env_path))
-            env_path = new_env_path
-        try:
-            files, env = template_utils.process_environment_and_files(
-                env_path=env_path)
-        except hc_exc.CommandError as ex:
-            # This provides fallback logic so that we can reference files
-            # inside the resource_registry values that may be rendered via
-            # j2.yaml templates, where the above will fail because the
-            # file doesn't exist in user_tht_root, but it is in tht_root
-            # See bug https://bugs.launchpad.net/tripleo/+bug/1625783
-            # for details on why this is needed (backwards-compatibility)
-            log.debug("Error %s processing environment file %s"
-                      % (six.text_type(ex), env_path))
-            # Use the temporary path as it's possible the environment
-            # itself was rendered via jinja.
-            with open(env_path, 'r') as f:
-                env_map = yaml.safe_load(f)
-            env_registry = env_map.get('resource_registry', {})
-            env_dirname = os.path.dirname(os.path.abspath(env_path))
-            for rsrc, rsrc_path in six.iteritems(env_registry):
-                # We need to calculate the absolute path relative to
-                # env_path not cwd (which is what abspath uses).
-                abs_rsrc_path = os.path.normpath(
-                    os.path.join(env_dirname, rsrc_path))
-                # If the absolute path matches user_tht_root, rewrite
-                # a temporary environment pointing at tht_root instead
-                if (abs_rsrc_path.startswith(user_tht_root) and
-                    ((user_tht_root + '/') in abs_rsrc_path or
-                     abs_rsrc_path == user_tht_root)):
-                    new_rsrc_path = abs_rsrc_path.replace(
-                        user_tht_root + '/', tht_root + '/')
-                    log.debug("Rewriting %s %s path to %s"
-                              % (env_path, rsrc, new_rsrc_path))
-                    env_registry[rsrc] = new_rsrc_path
-                else:
-                    # Skip any resources that are mapping to OS::*
-                    # resource names as these aren't paths
-                    if not rsrc_path.startswith("OS::"):
-                        env_registry[rsrc] = abs_rsrc_path
-            env_map['resource_registry'] = env_registry
+    redirects = {}
+    env_registry = env_map.get('resource_registry', {})
+    env_dirname = os.path.dirname(os.path.abspath(env_path))
+    for rsrc, rsrc_path in six.iteritems(env_registry):
+        # We need to calculate the absolute path relative to
+        # env_path not cwd (which is what abspath uses).
+        abs_rsrc_path = os.path.normpath(
+            os.path.join(env_dirname, rsrc_path))
+        # If the absolute path matches user_tht_root, rewrite
+        # the environment to point at tht_root instead
+        if (abs_rsrc_path.startswith(user_tht_root) and
+            ((user_tht_root + '/') in abs_rsrc_path or
+             abs_rsrc_path == user_tht_root)):
+            new_rsrc_path = abs_rsrc_path.replace(
+                user_tht_root + '/', tht_root + '/')
+            log.debug("Rewriting %s %s path to %s"
+                      % (env_path, rsrc, new_rsrc_path))
+            env_registry[rsrc] = new_rsrc_path
+            redirects[rsrc_path] = new_rsrc_path
+        else:
+            # Skip any resources that are mapping to OS::*
+            # resource names as these aren't paths
+            if not rsrc_path.startswith("OS::"):
+                env_registry[rsrc] = abs_rsrc_path
+    env_map['resource_registry'] = env_registry
+    return redirects
+
+
+def _process_parsed_environment(env_map, env_path):
+    """Load the files of an environment which was already parsed
+
+    This does what template_utils.process_environment_and_files does with
+    the contents of env_path, without writing and parsing it again.
+    """
+
+    files = {}
+    env_base_url = heat_utils.base_url_for_url(
+        heat_utils.normalise_file_path_to_url(env_path))
+    template_utils.resolve_environment_urls(
+        env_map.get('resource_registry'), files, env_base_url)
+    return files, env_map
+
+
+def _process_environment(env_path, tht_root, user_tht_root, cleanup):
+    log = logging.getLogger(__name__ + ".process_multiple_environments")
+    log.debug("Processing environment files %s" % env_path)
+    abs_env_path = os.path.abspath(env_path)
+    if (abs_env_path.startswith(user_tht_root) and
+        ((user_tht_root + '/') in env_path or
+         (user_tht_root + '/') in abs_env_path or
+         user_tht_root == abs_env_path or
+         user_tht_root == env_path)):
+        new_env_path = env_path.replace(user_tht_root + '/',
+                                        tht_root + '/')
+        log.debug("Redirecting env file %s to %s"
+                  % (abs_env_path, new_env_path))
+        env_path = new_env_path
+    try:
+        files, env = template_utils.process_environment_and_files(
+            env_path=env_path)
+    except hc_exc.CommandError as ex:
+        # This provides fallback logic so that we can reference files
+        # inside the resource_registry values that may be rendered via
+        # j2.yaml templates, where the above will fail because the
+        # file doesn't exist in user_tht_root, but it is in tht_root
+        # See bug https://bugs.launchpad.net/tripleo/+bug/1625783
+        # for details on why this is needed (backwards-compatibility)
+        log.debug("Error %s processing environment file %s"
+                  % (six.text_type(ex), env_path))
+        # Use the temporary path as it's possible the environment
+        # itself was rendered via jinja. It is parsed like heat does, so
+        # e.g. unknown sections are rejected and dates are left as strings.
+        with open(env_path, 'r') as f:
+            env_map = environment_format.parse(f.read())
+        redirects = _redirect_resource_registry(env_map, env_path, tht_root,
+                                                user_tht_root)
+        if not cleanup:
+            # Keep the rewritten environment around for inspection
             f_name = os.path.basename(os.path.splitext(abs_env_path)[0])
             with tempfile.NamedTemporaryFile(dir=tht_root,
                                              prefix="env-%s-" % f_name,
                                              suffix=".yaml",
                                              mode="w",
-                                             delete=cleanup) as f:
+                                             delete=False) as f:
                 log.debug("Rewriting %s environment to %s"
                           % (env_path, f.name))
-                f.write(yaml.safe_dump(env_map, default_flow_style=False))
-                f.flush()
-                files, env = template_utils.process_environment_and_files(
-                    env_path=f.name)
-        if files:
-            log.debug("Adding files %s for %s" % (files, env_path))
-            env_files.update(files)
-
-        # 'env' can be a deeply nested dictionary, so a simple update is
-        # not enough
-        localenv = template_utils.deep_update(localenv, env)
+                f.write(yaml_serialization.safe_dump(
+                    env_map, default_flow_style=False))
+        try:
+            files, env = _process_parsed_environment(env_map, env_path)
+        except hc_exc.CommandError:
+            log.error("Error processing environment file %s, with the "
+                      "resource registry paths redirected as %s"
+                      % (env_path, redirects))
+            raise
+    if files:
+        log.debug("Adding files %s for %s" % (files, env_path))
+    return files, env
+
+
+def process_multiple_environments(created_env_files, tht_root,
+                                  user_tht_root, cleanup=True,
+                                  workers=constants.ENVIRONMENT_WORKERS,
+                                  environment=None):
+    """Process environment files and merge them
+
+    The environment files, and the templates they reference, are read and
+    parsed concurrently. The results are then merged in the order of
+    created_env_files, so the later environments take precedence.
+
+    When a layered_env.LayeredEnvironment is given, each environment is
+    added to it as a layer named after its path and it is returned instead
+    of a merged dict.
+    """
+
+    env_files = {}
+    localenv = {}
+    # Normalize paths for full match checks
+    user_tht_root = os.path.normpath(user_tht_root)
+    tht_root = os.path.normpath(tht_root)
+
+    workers = max(min(workers, len(created_env_files)), 1)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda env_path: _process_environment(
+                env_path, tht_root, user_tht_root, cleanup),
+            created_env_files)
+        for env_path, (files, env) in zip(created_env_files, results):
+            if files:
+                env_files.update(files)
+
+            if environment is not None:
+                environment.add_layer(env_path, env)
+                continue
+            # 'env' can be a deeply nested dictionary, so a simple update is
+            # not enough
+            localenv = template_utils.deep_update(localenv, env)
+    if environment is not None:
+        return env_files, environment
     return env_files, localenv
 
 
@@ -25,7 +25,6 @@ from heatclient.common import utils as heat_utils
 from osc_lib import exceptions as oscexc
 from osc_lib.i18n import _
 from six.moves.urllib import request
-import yaml
 
 from tripleo_common.image import image_uploader
 from tripleo_common.image import kolla_builder
@@ -33,6 +32,8 @@ from tripleo_common.image import kolla_builder
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_cache
+from tripleoclient import yaml_serialization
 
 
 class UploadImage(command.Command):
@@ -149,14 +150,14 @@ class BuildImage(command.Command):
             result = builder.build_images(kolla_config_files)
             if parsed_args.list_dependencies:
                 deps = json.loads(result)
-                yaml.safe_dump(deps, self.app.stdout, indent=2,
-                               default_flow_style=False)
+                yaml_serialization.safe_dump(deps, self.app.stdout, indent=2,
+                                             default_flow_style=False)
             elif parsed_args.list_images:
                 deps = json.loads(result)
                 images = []
                 BuildImage.images_from_deps(images, deps)
-                yaml.safe_dump(images, self.app.stdout,
-                               default_flow_style=False)
+                yaml_serialization.safe_dump(images, self.app.stdout,
+                                             default_flow_style=False)
             elif result:
                 self.app.stdout.write(result)
         finally:
@@ -345,13 +346,13 @@ class PrepareImageFiles(command.Command):
             f.write('#   openstack %s\n#\n\n' %
                     ' '.join(self.app.command_options))
 
-            yaml.safe_dump({'parameter_defaults': params}, f,
-                           default_flow_style=False)
+            yaml_serialization.safe_dump({'parameter_defaults': params}, f,
+                                         default_flow_style=False)
 
     def get_enabled_services(self, environment, roles_file):
         enabled_services = set()
         try:
-            roles_data = yaml.safe_load(open(roles_file).read())
+            roles_data = yaml_cache.load(roles_file)
         except IOError:
             return enabled_services
 
@@ -440,8 +441,8 @@ class PrepareImageFiles(command.Command):
             self.write_env_file(params, parsed_args.output_env_file)
 
         result = prepare_data[output_images_file]
-        result_str = yaml.safe_dump({'container_images': result},
-                                    default_flow_style=False)
+        result_str = yaml_serialization.safe_dump({'container_images': result},
+                                                  default_flow_style=False)
         sys.stdout.write(result_str)
 
         if parsed_args.output_images_file:
@@ -22,7 +22,6 @@ import re
 import shutil
 import six
 import tempfile
-import yaml
 
 from heatclient.common import template_utils
 from osc_lib import exceptions as oscexc
@@ -31,9 +30,18 @@ from swiftclient.exceptions import ClientException
 from tripleo_common import update
 
 from tripleoclient import command
+from tripleoclient import compiled_env
 from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import layered_env
+from tripleoclient import plan_cache
+from tripleoclient import plan_environment
+from tripleoclient import swift_transfer
+from tripleoclient import template_graph
 from tripleoclient import utils
+from tripleoclient import workspace
+from tripleoclient import yaml_cache
+from tripleoclient import yaml_serialization
 from tripleoclient.workflows import deployment
 from tripleoclient.workflows import parameters as workflow_params
 from tripleoclient.workflows import plan_management
@@ -47,6 +55,11 @@ class DeployOvercloud(command.Command):
     predeploy_errors = 0
     predeploy_warnings = 0
     _password_cache = None
+    _uploader = None
+    _plan_cache = None
+    _plan_editor = None
+    _plan_listing = None
+    _use_plan_cache = True
 
     # This may be switched on by default in the future, but for now
     # we'll want this behavior only in `overcloud update stack` and
@@ -60,10 +73,67 @@ class DeployOvercloud(command.Command):
         self.object_client = self.clients.tripleoclient.object_store
         self.workflow_client = self.clients.workflow_engine
         self.orchestration_client = self.clients.orchestration
+        self._use_plan_cache = not parsed_args.no_plan_cache
         if not parsed_args.deployed_server:
             self.compute_client = self.clients.compute
             self.baremetal_client = self.clients.baremetal
 
+    @property
+    def uploader(self):
+        """Shared executor for the uploads to the plan container"""
+
+        if self._uploader is None:
+            self._uploader = swift_transfer.UploadExecutor(self.object_client)
+        return self._uploader
+
+    @property
+    def plan_cache(self):
+        """Cache of the objects read from the plan container"""
+
+        if self._plan_cache is None:
+            self._plan_cache = plan_cache.PlanCache(
+                self.object_client, enabled=self._use_plan_cache)
+        return self._plan_cache
+
+    def _plan_etags(self, container_name):
+        """ETags of the objects of the plan, by name
+
+        The plan is listed once, after it was updated. The objects uploaded
+        by the command afterwards (e.g. the user environments) are not read
+        through this listing.
+        """
+
+        if self._plan_listing is None:
+            self._plan_listing = self.plan_cache.etags(container_name)
+        return self._plan_listing
+
+    def _plan_environment_editor(self, container_name):
+        """Editor collecting the plan environment edits of the command
+
+        The plan environment changes with every deployment and holds the
+        passwords, so it is read from Swift rather than the plan cache.
+        """
+
+        if self._plan_editor is None:
+            self._plan_editor = plan_environment.PlanEnvironmentEditor(
+                self.object_client, container_name)
+        return self._plan_editor
+
+    def _flush_plan_editor(self):
+        # Edits left pending because writing them failed, e.g. the stored
+        # passwords, must still replace the ones the plan update generated.
+        if self._plan_editor is not None and self._plan_editor.pending:
+            try:
+                self._plan_editor.flush()
+            except Exception:
+                self.log.exception("Could not update the plan environment "
+                                   "of %s" % self._plan_editor.container)
+
+    def _shutdown_uploader(self):
+        if self._uploader is not None:
+            self._uploader.shutdown()
+            self._uploader = None
+
     def _update_parameters(self, args, stack):
         parameters = {}
 
@@ -75,7 +145,7 @@ class DeployOvercloud(command.Command):
         # Update parameters from answers file:
         if args.answers_file is not None:
             with open(args.answers_file, 'r') as answers_file:
-                answers = yaml.safe_load(answers_file)
+                answers = yaml_serialization.safe_load(answers_file)
 
             if args.templates is None:
                 args.templates = answers['templates']
@@ -155,7 +225,8 @@ class DeployOvercloud(command.Command):
                                 container_name):
         # We write the env_map to the local /tmp tht_root and also
         # to the swift plan container.
-        contents = yaml.safe_dump(env_map, default_flow_style=False)
+        contents = yaml_serialization.safe_dump(env_map,
+                                                default_flow_style=False)
         env_dirname = os.path.dirname(abs_env_path)
         user_env_dir = os.path.join(
             tht_root, 'user-environments', env_dirname[1:])
@@ -164,6 +235,8 @@ class DeployOvercloud(command.Command):
         self.log.debug("user_env_path=%s" % user_env_path)
         if not os.path.exists(user_env_dir):
             os.makedirs(user_env_dir)
+        # Don't write through to a file of the user's templates
+        workspace.materialize(user_env_path)
         with open(user_env_path, 'w') as f:
             self.log.debug("Writing user environment %s" % user_env_path)
             f.write(contents)
@@ -173,10 +246,11 @@ class DeployOvercloud(command.Command):
             swift_path = "user-environments/{}".format(abs_env_path[1:])
         else:
             swift_path = "user-environments/{}".format(abs_env_path)
-        contents = yaml.safe_dump(env_map, default_flow_style=False)
         self.log.debug("Uploading %s to swift at %s"
                        % (abs_env_path, swift_path))
-        self.object_client.put_object(container_name, swift_path, contents)
+        # The upload is completed by _process_and_upload_environment, which
+        # waits for all the pending uploads before updating the plan.
+        self.uploader.put_object(container_name, swift_path, contents)
 
         return user_env_path, swift_path
 
@@ -193,9 +267,12 @@ class DeployOvercloud(command.Command):
         plan_yaml_path = os.path.relpath(template_path, tht_root)
 
         # heatclient template_utils needs a function that can
-        # retrieve objects from a container by name/path
+        # retrieve objects from a container by name/path. The cached
+        # templates are validated against a single listing of the plan.
         def do_object_request(method='GET', object_path=None):
-            obj = self.object_client.get_object(stack_name, object_path)
+            obj = self.plan_cache.get_object(
+                stack_name, object_path,
+                self._plan_etags(stack_name).get(object_path))
             return obj and obj[1]
 
         template_files, template = template_utils.get_template_contents(
@@ -203,6 +280,9 @@ class DeployOvercloud(command.Command):
             object_request=do_object_request)
 
         files = dict(list(template_files.items()) + list(env_files.items()))
+        # Only the files something still references need to be uploaded
+        graph, files = template_graph.prune_files(template, env, files)
+        template_graph.save(stack_name, graph)
 
         moved_files = self._upload_missing_files(
             stack_name, files, tht_root)
@@ -239,6 +319,10 @@ class DeployOvercloud(command.Command):
 
         file_prefix = "file://"
 
+        # This is where a layered environment is finally merged
+        if isinstance(env, layered_env.LayeredEnvironment):
+            env = env.to_dict()
+
         if env.get('resource_registry'):
             for name, path in env['resource_registry'].items():
                 if not isinstance(path, six.string_types):
@@ -258,7 +342,11 @@ class DeployOvercloud(command.Command):
         # Parameters are removed from the environment
         params = env.pop('parameter_defaults', None)
 
-        contents = yaml.safe_dump(env, default_flow_style=False)
+        # Make sure the user environments and files are all in the plan
+        # before it gets updated.
+        self.uploader.wait()
+
+        contents = yaml_serialization.safe_dump(env, default_flow_style=False)
 
         # Until we have a well defined plan update workflow in tripleo-common
         # we need to manually add an environment in swift and for users
@@ -268,15 +356,11 @@ class DeployOvercloud(command.Command):
         swift_path = "user-environment.yaml"
         self.object_client.put_object(container_name, swift_path, contents)
 
-        env = yaml.safe_load(self.object_client.get_object(
-            container_name, constants.PLAN_ENVIRONMENT)[1])
-
-        user_env = {'path': swift_path}
-        if user_env not in env['environments']:
-            env['environments'].append(user_env)
-            yaml_string = yaml.safe_dump(env, default_flow_style=False)
-            self.object_client.put_object(
-                container_name, constants.PLAN_ENVIRONMENT, yaml_string)
+        # The edits of the plan update (e.g. the stored passwords) are
+        # written along with this one.
+        editor = self._plan_environment_editor(container_name)
+        editor.add_environment(swift_path)
+        editor.flush()
 
         # Parameters are sent to the update parameters action, this stores them
         # in the plan environment and means the UI can find them.
@@ -320,37 +404,35 @@ class DeployOvercloud(command.Command):
                 file_relocation, os.path.dirname(reloc_path))
             contents = utils.replace_links_in_template_contents(
                 files_dict[orig_path], link_replacement)
-            self.object_client.put_object(container_name, reloc_path, contents)
+            self.uploader.put_object(container_name, reloc_path, contents)
+        self.uploader.wait()
 
         return file_relocation
 
     def _download_missing_files_from_plan(self, tht_dir, plan_name):
-        # get and download missing files into tmp directory
-        plan_list = self.object_client.get_container(plan_name)
-        plan_filenames = [f['name'] for f in plan_list[1]]
-        for pf in plan_filenames:
-            file_path = os.path.join(tht_dir, pf)
-            if not os.path.isfile(file_path):
-                self.log.debug("Missing in templates directory, downloading \
-                               %s from swift into %s" % (pf, file_path))
-                if not os.path.exists(os.path.dirname(file_path)):
-                    os.makedirs(os.path.dirname(file_path))
-                with open(file_path, 'w') as f:
-                    f.write(self.object_client.get_object(plan_name, pf)[1])
+        """Download the files missing from tht_dir (e.g j2 rendered files)"""
+
+        plan_management.download_missing_files(
+            self.object_client, plan_name, tht_dir, self.plan_cache,
+            self._plan_etags(plan_name))
 
     def _deploy_tripleo_heat_templates_tmpdir(self, stack, parsed_args):
-        # copy tht_root to temporary directory because we need to
-        # download any missing (e.g j2 rendered) files from the plan
+        # make a working copy of tht_root in a temporary directory because
+        # we need to download any missing (e.g j2 rendered) files from the
+        # plan. The files are shared with tht_root rather than copied.
         tht_root = os.path.abspath(parsed_args.templates)
         tht_tmp = tempfile.mkdtemp(prefix='tripleoclient-')
         new_tht_root = "%s/tripleo-heat-templates" % tht_tmp
         self.log.debug("Creating temporary templates tree in %s"
                        % new_tht_root)
         try:
-            shutil.copytree(tht_root, new_tht_root, symlinks=True)
+            shared = workspace.build(tht_root, new_tht_root)
+            self.log.debug("Avoided copying %d bytes of templates" % shared)
             self._deploy_tripleo_heat_templates(stack, parsed_args,
                                                 new_tht_root, tht_root)
         finally:
+            self._flush_plan_editor()
+            self._shutdown_uploader()
             if parsed_args.no_cleanup:
                 self.log.warning("Not cleaning temporary directory %s"
                                  % tht_tmp)
@@ -368,13 +450,15 @@ class DeployOvercloud(command.Command):
         #               handle updating plans.
         if parsed_args.stack in plans:
             # Upload the new plan templates to swift to replace the existing
-            # templates.
+            # templates. Only the files which changed are transferred.
             plan_management.update_plan_from_templates(
                 self.clients, parsed_args.stack, tht_root,
                 parsed_args.roles_file, generate_passwords,
                 parsed_args.plan_environment_file,
                 parsed_args.networks_file,
-                type(self)._keep_env_on_update)
+                type(self)._keep_env_on_update,
+                sync=True, cache=self.plan_cache,
+                editor=self._plan_environment_editor(parsed_args.stack))
         else:
             plan_management.create_plan_from_templates(
                 self.clients, parsed_args.stack, tht_root,
@@ -390,43 +474,76 @@ class DeployOvercloud(command.Command):
             os.path.abspath(tht_root)))
 
         self.log.debug("Creating Environment files")
-        env = {}
+        env = layered_env.LayeredEnvironment()
         created_env_files = []
 
-        if parsed_args.environment_directories:
+        compiled = None
+        if parsed_args.compiled_environment:
+            # The compiled environment replaces the environment directories
+            compiled = compiled_env.CompiledEnvironment.load(
+                parsed_args.compiled_environment)
+        elif parsed_args.environment_directories:
             created_env_files.extend(utils.load_environment_directories(
                 parsed_args.environment_directories))
         parameters = {}
         if stack:
             try:
                 # If user environment already exist then keep it
-                user_env = yaml.safe_load(self.object_client.get_object(
-                    parsed_args.stack, constants.USER_ENVIRONMENT)[1])
-                template_utils.deep_update(env, user_env)
+                user_env = yaml_serialization.safe_load(
+                    self.plan_cache.get_object(
+                        parsed_args.stack, constants.USER_ENVIRONMENT,
+                        self._plan_etags(parsed_args.stack).get(
+                            constants.USER_ENVIRONMENT))[1])
+                env.add_layer(constants.USER_ENVIRONMENT, user_env)
             except ClientException:
                 pass
         parameters.update(self._update_parameters(parsed_args, stack))
-        template_utils.deep_update(env, self._create_parameters_env(
+        env.add_layer(constants.USER_PARAMETERS, self._create_parameters_env(
             parameters, tht_root, parsed_args.stack))
 
         if parsed_args.rhel_reg:
             reg_env_files, reg_env = self._create_registration_env(
                 parsed_args, tht_root)
             created_env_files.extend(reg_env_files)
-            template_utils.deep_update(env, reg_env)
+            env.add_layer('user-environments/'
+                          'tripleoclient-registration-parameters.yaml',
+                          reg_env)
         if parsed_args.environment_files:
             created_env_files.extend(parsed_args.environment_files)
 
+        compiled_files = {}
+        if compiled is not None:
+            changed = compiled.changed_inputs(tht_root)
+            if changed:
+                self.log.warning(
+                    "Compiled environment %s is out of date, processing its "
+                    "environment files again. Changed: %s"
+                    % (parsed_args.compiled_environment, ', '.join(changed)))
+                created_env_files[:0] = compiled.all_environment_files()
+            else:
+                self.log.info("Using compiled environment %s (%s)"
+                              % (parsed_args.compiled_environment,
+                                 compiled.hash))
+                compiled_files, compiled_layer = compiled.relocate(tht_root)
+                env.add_layer(parsed_args.compiled_environment,
+                              compiled_layer)
+
         self.log.debug("Processing environment files %s" % created_env_files)
-        env_files, localenv = utils.process_multiple_environments(
+        env_files, env = utils.process_multiple_environments(
             created_env_files, tht_root, user_tht_root,
-            cleanup=not parsed_args.no_cleanup)
-        template_utils.deep_update(env, localenv)
+            cleanup=not parsed_args.no_cleanup, environment=env)
+        compiled_files.update(env_files)
+        env_files = compiled_files
 
         if stack:
             bp_cleanup = self._create_breakpoint_cleanup_env(
                 tht_root, parsed_args.stack)
-            template_utils.deep_update(env, bp_cleanup)
+            env.add_layer('user-environments/'
+                          'tripleoclient-breakpoint-cleanup.yaml',
+                          bp_cleanup)
+
+        for name, source in sorted(env.parameter_sources().items()):
+            self.log.debug("Parameter %s is set by %s" % (name, source))
 
         # FIXME(shardy) It'd be better to validate this via mistral
         # e.g part of the plan create/update workflow
@@ -528,7 +645,7 @@ class DeployOvercloud(command.Command):
         self.log.debug("Checking that the disable_upgrade_deployment flag "
                        "is set at least once in the roles file")
         if parsed_args.roles_file:
-            roles_data = yaml.safe_load(open(parsed_args.roles_file).read())
+            roles_data = yaml_cache.load(parsed_args.roles_file)
             disable_upgrade_deployment_set = False
             for r in roles_data:
                 if r.get("disable_upgrade_deployment"):
@@ -563,7 +680,7 @@ class DeployOvercloud(command.Command):
     def _get_default_role_counts(self, parsed_args):
 
         if parsed_args.roles_file:
-            roles_data = yaml.safe_load(open(parsed_args.roles_file).read())
+            roles_data = yaml_cache.load(parsed_args.roles_file)
         else:
             # Assume default role counts
             return {
@@ -662,6 +779,14 @@ class DeployOvercloud(command.Command):
                    ' commands. Can be specified more than once. Files in'
                    ' directories are loaded in ascending sort order.')
         )
+        parser.add_argument(
+            '--compiled-environment', metavar='<COMPILED ENVIRONMENT>',
+            help=_('Environment compiled by "openstack overcloud environment '
+                   'compile". It replaces the environment directories and is '
+                   'used as it is unless the files it was compiled from '
+                   'changed. Environment files passed with -e are applied on '
+                   'top of it.')
+        )
         parser.add_argument(
             '--roles-file', '-r', dest='roles_file',
             help=_('Roles file, overrides the default %s in the --templates '
@@ -681,6 +806,12 @@ class DeployOvercloud(command.Command):
             '--no-cleanup', action='store_true',
             help=_('Don\'t cleanup temporary files, just log their location')
         )
+        parser.add_argument(
+            '--no-plan-cache', action='store_true',
+            help=_('Always read the plan files from Swift instead of using '
+                   'the copies cached locally in %s from previous '
+                   'operations on the plan.') % constants.PLAN_CACHE_DIRECTORY
+        )
         parser.add_argument(
             '--update-plan-only',
             action='store_true',
@@ -0,0 +1,103 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+from __future__ import print_function
+
+import logging
+import os
+import shutil
+import tempfile
+
+from osc_lib import exceptions as oscexc
+from osc_lib.i18n import _
+from swiftclient.exceptions import ClientException
+
+from tripleoclient import command
+from tripleoclient import compiled_env
+from tripleoclient import constants
+from tripleoclient import plan_cache
+from tripleoclient import workspace
+from tripleoclient.workflows import plan_management
+
+
+class CompileEnvironment(command.Command):
+    """Resolve environment files once, for the following deployments"""
+
+    log = logging.getLogger(__name__ + ".CompileEnvironment")
+
+    def get_parser(self, prog_name):
+        parser = super(CompileEnvironment, self).get_parser(prog_name)
+        parser.add_argument(
+            '--templates', nargs='?', const=constants.TRIPLEO_HEAT_TEMPLATES,
+            default=constants.TRIPLEO_HEAT_TEMPLATES,
+            help=_("The directory containing the Heat templates to deploy")
+        )
+        parser.add_argument(
+            '--stack', default='overcloud',
+            help=_("Name of the plan the rendered templates are read from "
+                   "(default: overcloud)")
+        )
+        parser.add_argument(
+            '--environment-file', '-e', metavar='<HEAT ENVIRONMENT FILE>',
+            action='append', dest='environment_files',
+            help=_('Environment files to compile. (Can be specified more '
+                   'than once.)')
+        )
+        parser.add_argument(
+            '--environment-directory', metavar='<HEAT ENVIRONMENT DIRECTORY>',
+            action='append', dest='environment_directories',
+            default=[os.path.expanduser(constants.DEFAULT_ENV_DIRECTORY)],
+            help=_('Environment file directories to compile. Can be '
+                   'specified more than once. Files in directories are '
+                   'loaded in ascending sort order.')
+        )
+        parser.add_argument(
+            '--output-file', '-o', metavar='<output file>',
+            default='compiled-environment.json',
+            help=_('File the compiled environment is written to '
+                   '(default: compiled-environment.json)')
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        self.log.debug("take_action(%s)" % parsed_args)
+
+        object_client = self.app.client_manager.tripleoclient.object_store
+
+        # Like a deployment, work on a copy of the templates completed with
+        # the files rendered in the plan
+        tht_root = os.path.abspath(parsed_args.templates)
+        tht_tmp = tempfile.mkdtemp(prefix='tripleoclient-')
+        new_tht_root = os.path.join(tht_tmp, 'tripleo-heat-templates')
+        try:
+            workspace.build(tht_root, new_tht_root)
+            try:
+                plan_management.download_missing_files(
+                    object_client, parsed_args.stack, new_tht_root,
+                    plan_cache.PlanCache(object_client))
+            except ClientException as e:
+                raise oscexc.CommandError(
+                    "Unable to read the rendered templates of the plan %s, "
+                    "was it created? %s" % (parsed_args.stack, e))
+            compiled = compiled_env.compile_environments(
+                parsed_args.environment_files or [], new_tht_root, tht_root,
+                parsed_args.environment_directories or [])
+        finally:
+            shutil.rmtree(tht_tmp)
+
+        compiled.save(parsed_args.output_file)
+        print("Compiled environment written to %s, %d input files (%s)"
+              % (parsed_args.output_file, len(compiled.inputs),
+                 compiled.hash))
@@ -43,7 +43,6 @@ class RemoteExecute(command.Command):
         config = parsed_args.file_in.read()
         workflow_client = self.app.client_manager.workflow_engine
         tripleoclients = self.app.client_manager.tripleoclient
-        messaging_websocket = tripleoclients.messaging_websocket()
 
         # no special characters here
         config_name = re.sub('[^\w]*', '',
@@ -59,24 +58,23 @@ class RemoteExecute(command.Command):
             'config': config
         }
 
-        workflow_client.executions.create(
-            'tripleo.deployment.v1.deploy_on_servers',
-            workflow_input=workflow_input
-        )
+        with tripleoclients.messaging_websocket() as messaging_websocket:
+            workflow_client.executions.create(
+                'tripleo.deployment.v1.deploy_on_servers',
+                workflow_input=workflow_input
+            )
 
-        while True:
-            body = messaging_websocket.recv()['body']
-            if 'tripleo.deployment.v1.deploy_on_server' == body['type']:
-                payload = body['payload']
-                status = 'SUCCESS'
-                if payload['status_code'] != 0:
-                    status = 'FAILED'
-                print('%s :: -- %s --' % (payload['server_name'], status))
-                if payload['stdout']:
-                    print('stdout\n: %s\n' % payload['stdout'])
-                if payload['stderr']:
-                    print('stderr\n: %s\n' % payload['stderr'])
-            if 'tripleo.deployment.v1.deploy_on_servers' == body['type']:
-                break
-
-        messaging_websocket.cleanup()
+            while True:
+                body = messaging_websocket.recv()['body']
+                if 'tripleo.deployment.v1.deploy_on_server' == body['type']:
+                    payload = body['payload']
+                    status = 'SUCCESS'
+                    if payload['status_code'] != 0:
+                        status = 'FAILED'
+                    print('%s :: -- %s --' % (payload['server_name'], status))
+                    if payload['stdout']:
+                        print('stdout\n: %s\n' % payload['stdout'])
+                    if payload['stderr']:
+                        print('stderr\n: %s\n' % payload['stderr'])
+                if 'tripleo.deployment.v1.deploy_on_servers' == body['type']:
+                    break
@@ -21,9 +21,9 @@ import os
 import ipaddress
 from osc_lib.i18n import _
 import six
-import yaml
 
 from tripleoclient import command
+from tripleoclient import yaml_serialization
 
 
 class ValidateOvercloudNetenv(command.Command):
@@ -44,7 +44,7 @@ class ValidateOvercloudNetenv(command.Command):
         self.log.debug("take_action(%s)" % parsed_args)
 
         with open(parsed_args.netenv, 'r') as net_file:
-            network_data = yaml.safe_load(net_file)
+            network_data = yaml_serialization.safe_load(net_file)
 
         cidrinfo = {}
         poolsinfo = {}
@@ -163,7 +163,7 @@ class ValidateOvercloudNetenv(command.Command):
     def NIC_validate(self, resource, path):
         try:
             with open(path, 'r') as nic_file:
-                nic_data = yaml.safe_load(nic_file)
+                nic_data = yaml_serialization.safe_load(nic_file)
         except IOError:
             self.log.error(
                 'The resource "%s" reference file does not exist: "%s"',
@@ -14,13 +14,13 @@ import argparse
 import logging
 import os
 import simplejson
-import yaml
 
 from osc_lib.i18n import _
 
 from tripleoclient import command
 from tripleoclient import exceptions
 from tripleoclient import utils
+from tripleoclient import yaml_serialization
 from tripleoclient.workflows import base
 from tripleoclient.workflows import parameters
 
@@ -46,7 +46,7 @@ class SetParameters(command.Command):
         if parsed_args.file_in.name.endswith('.json'):
             params = simplejson.load(parsed_args.file_in)
         elif parsed_args.file_in.name.endswith('.yaml'):
-            params = yaml.safe_load(parsed_args.file_in)
+            params = yaml_serialization.safe_load(parsed_args.file_in)
         else:
             raise exceptions.InvalidConfiguration(
                 _("Invalid file extension for %s, must be json or yaml") %
@@ -130,7 +130,8 @@ class GenerateFencingParameters(command.Command):
             self.app.client_manager.workflow_engine,
             'tripleo.parameters.generate_fencing',
             **workflow_input)
-        fencing_parameters = yaml.safe_dump(result, default_flow_style=False)
+        fencing_parameters = yaml_serialization.safe_dump(
+            result, default_flow_style=False)
         if parsed_args.output:
             parsed_args.output.write(fencing_parameters)
         else:
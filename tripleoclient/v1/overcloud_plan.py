@@ -12,9 +12,9 @@
 
 import logging
 import os.path
+import sys
 
 from osc_lib.i18n import _
-from six.moves.urllib import request
 
 from tripleoclient import command
 from tripleoclient import constants
@@ -24,6 +24,15 @@ from tripleoclient.workflows import deployment
 from tripleoclient.workflows import plan_management
 
 
+def _print_progress(done, total):
+    if total:
+        sys.stdout.write('\rDownloaded %d of %d bytes (%d%%)' %
+                         (done, total, done * 100 // total))
+    else:
+        sys.stdout.write('\rDownloaded %d bytes' % done)
+    sys.stdout.flush()
+
+
 class ListPlans(command.Lister):
     """List overcloud deployment plans."""
 
@@ -62,10 +71,8 @@ class DeletePlan(command.Command):
 
         clients = self.app.client_manager
 
-        for plan in parsed_args.plans:
-            print("Deleting plan %s..." % plan)
-            plan_management.delete_deployment_plan(clients,
-                                                   container=plan)
+        # The plans are independent, they are deleted at the same time
+        plan_management.delete_deployment_plans(clients, parsed_args.plans)
 
 
 class CreatePlan(command.Command):
@@ -197,8 +204,14 @@ class ExportPlan(command.Command):
             self.app.client_manager,
             plan=plan
         )
-        f = request.urlopen(tempurl)
-        tarball_contents = f.read()
-
-        with open(outfile, 'w') as f:
-            f.write(tarball_contents)
+        progress = _print_progress if sys.stdout.isatty() else None
+        try:
+            utils.download_file(tempurl, outfile, progress=progress)
+        except exceptions.DownloadError as e:
+            if os.path.exists(outfile):
+                os.remove(outfile)
+            raise exceptions.PlanExportError(
+                "Exporting plan %s failed: %s" % (plan, e))
+        finally:
+            if progress:
+                sys.stdout.write('\n')
@@ -20,6 +20,7 @@ from osc_lib.i18n import _
 import yaml
 
 from tripleoclient import command
+from tripleoclient import yaml_serialization
 from tripleoclient.workflows import baremetal
 
 
@@ -44,10 +45,11 @@ class CreateRAID(command.Command):
 
         if os.path.exists(parsed_args.configuration):
             with open(parsed_args.configuration, 'r') as fp:
-                configuration = yaml.safe_load(fp.read())
+                configuration = yaml_serialization.safe_load(fp.read())
         else:
             try:
-                configuration = yaml.safe_load(parsed_args.configuration)
+                configuration = yaml_serialization.safe_load(
+                    parsed_args.configuration)
             except yaml.YAMLError as exc:
                 raise RuntimeError(
                     _('Configuration is not an existing file and cannot be '
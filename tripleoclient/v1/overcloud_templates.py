@@ -0,0 +1,68 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+from __future__ import print_function
+
+import logging
+
+from osc_lib import exceptions as oscexc
+from osc_lib.i18n import _
+
+from tripleoclient import command
+from tripleoclient import template_graph
+
+
+class ShowTemplateGraph(command.Command):
+    """Show the files referenced by the templates of the last deployment"""
+
+    auth_required = False
+    log = logging.getLogger(__name__ + ".ShowTemplateGraph")
+
+    def get_parser(self, prog_name):
+        parser = super(ShowTemplateGraph, self).get_parser(prog_name)
+        parser.add_argument('--stack', default='overcloud',
+                            help=_("Name of the stack (default: overcloud)"))
+        parser.add_argument('--unreachable', action='store_true',
+                            default=False,
+                            help=_("Also list the files which were left out "
+                                   "because nothing references them"))
+        return parser
+
+    def take_action(self, parsed_args):
+        self.log.debug("take_action(%s)" % parsed_args)
+
+        try:
+            graph = template_graph.load(parsed_args.stack)
+        except (IOError, OSError, ValueError) as e:
+            raise oscexc.CommandError(
+                "No template graph found for stack %s, it is stored when "
+                "the stack is deployed: %s" % (parsed_args.stack, e))
+
+        reachable = graph.reachable()
+        for name in sorted(reachable):
+            print("%s (%d bytes)" % (name, graph.sizes.get(name, 0)))
+            for link in graph.edges.get(name, []):
+                print("    -> %s" % link)
+
+        if parsed_args.unreachable:
+            for name in sorted(graph.unreachable()):
+                print("%s (%d bytes, unreachable)" % (name, graph.sizes[name]))
+
+        summary = graph.summary()
+        print("\n%(files)d files, %(references)d references" % summary)
+        print("Reachable: %(reachable)d files, %(reachable_bytes)d bytes"
+              % summary)
+        print("Unreachable: %(unreachable)d files, "
+              "%(unreachable_bytes)d bytes" % summary)
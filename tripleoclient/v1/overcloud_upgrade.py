@@ -14,7 +14,6 @@
 #
 import logging
 import os
-import yaml
 
 from osc_lib.i18n import _
 
@@ -22,6 +21,7 @@ from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import utils as oooutils
+from tripleoclient import yaml_serialization
 from tripleoclient.v1.overcloud_deploy import DeployOvercloud
 from tripleoclient.workflows import package_update
 
@@ -71,7 +71,7 @@ class UpgradePrepare(DeployOvercloud):
         # Update the container registry:
         if container_registry:
             with open(os.path.abspath(container_registry)) as content:
-                registry = yaml.load(content.read())
+                registry = yaml_serialization.safe_load(content.read())
         else:
             self.log.warning(
                 "You have not provided a container registry file. Note "
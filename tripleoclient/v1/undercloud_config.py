@@ -30,6 +30,7 @@ from oslo_config import cfg
 from tripleo_common.image import kolla_builder
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_serialization
 
 from tripleoclient.v1 import undercloud_preflight
 
@@ -842,7 +843,7 @@ def _get_public_tls_parameters(service_certificate_path):
 
 def _get_public_tls_resource_registry_overwrites(enable_tls_yaml_path):
     with open(enable_tls_yaml_path, 'rb') as enable_tls_file:
-        enable_tls_dict = yaml.load(enable_tls_file.read())
+        enable_tls_dict = yaml_serialization.safe_load(enable_tls_file.read())
         try:
             return enable_tls_dict['resource_registry']
         except KeyError:
@@ -861,9 +862,8 @@ def _write_env_file(env_data,
     env_file = os.path.abspath(env_file)
     with open(env_file, "w") as f:
         try:
-            dumper = yaml.dumper.SafeDumper
-            dumper.ignore_aliases = lambda self, data: True
-            yaml.dump(data, f, default_flow_style=False, Dumper=dumper)
+            yaml_serialization.safe_dump(data, f, aliases=False,
+                                         default_flow_style=False)
         except yaml.YAMLError as exc:
             raise exc
     return env_file
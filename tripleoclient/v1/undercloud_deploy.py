@@ -28,7 +28,6 @@ import sys
 import tempfile
 import time
 import traceback
-import yaml
 
 try:
     from urllib2 import HTTPError
@@ -49,7 +48,11 @@ from six.moves import configparser
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import heat_launcher
+from tripleoclient import template_graph
+from tripleoclient import template_render
 from tripleoclient import utils
+from tripleoclient import workspace
+from tripleoclient import yaml_serialization
 
 from tripleo_common.utils import passwords as password_utils
 
@@ -137,7 +140,7 @@ class DeployUndercloud(command.Command):
 
         if os.path.exists(pw_file):
             with open(pw_file) as pf:
-                stack_env = yaml.safe_load(pf.read())
+                stack_env = yaml_serialization.safe_load(pf.read())
 
         pw = password_utils.generate_passwords(stack_env=stack_env)
         stack_env['parameter_defaults'].update(pw)
@@ -155,7 +158,8 @@ class DeployUndercloud(command.Command):
         # Write out the password file in yaml for heat.
         # This contains sensitive data so ensure it's not world-readable
         with open(pw_file, 'w') as pf:
-            yaml.safe_dump(stack_env, pf, default_flow_style=False)
+            yaml_serialization.safe_dump(stack_env, pf,
+                                         default_flow_style=False)
         # Using chmod here instead of permissions on the open above so we don't
         # have to fight with umask.
         os.chmod(pw_file, 0o600)
@@ -308,9 +312,11 @@ class DeployUndercloud(command.Command):
     def _setup_heat_environments(self, parsed_args):
         """Process tripleo heat templates with jinja
 
-        * Copy --templates content into a temporary working dir
-          created under the --output_dir path as output_dir/tempwd/templates.
-        * Process j2 templates there
+        * Make a working copy of the --templates content in a temporary
+          working dir created under the --output_dir path as
+          output_dir/tempwd/templates. Only the files which may be
+          overwritten by the j2 processing are actually copied.
+        * Process j2 templates there, in process
         * Return the environments list for futher processing.
 
         The first two items are reserved for the
@@ -320,15 +326,19 @@ class DeployUndercloud(command.Command):
         self.tmp_env_dir = tempfile.mkdtemp(prefix='tripleoclient-',
                                             dir=parsed_args.output_dir)
         self.tht_render = os.path.join(self.tmp_env_dir, 'templates')
-        shutil.copytree(parsed_args.templates, self.tht_render, symlinks=True)
+        shared = workspace.build(parsed_args.templates, self.tht_render,
+                                 private=workspace.rendered_templates)
+        self.log.debug("Avoided copying %d bytes of templates" % shared)
 
-        # generate jinja templates by its work dir location
+        # generate jinja templates by its work dir location, reusing the
+        # outputs of the previous deployments whose inputs didn't change
         self.log.debug("Using roles file %s" % parsed_args.roles_file)
-        process_templates = os.path.join(parsed_args.templates,
-                                         'tools/process-templates.py')
-        args = ['python', process_templates, '--roles-data',
-                parsed_args.roles_file, '--output-dir', self.tht_render]
-        subprocess.check_call(args, cwd=self.tht_render)
+        renderer = template_render.Renderer(
+            self.tht_render, roles_file=parsed_args.roles_file,
+            cache=template_render.RenderCache())
+        rendered, reused = renderer.render()
+        self.log.debug("Rendered %d templates, %d unchanged" % (
+            rendered, reused))
 
         print("Deploying templates in the directory {0}".format(
             os.path.abspath(self.tht_render)))
@@ -385,8 +395,9 @@ class DeployUndercloud(command.Command):
                 ip, cidr_prefixlen, c_ip, p_ip))
 
             with open(self.tmp_env_file_name, 'w') as env_file:
-                yaml.safe_dump({'parameter_defaults': tmp_env}, env_file,
-                               default_flow_style=False)
+                yaml_serialization.safe_dump({'parameter_defaults': tmp_env},
+                                             env_file,
+                                             default_flow_style=False)
             environments.append(self.tmp_env_file_name)
 
         return environments
@@ -411,6 +422,8 @@ class DeployUndercloud(command.Command):
         files = dict(list(template_files.items()) + list(env_files.items()))
 
         stack_name = parsed_args.stack
+        graph, files = template_graph.prune_files(template, env, files)
+        template_graph.save(stack_name, graph)
 
         self.log.debug("Deploying stack: %s", stack_name)
         self.log.debug("Deploying template: %s", template)
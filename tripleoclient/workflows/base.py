@@ -9,20 +9,36 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import collections
 import json
 import logging
+import time
 
+from concurrent import futures
+
+from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import tracing
 
 LOG = logging.getLogger(__name__)
 
+WorkflowResult = collections.namedtuple(
+    'WorkflowResult', ['key', 'execution', 'payload', 'error'])
+
 
 def call_action(workflow_client, action, **input_):
     """Trigger a Mistral action and parse the JSON response"""
 
-    result = workflow_client.action_executions.create(
-        action, input_,
-        save_result=True, run_sync=True)
+    span = tracing.get_tracer().start('action', action)
+    try:
+        result = workflow_client.action_executions.create(
+            action, input_,
+            save_result=True, run_sync=True)
+    except Exception:
+        span.finish('ERROR')
+        raise
+    span.execution_id = result.id
+    span.finish(result.state)
 
     # Parse the JSON output. Mistral client should do this for us really.
     output = json.loads(result.output)['result']
@@ -34,10 +50,17 @@ def call_action(workflow_client, action, **input_):
 
 def start_workflow(workflow_client, identifier, workflow_input):
 
-    execution = workflow_client.executions.create(
-        identifier,
-        workflow_input=workflow_input
-    )
+    tracer = tracing.get_tracer()
+    span = tracer.start('workflow', identifier)
+    try:
+        execution = workflow_client.executions.create(
+            identifier,
+            workflow_input=workflow_input
+        )
+    except Exception:
+        span.finish('ERROR')
+        raise
+    tracer.set_execution(span, execution.id)
 
     LOG.debug("Started Mistral Workflow {}. Execution ID: {}".format(
               identifier, execution.id))
@@ -45,6 +68,43 @@ def start_workflow(workflow_client, identifier, workflow_input):
     return execution
 
 
+class _Backoff(object):
+    """An interval doubling up to a maximum"""
+
+    def __init__(self, initial, maximum):
+        self.initial = initial
+        self.maximum = maximum
+        self.current = initial
+
+    def grow(self):
+        self.current = min(self.current * 2, self.maximum)
+
+    def reset(self):
+        self.current = self.initial
+
+
+def _execution_payload(execution):
+    """Build the last message of a finished execution
+
+    The message is made from the state and the output of the execution, for
+    when the websocket is unavailable or the message was lost. The output of
+    a workflow without an output section is its whole context, so the values
+    its last message would have carried (e.g. 'plans') are there.
+    """
+
+    try:
+        output = json.loads(execution.output or '{}')
+    except (TypeError, ValueError):
+        output = {}
+    payload = dict(output) if isinstance(output, dict) else {}
+    payload['execution'] = {'id': execution.id}
+    payload['status'] = 'SUCCESS' if execution.state == 'SUCCESS' \
+        else 'FAILED'
+    if not payload.get('message'):
+        payload['message'] = execution.state_info or ''
+    return payload
+
+
 def wait_for_messages(mistral, websocket, execution, timeout=None):
     """Wait for messages on a websocket.
 
@@ -56,25 +116,170 @@ def wait_for_messages(mistral, websocket, execution, timeout=None):
 
     If a timeout is reached, called check_execution_status which will look up
     the execution on Mistral and log information about it.
+
+    The state of the execution is not looked up on Mistral while its
+    messages come. It is only when no message comes for
+    WEBSOCKET_QUIET_TIMEOUT seconds, or when the websocket is unavailable,
+    and then at increasing intervals. Once it's finished, its last message is
+    still waited for WEBSOCKET_DRAIN_TIMEOUT seconds. If it doesn't come, or
+    when the websocket is unavailable, the last message is made from the
+    state and the output of the execution.
     """
+
+    # A subscriber to a shared websocket only gets the messages about the
+    # executions it watches, or whose root execution it watches, including
+    # the ones which came before it watched them
+    watch = getattr(websocket, 'watch', None)
+    if watch is not None:
+        watch(execution.id)
+    span = tracing.get_tracer().execution(execution.id)
+    started = time.time()
+    deadline = None if timeout is None else started + timeout
+    interval = _Backoff(constants.WEBSOCKET_QUIET_TIMEOUT,
+                        constants.WORKFLOW_POLL_MAX_INTERVAL)
+    # saved counts the "in progress" messages of the execution, which used
+    # to be each followed by a state check
+    received = saved = polls = 0
+    # The execution, once it was found finished on Mistral
+    finished = None
     try:
-        for payload in websocket.wait_for_messages(timeout=timeout):
-            yield payload
-            # If the message is from a sub-workflow, we just need to pass it
-            # on to be displayed. This should never be the last message - so
-            # continue and wait for the next.
-            if payload['execution']['id'] != execution.id:
-                continue
-            # Check the status of the payload, if we are not given one
-            # default to running and assume it is just an "in progress"
-            # message from the workflow.
-            # Workflows should end with SUCCESS or ERROR statuses.
-            if payload.get('status', 'RUNNING') != "RUNNING" or \
-                    mistral.executions.get(execution.id).state != "RUNNING":
-                raise StopIteration
-    except exceptions.WebSocketTimeout:
-        check_execution_status(mistral, execution.id)
-        raise
+        while True:
+            wait = interval.current
+            if deadline is not None:
+                wait = max(min(wait, deadline - time.time()), 0)
+            if websocket is None:
+                time.sleep(wait)
+            else:
+                try:
+                    for payload in websocket.wait_for_messages(timeout=wait):
+                        received += 1
+                        interval.reset()
+                        if timeout is not None:
+                            # Like the websocket's, the timeout applies to
+                            # each message
+                            deadline = time.time() + timeout
+                        yield payload
+                        # If the message is from a sub-workflow, we just
+                        # need to pass it on to be displayed. This should
+                        # never be the last message - so continue and wait
+                        # for the next.
+                        if payload['execution']['id'] != execution.id:
+                            continue
+                        span.message()
+                        # Check the status of the payload, if we are not
+                        # given one default to running and assume it is just
+                        # an "in progress" message from the workflow.
+                        # Workflows should end with SUCCESS or ERROR
+                        # statuses.
+                        status = payload.get('status', 'RUNNING')
+                        if status != "RUNNING":
+                            span.finish(status)
+                            return
+                        saved += 1
+                    return
+                except exceptions.WebSocketTimeout:
+                    pass
+                except exceptions.WebSocketConnectionError:
+                    LOG.warning("The messaging websocket is unavailable, "
+                                "following execution {} on Mistral".format(
+                                    execution.id))
+                    websocket = None
+                    finished = None
+                    interval = _Backoff(constants.WORKFLOW_POLL_INTERVAL,
+                                        constants.WORKFLOW_POLL_MAX_INTERVAL)
+                    continue
+
+            if finished is not None:
+                LOG.debug("Execution {} finished with no message, in state "
+                          "{}".format(execution.id, finished.state))
+                span.finish(finished.state)
+                yield _execution_payload(finished)
+                return
+            if deadline is not None and time.time() >= deadline:
+                span.finish('TIMEOUT')
+                check_execution_status(mistral, execution.id)
+                raise exceptions.WebSocketTimeout()
+
+            polls += 1
+            polled = mistral.executions.get(execution.id)
+            if polled.state not in ('IDLE', 'RUNNING', 'PAUSED'):
+                if websocket is not None:
+                    # Its last message may still be on its way
+                    LOG.debug("Execution {} finished in state {}, waiting "
+                              "for its last message".format(
+                                  execution.id, polled.state))
+                    finished = polled
+                    interval = _Backoff(constants.WEBSOCKET_DRAIN_TIMEOUT,
+                                        constants.WEBSOCKET_DRAIN_TIMEOUT)
+                    continue
+                LOG.debug("Execution {} finished with no message, in state "
+                          "{}".format(execution.id, polled.state))
+                span.finish(polled.state)
+                yield _execution_payload(polled)
+                return
+            interval.grow()
+    finally:
+        span.finish(None)
+        elapsed = time.time() - started
+        LOG.debug("Received {} messages in {:.1f}s ({:.2f}/s) for execution "
+                  "{}, checked its state {} times, {} checks saved".format(
+                      received, elapsed, received / max(elapsed, 0.001),
+                      execution.id, polls, saved))
+
+
+def _is_about(payload, execution_id):
+    """Whether a message is about an execution or its sub-workflows"""
+
+    execution = payload.get('execution') or {}
+    return execution_id in (execution.get('id'),
+                            execution.get('root_execution_id'))
+
+
+def run_workflows(clients, workflows, timeout=None, on_message=None,
+                  on_start=None, workers=constants.WORKFLOW_WORKERS):
+    """Run independent Mistral workflows at the same time
+
+    Each workflow is started, and its messages waited for, in a thread of
+    its own. A failing workflow doesn't stop the other ones.
+
+    :param workflows: (key, workflow name, workflow input) tuples, the key
+                      identifying the workflow in the results
+    :param on_message: called with the key of a workflow and each payload
+                       received about its execution or its sub-workflows
+    :param on_start: called with the key of a workflow before it is started
+    :returns: a WorkflowResult for each workflow, in the same order, with
+              its last payload and the exception raised while running it,
+              if any
+    """
+
+    workflow_client = clients.workflow_engine
+    tripleoclients = clients.tripleoclient
+
+    def run(workflow):
+        key, identifier, workflow_input = workflow
+        execution = payload = None
+        try:
+            with tripleoclients.messaging_websocket() as ws:
+                if on_start is not None:
+                    on_start(key)
+                execution = start_workflow(workflow_client, identifier,
+                                           workflow_input)
+                for message in wait_for_messages(workflow_client, ws,
+                                                 execution, timeout):
+                    if not _is_about(message, execution.id):
+                        continue
+                    payload = message
+                    if on_message is not None:
+                        on_message(key, payload)
+        except Exception as e:
+            LOG.debug("Workflow {} for {} failed: {}".format(
+                identifier, key, e))
+            return WorkflowResult(key, execution, payload, e)
+        return WorkflowResult(key, execution, payload, None)
+
+    workers = max(min(workers, len(workflows)), 1)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, workflows))
 
 
 def check_execution_status(workflow_client, execution_id):
@@ -9,9 +9,9 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
-import yaml
 
 from tripleoclient import exceptions
+from tripleoclient import yaml_serialization
 from tripleoclient.workflows import base
 
 
@@ -52,7 +52,7 @@ def invoke_plan_env_workflows(clients, stack_name, plan_env_file):
 
     try:
         with open(plan_env_file) as pf:
-            plan_env_data = yaml.safe_load(pf.read())
+            plan_env_data = yaml_serialization.safe_load(pf.read())
     except IOError as exc:
         raise exceptions.PlanEnvWorkflowError('File (%s) is not found: '
                                               '%s' % (plan_env_file, exc))
@@ -83,7 +83,8 @@ def invoke_plan_env_workflows(clients, stack_name, plan_env_file):
                 # Prints the workflow result
                 if result:
                     print('Workflow execution is completed. result:')
-                    print(yaml.safe_dump(result, default_flow_style=False))
+                    print(yaml_serialization.safe_dump(
+                        result, default_flow_style=False))
             else:
                 message = payload.get('message', '')
                 msg = ('Workflow execution is failed: %s' % (message))
@@ -9,17 +9,24 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import hashlib
 import logging
 import os
+import shutil
 import tempfile
-import yaml
 
+import six
 from swiftclient import exceptions as swift_exc
+from tripleo_common import constants as common_constants
 from tripleo_common.utils import swift as swiftutils
-from tripleo_common.utils import tarball
 
 from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import plan_cache
+from tripleoclient import plan_environment
+from tripleoclient import swift_transfer
+from tripleoclient import tarball
+from tripleoclient import yaml_serialization
 from tripleoclient.workflows import base
 
 LOG = logging.getLogger(__name__)
@@ -29,33 +36,56 @@ LOG = logging.getLogger(__name__)
 # used in Instack.
 _WORKFLOW_TIMEOUT = 360  # 6 * 60 seconds
 
+# Directories and file suffixes which are never part of a plan, these match
+# the exclusions used by tripleoclient.tarball.
+_EXCLUDED_DIRS = ('.git', '.tox')
+_EXCLUDED_SUFFIXES = ('.pyc', '.pyo')
 
-def _upload_templates(swift_client, container_name, tht_root, roles_file=None,
-                      plan_env_file=None, networks_file=None):
-    """tarball up a given directory and upload it to Swift to be extracted"""
-
-    with tempfile.NamedTemporaryFile() as tmp_tarball:
-        tarball.create_tarball(tht_root, tmp_tarball.name)
-        tarball.tarball_extract_to_swift_container(
-            swift_client, tmp_tarball.name, container_name)
-
-    # Optional override of the roles_data.yaml file
-    if roles_file:
-        _upload_file(swift_client, container_name,
-                     constants.OVERCLOUD_ROLES_FILE, roles_file)
 
-    # Optional override of the network_data.yaml file
-    if networks_file:
-        _upload_file(swift_client, container_name,
-                     constants.OVERCLOUD_NETWORKS_FILE, networks_file)
-
-    # Optional override of the plan-environment.yaml file
-    if plan_env_file:
-        # TODO(jpalanis): Instead of overriding default file,
-        # merging the user override plan-environment with default
-        # plan-environment file will avoid explict merging issues.
-        _upload_file(swift_client, container_name,
-                     constants.PLAN_ENVIRONMENT, plan_env_file)
+def _upload_templates(swift_client, container_name, tht_root, roles_file=None,
+                      plan_env_file=None, networks_file=None, sync=False,
+                      preserved_files=()):
+    """Upload a given directory to Swift
+
+    By default the directory is tarballed up and streamed to Swift to be
+    extracted. When sync is True only the objects which differ from the
+    local tree are uploaded or deleted, see _sync_templates. Any names in
+    preserved_files will be uploaded separately by the caller and are left
+    untouched by the sync.
+    """
+
+    if sync:
+        overrides = set(preserved_files)
+        for remote_name, local_name in (
+                (constants.OVERCLOUD_ROLES_FILE, roles_file),
+                (constants.OVERCLOUD_NETWORKS_FILE, networks_file),
+                (constants.PLAN_ENVIRONMENT, plan_env_file)):
+            if local_name:
+                overrides.add(remote_name)
+        _sync_templates(swift_client, container_name, tht_root, overrides)
+    else:
+        with tarball.create_tarball_stream(tht_root) as stream:
+            tarball.tarball_extract_to_swift_container(
+                swift_client, stream, container_name)
+
+    with swift_transfer.UploadExecutor(swift_client) as uploader:
+        # Optional override of the roles_data.yaml file
+        if roles_file:
+            _upload_file(uploader, container_name,
+                         constants.OVERCLOUD_ROLES_FILE, roles_file)
+
+        # Optional override of the network_data.yaml file
+        if networks_file:
+            _upload_file(uploader, container_name,
+                         constants.OVERCLOUD_NETWORKS_FILE, networks_file)
+
+        # Optional override of the plan-environment.yaml file
+        if plan_env_file:
+            # TODO(jpalanis): Instead of overriding default file,
+            # merging the user override plan-environment with default
+            # plan-environment file will avoid explict merging issues.
+            _upload_file(uploader, container_name,
+                         constants.PLAN_ENVIRONMENT, plan_env_file)
 
 
 def _create_update_deployment_plan(clients, workflow, **workflow_input):
@@ -107,6 +137,39 @@ def delete_deployment_plan(clients, **workflow_input):
                     'Exception deleting plan: {}'.format(payload['message']))
 
 
+def delete_deployment_plans(clients, containers):
+    """Delete deployment plans at the same time
+
+    The deletion of every plan is attempted before the errors, if any, are
+    raised.
+    """
+
+    def print_start(container):
+        print("Deleting plan {}...".format(container))
+
+    def print_message(container, payload):
+        if 'message' in payload:
+            print("{}: {}".format(container, payload['message']))
+
+    results = base.run_workflows(
+        clients,
+        [(container, 'tripleo.plan_management.v1.delete_deployment_plan',
+          {'container': container}) for container in containers],
+        timeout=_WORKFLOW_TIMEOUT, on_message=print_message,
+        on_start=print_start)
+
+    errors = []
+    for result in results:
+        if result.error is not None:
+            errors.append("{}: {}".format(result.key, result.error))
+        elif result.payload and result.payload['status'] != 'SUCCESS':
+            errors.append("{}: {}".format(result.key,
+                                          result.payload['message']))
+    if errors:
+        raise exceptions.WorkflowServiceError(
+            'Exception deleting plans: {}'.format('; '.join(errors)))
+
+
 def update_deployment_plan(clients, **workflow_input):
     payload = _create_update_deployment_plan(
         clients, 'tripleo.plan_management.v1.update_deployment_plan',
@@ -170,134 +233,273 @@ def create_plan_from_templates(clients, name, tht_root, roles_file=None,
 
 def update_plan_from_templates(clients, name, tht_root, roles_file=None,
                                generate_passwords=True, plan_env_file=None,
-                               networks_file=None, keep_env=False):
+                               networks_file=None, keep_env=False,
+                               sync=False, cache=None, editor=None):
+    """Replace the files of a plan with the ones of tht_root
+
+    The passwords of the plan are kept, they are written back before the
+    plan update workflow runs. When an editor of the plan environment is
+    given, they are written through it, along with its pending edits.
+    """
+
     swift_client = clients.tripleoclient.object_store
+    if cache is None:
+        cache = plan_cache.PlanCache(swift_client)
     passwords = None
-    keep_file_contents = {}
-
-    if keep_env:
-        # Dict items are (remote_name, local_name). local_name may be
-        # None in which case we only try to load from Swift (remote).
-        keep_map = {
-            constants.PLAN_ENVIRONMENT: plan_env_file,
-            constants.USER_ENVIRONMENT: None,
-            constants.OVERCLOUD_ROLES_FILE: roles_file,
-            constants.OVERCLOUD_NETWORKS_FILE: networks_file,
-        }
-        # Also try to fetch any files under 'user-files/'
-        # dir. local_name is always None for these
-        keep_map.update(dict(map(
-            lambda path: (path, None),
-            _list_user_files(swift_client, name))))
-        keep_file_contents = _load_content_or_file(
-            swift_client, name, keep_map)
-    elif not plan_env_file:
-        passwords = _load_passwords(swift_client, name)
-
-    # TODO(dmatthews): Removing the existing plan files should probably be
-    #                  a Mistral action.
-    print("Removing the current plan files")
-    swiftutils.empty_container(swift_client, name)
-
-    # Until we have a well defined plan update workflow in
-    # tripleo-common we need to manually reset the environments and
-    # parameter_defaults here. This is to ensure that no environments
-    # are in the plan environment but not actually in swift.
-    # See bug: https://bugs.launchpad.net/tripleo/+bug/1623431
-    #
-    # Currently this is being done incidentally because we overwrite
-    # the existing plan-environment.yaml with the skeleton one in THT
-    # when updating the templates. Once LP#1623431 is resolved we may
-    # need to special-case plan-environment.yaml to avoid this.
-
-    print("Uploading new plan files")
-    if keep_env:
-        _upload_templates(swift_client, name, tht_root)
-        for filename in keep_file_contents:
-            _upload_file_content(swift_client, name, filename,
-                                 keep_file_contents[filename])
-    else:
-        _upload_templates(swift_client, name, tht_root, roles_file,
-                          plan_env_file, networks_file)
-        _update_passwords(swift_client, name, passwords)
+    keep_files = {}
+    # The preserved files are saved there while the plan is replaced
+    spool_dir = tempfile.mkdtemp(prefix='tripleo-plan-') if keep_env else None
+
+    try:
+        if keep_env:
+            # Dict items are (remote_name, local_name). local_name may be
+            # None in which case we only try to load from Swift (remote).
+            keep_map = {
+                constants.PLAN_ENVIRONMENT: plan_env_file,
+                constants.USER_ENVIRONMENT: None,
+                constants.OVERCLOUD_ROLES_FILE: roles_file,
+                constants.OVERCLOUD_NETWORKS_FILE: networks_file,
+            }
+            keep_files = _save_preserved_files(
+                swift_client, name, keep_map, spool_dir, cache, sync)
+        elif not plan_env_file:
+            passwords = _load_passwords(cache, name)
+
+        # TODO(dmatthews): Removing the existing plan files should probably
+        #                  be a Mistral action.
+        if not sync:
+            print("Removing the current plan files")
+            swiftutils.empty_container(swift_client, name)
+
+        # Until we have a well defined plan update workflow in
+        # tripleo-common we need to manually reset the environments and
+        # parameter_defaults here. This is to ensure that no environments
+        # are in the plan environment but not actually in swift.
+        # See bug: https://bugs.launchpad.net/tripleo/+bug/1623431
+        #
+        # Currently this is being done incidentally because we overwrite
+        # the existing plan-environment.yaml with the skeleton one in THT
+        # when updating the templates. Once LP#1623431 is resolved we may
+        # need to special-case plan-environment.yaml to avoid this.
+
+        print("Uploading new plan files")
+        if keep_env:
+            _upload_templates(swift_client, name, tht_root, sync=sync,
+                              preserved_files=keep_files)
+            with swift_transfer.UploadExecutor(swift_client) as uploader:
+                for filename in sorted(keep_files):
+                    if keep_files[filename] is None:
+                        # Left in place by the sync
+                        continue
+                    LOG.debug("Uploading {0} to plan".format(filename))
+                    _upload_file(uploader, name, filename,
+                                 keep_files[filename], 'rb')
+        else:
+            _upload_templates(swift_client, name, tht_root, roles_file,
+                              plan_env_file, networks_file, sync=sync)
+            _update_passwords(swift_client, name, passwords, editor)
+    finally:
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
 
     update_deployment_plan(clients, container=name,
                            generate_passwords=generate_passwords,
                            source_url=None)
 
 
-def _load_content_or_file(swift_client, container, remote_and_local_map):
-    # mapping (remote_name, content)
-    file_contents = {}
-
-    plan_files = _list_plan_files(swift_client, container)
-
-    for remote_name in remote_and_local_map:
-        LOG.debug("Attempting to load {0}".format(remote_name))
-        local_name = remote_and_local_map[remote_name]
-        # it's possible that the file doesn't exist in Swift and isn't
-        # passed on filesystem, in which case we won't do anything
-        content = None
-        # local override takes priority
-        if local_name:
-            LOG.debug("Using provided file {0}".format(local_name))
-            with open(os.path.abspath(local_name)) as local_content:
-                content = local_content.read()
-        elif remote_name in plan_files:
-            LOG.debug("Preserving plan file {0}".format(remote_name))
-            content = swift_client.get_object(container, remote_name)[1]
-
-        if content:
-            file_contents[remote_name] = content
-
-    return file_contents
-
-
-def _list_user_files(swift_client, container):
-    return list(filter(lambda path: path.startswith('user-files/'),
-                       _list_plan_files(swift_client, container)))
-
-
-def _list_plan_files(swift_client, container):
-    return list(map(lambda i: i['name'],
-                    swift_client.get_container(
-                        container, full_listing=True)[1]))
-
-
-def _upload_file(swift_client, container, filename, local_filename):
-    with open(local_filename) as file_content:
-        swift_client.put_object(container, filename, file_content)
-
-
-# short function, just alias for interface parity with _upload_plan_file
-def _upload_file_content(swift_client, container, filename, content):
-    LOG.debug("Uploading {0} to plan".format(filename))
-    swift_client.put_object(container, filename, content)
-
-
-def _load_passwords(swift_client, name):
-    plan_env = yaml.safe_load(swift_client.get_object(
+def _save_preserved_files(swift_client, container, remote_and_local_map,
+                          spool_dir, cache, sync=False):
+    """Save the files of a plan which are kept across an update
+
+    Any file under 'user-files/' is preserved as well as the ones in
+    remote_and_local_map. The files are downloaded concurrently into
+    spool_dir and uploaded again from there, so they are never all held in
+    memory at once. When syncing, the container isn't emptied and the
+    files without a local override are left in place instead.
+
+    :returns: a mapping of remote name to the path of the local file, None
+              for the files left in place
+    """
+
+    # mapping (remote_name, local path)
+    local_files = {}
+
+    # mapping (remote_name, listing entry) of the files in the plan
+    plan_files = dict((o['name'], o) for o in
+                      swift_client.get_container(container,
+                                                 full_listing=True)[1])
+    # Files left in place
+    kept = []
+    # Also try to fetch any files under 'user-files/'
+    # dir. local_name is always None for these
+    remote_and_local_map = dict(remote_and_local_map)
+    for remote_name in plan_files:
+        if remote_name.startswith('user-files/'):
+            remote_and_local_map.setdefault(remote_name, None)
+
+    downloads = {}
+    with swift_transfer.DownloadExecutor(swift_client) as downloader:
+        for remote_name in sorted(remote_and_local_map):
+            LOG.debug("Attempting to load {0}".format(remote_name))
+            local_name = remote_and_local_map[remote_name]
+            # it's possible that the file doesn't exist in Swift and isn't
+            # passed on filesystem, in which case we won't do anything
+            # local override takes priority
+            if local_name:
+                LOG.debug("Using provided file {0}".format(local_name))
+                local_files[remote_name] = os.path.abspath(local_name)
+            elif remote_name in plan_files:
+                LOG.debug("Preserving plan file {0}".format(remote_name))
+                if sync:
+                    if plan_files[remote_name].get('bytes') != 0:
+                        kept.append(remote_name)
+                    continue
+                path = os.path.join(spool_dir, str(len(downloads)))
+                downloads[remote_name] = path
+                downloader.save_object(container, remote_name, path,
+                                       plan_files[remote_name].get('hash'),
+                                       cache)
+    local_files.update(downloads)
+
+    # Empty files are not preserved
+    preserved = dict((remote_name, path) for remote_name, path
+                     in local_files.items() if os.path.getsize(path))
+    preserved.update((remote_name, None) for remote_name in kept)
+    return preserved
+
+
+def download_missing_files(swift_client, container, tht_dir, cache,
+                           etags=None):
+    """Download the files of a plan missing from tht_dir
+
+    These are e.g. the j2 rendered templates. The files found in the plan
+    cache are used as they are, the others are fetched concurrently and
+    added to the cache. etags is the listing of the plan returned by
+    cache.etags(), if the caller already has it.
+    """
+
+    if etags is None or not cache.enabled:
+        plan_list = swift_client.get_container(container)
+        etags = dict((f['name'], f.get('hash')) for f in plan_list[1])
+    missing = [name for name in sorted(etags)
+               if not os.path.isfile(os.path.join(tht_dir, name))]
+
+    with swift_transfer.DownloadExecutor(swift_client) as dl:
+        downloads = []
+        for pf in missing:
+            contents = cache.lookup(container, etags[pf])
+            if contents is None:
+                downloads.append((pf, None, dl.get_object(container, pf)))
+            else:
+                downloads.append((pf, contents, None))
+
+        for pf, contents, future in downloads:
+            file_path = os.path.join(tht_dir, pf)
+            if future is None:
+                LOG.debug("Missing in templates directory, using cached "
+                          "copy of %s" % pf)
+            else:
+                LOG.debug("Missing in templates directory, downloading %s "
+                          "from swift into %s" % (pf, file_path))
+                headers, contents = future.result()
+                cache.store(container, headers.get('etag'), contents)
+            if not os.path.exists(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            mode = 'wb' if isinstance(contents, six.binary_type) else 'w'
+            with open(file_path, mode) as f:
+                f.write(contents)
+
+
+def _build_local_manifest(tht_root):
+    """Build a mapping of object name to MD5 checksum for tht_root
+
+    The object names are the paths relative to tht_root, the same names the
+    files get when the tree is extracted into a plan container. Symlinks are
+    skipped as they are not extracted into Swift either.
+    """
+
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(tht_root):
+        dirnames[:] = [d for d in dirnames if d not in _EXCLUDED_DIRS]
+        for filename in filenames:
+            if filename.endswith(_EXCLUDED_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            checksum = hashlib.md5()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    checksum.update(chunk)
+            manifest[os.path.relpath(path, tht_root)] = checksum.hexdigest()
+    return manifest
+
+
+def _sync_templates(swift_client, container, tht_root, preserved_files=()):
+    """Synchronize the plan container with the files in tht_root
+
+    The local files are compared with the ETags from the container listing,
+    which for plan objects are the MD5 checksum of their contents. Only new
+    and changed files are uploaded and only objects which no longer exist
+    locally are deleted. Objects named in preserved_files are neither
+    uploaded nor deleted.
+    """
+
+    headers, objects = swift_client.get_container(container,
+                                                  full_listing=True)
+    if headers.get(common_constants.TRIPLEO_META_USAGE_KEY) != 'plan':
+        raise ValueError("The {name} container does not contain a TripleO "
+                         "deployment plan.".format(name=container))
+
+    remote = dict((o['name'], o['hash']) for o in objects)
+    local = _build_local_manifest(tht_root)
+
+    removed = [n for n in sorted(remote)
+               if n not in local and n not in preserved_files]
+    changed = [n for n in sorted(local)
+               if n not in preserved_files and remote.get(n) != local[n]]
+
+    LOG.debug("Plan %s: %d objects unchanged, %d to upload, %d to delete",
+              container, len(local) - len(changed), len(changed),
+              len(removed))
+
+    for remote_name in removed:
+        swift_client.delete_object(container, remote_name)
+
+    with swift_transfer.UploadExecutor(swift_client) as uploader:
+        for remote_name in changed:
+            uploader.put_file(container, remote_name,
+                              os.path.join(tht_root, remote_name), 'rb')
+
+    return changed, removed
+
+
+def _upload_file(uploader, container, filename, local_filename, mode=None):
+    uploader.put_file(container, filename, local_filename, mode)
+
+
+def _load_passwords(cache, name):
+    plan_env = yaml_serialization.safe_load(cache.get_object(
         name, constants.PLAN_ENVIRONMENT)[1])
     return plan_env['passwords']
 
 
-def _update_passwords(swift_client, name, passwords):
+def _update_passwords(swift_client, name, passwords, editor=None):
     # Update the plan environment with the generated passwords. This
     # will be solved more elegantly once passwords are saved in a
     # separate environment (https://review.openstack.org/#/c/467909/)
-    if passwords:
-        try:
-            env = yaml.safe_load(swift_client.get_object(
-                name, constants.PLAN_ENVIRONMENT)[1])
-            env['passwords'] = passwords
-            swift_client.put_object(name,
-                                    constants.PLAN_ENVIRONMENT,
-                                    yaml.safe_dump(env,
-                                                   default_flow_style=False))
-        except swift_exc.ClientException:
-            # The plan likely has not been migrated to using Swift yet.
-            LOG.debug("Could not find plan environment %s in %s",
-                      constants.PLAN_ENVIRONMENT, name)
+    if not passwords:
+        return
+    if editor is None:
+        editor = plan_environment.PlanEnvironmentEditor(swift_client, name)
+    editor.set_passwords(passwords)
+    try:
+        # Along with the edits the editor may already have pending
+        editor.flush()
+    except swift_exc.ClientException:
+        # The plan likely has not been migrated to using Swift yet.
+        LOG.debug("Could not find plan environment %s in %s",
+                  constants.PLAN_ENVIRONMENT, name)
 
 
 def export_deployment_plan(clients, **workflow_input):
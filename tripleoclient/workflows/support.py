@@ -37,8 +37,8 @@ def download_files(clients, container_name, destination):
     :param container: name of the container to put the logs
     :param destination: folder to download files to
      """
-    oc = clients.object_store
-    object_list = oc.object_list(container=container_name, all_data=True)
+    oc = clients.tripleoclient.object_store
+    object_list = oc.get_container(container_name, full_listing=True)[1]
 
     # handle relative destination path
     if not os.path.dirname(destination):
@@ -54,9 +54,11 @@ def download_files(clients, container_name, destination):
     for data in object_list:
         print('Downloading file: {}'.format(data['name']))
         file_path = os.path.join(os.sep, destination, data['name'])
-        oc.object_save(container=container_name,
-                       object=data['name'],
-                       file=file_path)
+        headers, body = oc.get_object(container_name, data['name'],
+                                      resp_chunk_size=65536)
+        with open(file_path, 'wb') as f:
+            for chunk in body:
+                f.write(chunk)
 
 
 def fetch_logs(clients, container, server_name, timeout=None,
@@ -89,17 +91,17 @@ def fetch_logs(clients, container, server_name, timeout=None,
         workflow_input=workflow_input
     )
 
-    websocket = tripleoclients.messaging_websocket()
-    messages = base.wait_for_messages(workflow_client,
-                                      websocket,
-                                      execution,
-                                      timeout)
+    with tripleoclients.messaging_websocket() as websocket:
+        messages = base.wait_for_messages(workflow_client,
+                                          websocket,
+                                          execution,
+                                          timeout)
 
-    for message in messages:
-        if message['status'] != 'SUCCESS':
-            raise LogFetchError(message['message'])
-        if message['message']:
-            print('{}'.format(message['message']))
+        for message in messages:
+            if message['status'] != 'SUCCESS':
+                raise LogFetchError(message['message'])
+            if message['message']:
+                print('{}'.format(message['message']))
 
 
 def delete_container(clients, container, timeout=None, concurrency=None):
@@ -128,14 +130,14 @@ def delete_container(clients, container, timeout=None, concurrency=None):
         workflow_input=workflow_input
     )
 
-    websocket = tripleoclients.messaging_websocket()
-    messages = base.wait_for_messages(workflow_client,
-                                      websocket,
-                                      execution,
-                                      timeout)
-
-    for message in messages:
-        if message['status'] != 'SUCCESS':
-            raise ContainerDeleteFailed(message['message'])
-        if message['message']:
-            print('{}'.format(message['message']))
+    with tripleoclients.messaging_websocket() as websocket:
+        messages = base.wait_for_messages(workflow_client,
+                                          websocket,
+                                          execution,
+                                          timeout)
+
+        for message in messages:
+            if message['status'] != 'SUCCESS':
+                raise ContainerDeleteFailed(message['message'])
+            if message['message']:
+                print('{}'.format(message['message']))
@@ -0,0 +1,140 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Working copies of template trees which share the unchanged files"""
+
+import errno
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger(__name__)
+
+# ioctl cloning the extents of a file into another one (linux/fs.h)
+_FICLONE = 0x40049409
+
+# Errors meaning a file can't be cloned or linked on this filesystem at all,
+# the next method is used for the rest of the tree.
+_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY,
+                errno.EOPNOTSUPP, errno.ENOSYS, errno.EMLINK)
+
+
+def _reflink(src, dst):
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            except (IOError, OSError):
+                d.close()
+                os.remove(dst)
+                raise
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def rendered_templates(filenames):
+    """Return the files of a directory which j2 rendering may overwrite
+
+    The j2 templates are rendered next to themselves, so any file in a
+    directory which contains j2 templates may be written to.
+    """
+
+    if any(f.endswith('.j2.yaml') for f in filenames):
+        return filenames
+    return ()
+
+
+def build(src, dst, private=None):
+    """Create dst as a working copy of the src tree
+
+    Rather than copying every file, the files are cloned (reflinks) when the
+    filesystem supports it, or hard linked to the ones in src otherwise.
+    Only when neither is possible are they copied. Symlinks are recreated
+    as they are, like shutil.copytree(src, dst, symlinks=True) does.
+
+    As a hard linked file shares its contents with the file in src, it must
+    not be modified in place: materialize() it first. private is an optional
+    callable, given the names of the files of a directory it returns those
+    which are copied up front because something else writes to them.
+
+    :returns: the number of bytes which were not copied
+    """
+
+    methods = [_hardlink]
+    if fcntl is not None:
+        methods.insert(0, _reflink)
+    shared = 0
+
+    for dirpath, dirnames, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target)
+        copied = set(private(filenames)) if private else set()
+
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(target, name))
+        # os.walk doesn't descend into symlinked directories
+        dirnames[:] = [d for d in dirnames
+                       if not os.path.islink(os.path.join(dirpath, d))]
+
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                continue
+            if name not in copied:
+                while methods:
+                    try:
+                        methods[0](path, os.path.join(target, name))
+                    except (IOError, OSError) as e:
+                        if e.errno not in _UNSUPPORTED:
+                            raise
+                        LOG.debug("Unable to use %s in %s: %s",
+                                  methods[0].__name__, dst, e)
+                        methods.pop(0)
+                        continue
+                    shared += os.path.getsize(path)
+                    break
+                else:
+                    copied.add(name)
+            if name in copied:
+                shutil.copy2(path, os.path.join(target, name))
+
+    return shared
+
+
+def materialize(path):
+    """Give a file in a working copy its own contents
+
+    A hard linked file is replaced with a copy of itself, so writing to it
+    doesn't modify the original file any more. Other files are left as
+    they are.
+    """
+
+    try:
+        if os.lstat(path).st_nlink <= 1:
+            return
+    except OSError:
+        return
+    tmp = '%s.tmp-%d' % (path, os.getpid())
+    shutil.copy2(path, tmp)
+    os.rename(tmp, path)
@@ -0,0 +1,142 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Cache of parsed YAML files, keyed by path, modification time and size"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from six.moves import cPickle as pickle
+
+from tripleoclient import yaml_serialization
+
+LOG = logging.getLogger(__name__)
+
+# Directory where the parsed files are also stored, so that later commands
+# don't parse them again. Unset by default: only the current process caches.
+CACHE_DIRECTORY_VARIABLE = 'TRIPLEO_YAML_CACHE_DIRECTORY'
+
+
+def _key(path):
+    st = os.stat(path)
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return os.path.realpath(path), mtime, st.st_size
+
+
+class ParseCache(object):
+    """Parsed YAML files, reused as long as the files don't change
+
+    The parsed contents are kept pickled, every load returns a new copy
+    which the caller is free to modify. When a directory is given the
+    pickles are also stored there, one per file, and shared with the
+    following commands.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, realpath):
+        name = hashlib.sha1(realpath.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name)
+
+    def _read_entry(self, key):
+        try:
+            with open(self._entry(key[0]), 'rb') as f:
+                stored_key, data = pickle.load(f)
+        except Exception:
+            return None
+        return data if stored_key == key else None
+
+    def _write_entry(self, key, data):
+        entry = self._entry(key[0])
+        tmp = '%s.tmp-%d' % (entry, os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0o700)
+            with open(tmp, 'wb') as f:
+                pickle.dump((key, data), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, entry)
+        except (IOError, OSError) as e:
+            LOG.debug("Unable to store the parsed %s: %s", key[0], e)
+
+    def _lookup(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+        if data is None and self.path:
+            data = self._read_entry(key)
+        return data
+
+    def load(self, filename):
+        """Return the parsed contents of a YAML file
+
+        Files which can't be looked at (e.g. missing ones) are opened and
+        parsed as usual, so the usual errors are raised.
+        """
+
+        try:
+            key = _key(filename)
+        except OSError:
+            with open(filename) as f:
+                return yaml_serialization.safe_load(f.read())
+
+        data = self._lookup(key)
+        if data is not None:
+            with self._lock:
+                self._entries[key] = data
+                self.hits += 1
+            LOG.debug("Using parsed %s from cache (%s)", filename,
+                      self.summary())
+            return pickle.loads(data)
+
+        with open(filename) as f:
+            contents = yaml_serialization.safe_load(f.read())
+        data = pickle.dumps(contents, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = data
+            self.misses += 1
+        if self.path:
+            self._write_entry(key, data)
+        LOG.debug("Parsed %s (%s)", filename, self.summary())
+        return contents
+
+    def summary(self):
+        return 'YAML cache: %d hits, %d misses' % (self.hits, self.misses)
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the parse cache shared by the whole process"""
+
+    global _cache
+    if _cache is None:
+        path = os.environ.get(CACHE_DIRECTORY_VARIABLE)
+        _cache = ParseCache(os.path.expanduser(path) if path else None)
+    return _cache
+
+
+def load(filename):
+    """Return the parsed contents of a YAML file, from the shared cache"""
+
+    return get_cache().load(filename)
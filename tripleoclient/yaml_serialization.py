@@ -0,0 +1,72 @@
+#   Copyright 2018 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""YAML loading and dumping, with libyaml when it is available
+
+The pure Python loader and dumper of PyYAML are much slower than the ones
+built on libyaml, which matters with the size of the heat templates. All
+of tripleoclient loads and dumps YAML through this module, which falls
+back to the pure Python implementation when PyYAML was built without
+libyaml.
+"""
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeDumper
+    from yaml import SafeLoader
+    LIBYAML = False
+
+
+class _NoAliasMixin(object):
+    """Write objects out again instead of using YAML aliases"""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+_no_alias_dumpers = {}
+
+
+def _no_alias_dumper(dumper):
+    """Return the dumper, writing objects out again instead of aliases"""
+
+    if dumper not in _no_alias_dumpers:
+        _no_alias_dumpers[dumper] = type(
+            'NoAlias' + dumper.__name__, (_NoAliasMixin, dumper), {})
+    return _no_alias_dumpers[dumper]
+
+
+def safe_load(stream, loader=SafeLoader):
+    """Like yaml.safe_load, with libyaml when it is available"""
+
+    return yaml.load(stream, Loader=loader)
+
+
+def safe_dump(data, stream=None, aliases=True, dumper=SafeDumper,
+              **kwargs):
+    """Like yaml.safe_dump, with libyaml when it is available
+
+    With aliases=False, objects which appear more than once are written out
+    every time instead of as YAML anchors and aliases, by the dumper given.
+    """
+
+    if not aliases:
+        dumper = _no_alias_dumper(dumper)
+    return yaml.dump(data, stream, Dumper=dumper, **kwargs)